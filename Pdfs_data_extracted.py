@@ -1,242 +1,500 @@
-import gspread
 import json
-from google.oauth2 import service_account
+import os
+import sys
 import pandas as pd
-import time
-from google.cloud import storage
-from google.api_core.exceptions import GoogleAPIError
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Part
-from data_cleaner import clean_data  # Import the cleaning function
-
-# === USER INPUTS === #
-project_id = input("Enter your Google Cloud project ID: ").strip()
-bucket_name = input("Enter your Google Cloud bucket name: ").strip()
-sheet_name = input("Enter your Google Sheet name: ").strip()
-service_account_file = input("Enter the path to your service account file (e.g., sa.json): ").strip()
-pdf_folder = input("Enter the folder path inside the bucket (e.g., batch1_MM/): ").strip()
-
-# === CREDENTIALS === #
-gcp_credentials = service_account.Credentials.from_service_account_file(service_account_file)
-scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-gsheets_creds = service_account.Credentials.from_service_account_file(service_account_file, scopes=scope)
-
-# === INIT SERVICES === #
-vertexai.init(project=project_id, location="us-central1", credentials=gcp_credentials)
-storage_client = storage.Client(credentials=gcp_credentials)
-gsheets_client = gspread.authorize(gsheets_creds)
-sheet = gsheets_client.open(sheet_name).sheet1
+from contextlib import ExitStack, nullcontext
+from functools import partial
+from backends import StorageError
+from data_cleaner import EXPENSE_ID_COLUMNS, SHEET_HEADERS, TEXT_COLUMNS, clean_records, melt_expenses  # Import the cleaning functions
+from extraction_cache import DEFAULT_CACHE_PATH, ExtractionCache, blob_uri
+from ingestion_manifest import DEFAULT_MANIFEST_PATH, IngestionManifest
+from extraction_engine import TokenBucket, stream_in_order
+from batch_extraction import batched, extract_batch
+from text_extractor import LOCAL_MODEL_NAME, extract_local
+from pdf_slicer import DEFAULT_DERIVED_CACHE_PATH
+from reconciliation import QUARANTINE_COLUMNS, reconcile_frames
+from statement_schema import prompt_field_list, prompt_label_list, response_schema
+from sheet_index import DEFAULT_SHEET_INDEX_PATH, SheetKeyIndex
+from sheet_writer import BufferedSheetWriter
+from run_report import DEFAULT_REPORT_DIR, RunMetrics, StageProfiler, timed_iter
+
+MODEL_NAME = "gemini-2.0-flash-001"
+
+# === GET or CREATE QUARANTINE SHEET (rows whose totals don't reconcile) === #
+def get_or_create_quarantine_sheet(spreadsheet):
+    return spreadsheet.worksheet_or_create("Quarantine", QUARANTINE_COLUMNS, rows=1000, cols=10)
 
 # === GET or CREATE EXPENSES LONG SHEET === #
-def get_or_create_expense_long_sheet(sheet_name, client):
-    try:
-        return client.open(sheet_name).worksheet("Expenses Long")
-    except gspread.exceptions.WorksheetNotFound:
-        print("📄 'Expenses Long' tab not found. Creating new tab...")
-        sheet = client.open(sheet_name)
-        new_sheet = sheet.add_worksheet(title="Expenses Long", rows="1000", cols="10")
-        headers = ["Owner", "Property Address", "Statement Period", "Expense Category", "Amount", "Period Month", "Period Year"]
-        new_sheet.append_row(headers)
-        return new_sheet
-
-expenses_long_sheet = get_or_create_expense_long_sheet(sheet_name, gsheets_client)
-
-# === FORCE HEADERS ON MAIN SHEET === #
-def force_set_headers(sheet):
-    headers = [
-        "Owner", "Postal Code", "Statement Period", "Property Address", "Rent", "NSF Income", "Maintenance",
-        "Income Total", "General Repairs", "Appliance Repair", "Advertising", "Lease Up (Billable)", "Plumbing",
-        "Condo Fees", "Mgmt Fee", "Garbage Removal", "Hydro", "Other Billable", "Electrical",
-        "Credit Check (NB)", "Lease Up (NB)", "Unit Cleaning", "NSF Expense", "Expenses", "Net",
-        "Period Month", "Period Year"
-    ]
-    try:
-        sheet.delete_rows(1)
-    except:
-        pass
-    sheet.insert_row(headers, index=1)
-    print("Headers added.")
+def get_or_create_expense_long_sheet(spreadsheet):
+    return spreadsheet.worksheet_or_create("Expenses Long", EXPENSES_LONG_HEADERS, rows=1000, cols=10)
 
-force_set_headers(sheet)
+# === KEY INDEXES (see sheet_index.py) === #
+SHEET_KEY_COLUMNS = ["Owner", "Statement Period", "Property Address"]
+EXPENSES_LONG_HEADERS = ["Owner", "Property Address", "Statement Period", "Expense Category", "Amount", "Period Month", "Period Year"]
+EXPENSES_LONG_KEY_COLUMNS = ["Owner", "Property Address", "Statement Period", "Expense Category"]
 
 # === PROMPT === #
-prompt = """
+# The field list and label lists come from statement_schema, which also builds
+# the response_schema the model answers under (short keys, numeric amounts).
+prompt = f"""
 You are a highly skilled document data extraction specialist. Your task is to extract structured financial data from rental owner statements in PDF format. Each statement may contain information for one or multiple properties, presented in a multi-column layout where each column represents a single property.
 
-For each property identified in the document, extract the following information. If a piece of information is not present for a specific property, return an empty string for that field.
-
-Output the extracted information as a JSON array of objects. Each object in the array should represent a single property and contain the following keys:
-
-[
-  {
-    "Owner Name": "...",
-    "Left Corner Address and Postal Code": "...",
-    "Statement Period": "...",
-    "Statement Date": "...",
-    "Address": "...",
-    "Rent Income": "...",
-    "NSF Fee Income": "...",
-    "Maintenance Income": "...",
-    "Total Income": "...",
-    "6800 - Common Area Repairs - 6865 - General Repairs/Maintenance": "...",
-    "6910 - Unit Repairs and Maintenance - Appliance Repair - 6915": "...",
-    "6700 - Billable Operating Expenses - 6710 - Advertising": "...",
-    "6700 - Billable Operating Expenses - 6728 - Lease Up Expense": "...",
-    "6800 - Common Area Repairs - 6890 - Plumbing Repairs": "...",
-    "Condo Fees": "...",
-    "General Office Expenses - 6500 - 6585 - Management Fee Expense": "...",
-    "6800 - Common Area Repairs - 6860 Garbage/Large Item Removal": "...",
-    "6740 - Occupancy Costs - 6760 – Hydro": "...",
-    "6700 - Billable Operating Expenses – 6727": "...",
-    "6800 - Common Area Repairs - 6835 Electrical Repair": "...",
-    "6700 - Non Billable Operating Expenses 6727 - Credit Check": "...",
-    "6700 - Non Billable Operating Expenses 6728 - Lease Up Expense": "...",
-    "6910 - Unit Repairs and Maintenance - Unit Cleaning - 6950": "...",
-    "NSF Fee (Expense)": "...",
-    "Total Expenses": "...",
-    "Net Income": "..."
-  },
-  {
-    "...": "..."
-  },
-  ...
-]
+For each property identified in the document, extract the following information. If a text field is not present for a specific property, return an empty string; if an amount is not present, return null.
+
+Output the extracted information as a JSON array of objects, one object per property, using exactly these keys. Text fields are strings. Amounts are plain numbers without "$" or thousands separators (a negative amount in parentheses becomes a negative number). Each key is followed by the label it is printed under on the statement:
+
+{prompt_field_list()}
 
 Follow these guidelines for extraction:
 
-1.  *Owner Name:* Locate the line containing "Owner: [Name]" at the bottom-left or bottom-right of the last page and extract the name following "Owner:".
+1.  *owner:* Locate the line containing "Owner: [Name]" at the bottom-left or bottom-right of the last page and extract the name following "Owner:".
 
-2.  *Left Corner Address and Postal Code:* Find the address block near the bottom of the page, often under "Prepared by" or as a footer. It's usually two lines. Extract this entire block as a single string.
+2.  *prepared_by:* Find the address block near the bottom of the page, often under "Prepared by" or as a footer. It's usually two lines. Extract this entire block as a single string.
 
-3.  *Statement Period:* Look for the label "Statement period" or "Statement Period" near the bottom of the page and extract the date range that follows.
+3.  *period:* Look for the label "Statement period" or "Statement Period" near the bottom of the page and extract the date range that follows.
 
-4.  *Statement Date:* Find the label "Statement date" near the bottom of the page and extract the date that follows.
+4.  *statement_date:* Find the label "Statement date" near the bottom of the page and extract the date that follows.
 
-5.  *Property Address:* For each vertical column representing a property, the address will be at the very top, often in bold. Extract this as the "Address" for that property.
+5.  *address:* For each vertical column representing a property, the address will be at the very top, often in bold. Extract this as the "address" for that property.
 
 6.  *Income Fields (Per Property Column):* Within the income section (usually at the top of each column), extract the values associated with the following labels:
-    * "Rent", "Gross Rent", or "Rent Income" as "Rent Income".
-    * "NSF Fee Income" or "NSF Fee" as "NSF Fee Income" (if present). If not present, return "".
-    * "Maintenance Income" (if present) as "Maintenance Income". If not present, return "".
-    * The value labeled "Total Income" at the bottom of the income block.
+{prompt_label_list("income")}
+    * The value labeled "Total Income" at the bottom of the income block as "income_total".
 
 7.  *Expense Categories (Per Property Column):* In the middle section of each property column (under "Expenses", "Operating Expenses", "Recoverable", or "Non-Billable"), find and extract the amounts for each line item that matches the following full labels (including the codes):
-    * "6800 - Common Area Repairs - 6865 - General Repairs/Maintenance"
-    * "6910 - Unit Repairs and Maintenance - Appliance Repair - 6915"
-    * "6700 - Billable Operating Expenses - 6710 - Advertising"
-    * "6700 - Billable Operating Expenses - 6728 - Lease Up Expense"
-    * "6800 - Common Area Repairs - 6890 - Plumbing Repairs"
-    * "Condo Fees" or similar (e.g., "Strata Fees")
-    * "General Office Expenses - 6500 - 6585 - Management Fee Expense"
-    * "6800 - Common Area Repairs - 6860 Garbage/Large Item Removal"
-    * "6740 - Occupancy Costs - 6760 - Hydro"
-    * "6700 - Billable Operating Expenses - 6727"
-    * "6800 - Common Area Repairs - 6835 Electrical Repair"
-    * "6700 - Non Billable Operating Expenses 6727 - Credit Check"
-    * "6700 - Non Billable Operating Expenses 6728 - Lease Up Expense"
-    * "6910 - Unit Repairs and Maintenance - Unit Cleaning - 6950"
-    * Look for "NSF Fee" at the bottom of the expense block and extract it as "NSF Fee (Expense)".
-
-8.  *Totals (Per Property Column):* At the bottom of each property column, extract the value labeled "Total Expenses" and the value labeled "Net Income" (usually directly below or beside "Total Expenses").
-
-Ensure that the JSON output is a list of dictionaries, where each dictionary corresponds to one property's extracted financial data. If a statement contains multiple property columns, you should have multiple objects in the JSON array.
+{prompt_label_list("expense")}
+
+8.  *Totals (Per Property Column):* At the bottom of each property column, extract the value labeled "Total Expenses" as "expenses_total" and the value labeled "Net Income" (usually directly below or beside "Total Expenses") as "net".
+
+Ensure that the JSON output is a list of objects, where each object corresponds to one property's extracted financial data. If a statement contains multiple property columns, you should have multiple objects in the JSON array.
 """
 
-# === GET PDF FILES FROM GCS === #
-def get_pdf_files(bucket_name, folder_path):
-    try:
-        blobs = storage_client.list_blobs(bucket_name, prefix=folder_path)
-        pdf_files = [f"gs://{bucket_name}/{blob.name}" for blob in blobs if blob.name.endswith(".pdf")]
-        print(f"Found {len(pdf_files)} PDF(s):")
-        for pdf in pdf_files:
-            print("•", pdf)
-        return pdf_files
-    except GoogleAPIError as e:
-        print("GCS Error:", e)
-        return []
+# Used to re-extract statements whose totals didn't reconcile the first time.
+strict_prompt = prompt + """
+This statement is being extracted again because a previous answer did not add up. Be exact:
 
-# === LOAD EXISTING KEYS === #
-def load_existing_keys(sheet):
-    existing_rows = sheet.get_all_values()[1:]
-    return {(row[0].strip(), row[2].strip(), row[3].strip()) for row in existing_rows if len(row) >= 4}
+*   Copy every amount exactly as printed, digit for digit (a negative amount in parentheses becomes a negative number). Never return text, notes or symbols in an amount field; return null when there is no amount.
+*   Read each amount from its own property's column; never shift a value into a neighbouring column or row.
+*   Check your answer before returning it. For each property, "income_total" must equal "rent" + "nsf_income" + "maintenance", "expenses_total" must equal the sum of the expense fields, and "net" must equal "income_total" - "expenses_total". If they don't, re-read the statement and correct the line items that were misread.
+"""
 
-# === INIT GEMINI MODEL === #
-model = GenerativeModel(model_name="gemini-2.0-flash-001", generation_config={"response_mime_type": "application/json"})
+# Structured output for single-document requests (see backends.VertexModel).
+RESPONSE_SCHEMA = response_schema()
 
-# === PROCESS EACH PDF === #
-def process_pdf(pdf_uri, sheet, existing_keys):
-    print(f"\nProcessing: {pdf_uri}")
+# === GET PDF FILES FROM STORAGE (streamed page by page) === #
+def get_pdf_files(storage, bucket_name, folder_path, metrics=None):
+    found = 0
+    pdfs = storage.iter_pdfs(bucket_name, folder_path)
+    if metrics is not None:
+        pdfs = timed_iter(pdfs, metrics, "list")
     try:
-        pdf_part = Part.from_uri(pdf_uri, mime_type="application/pdf")
-        response = model.generate_content([pdf_part, prompt])
-        raw_text = response.text.strip()
-        json_response = json.loads(raw_text)
-
+        for pdf in pdfs:
+            found += 1
+            print("•", blob_uri(pdf))
+            yield pdf
+    except StorageError as e:
+        print("GCS Error:", e)
+    print(f"Found {found} PDF(s).")
+
+# === EXTRACT A BATCH OF PDFS (runs in worker threads) === #
+# With a local_extractor, each PDF's text layer is parsed first and only the
+# ones it can't read with confidence (scans, unfamiliar layouts, totals that
+# don't reconcile) go to the model. With a slicer, the model only gets the
+# pages with property columns and the Owner / Statement period footer.
+# batch_size=1 sends one PDF per request; larger batches share one request and
+# a cached prompt prefix. Re-extraction passes strict_prompt as
+# extraction_prompt. Returns one (records, error) pair per blob.
+def extract_pdfs(blobs, model, extraction_cache, model_limiter, refresh=False, metrics=None, local_extractor=None,
+                 slicer=None, extraction_prompt=prompt):
+    extracted = []
+    answers = [None] * len(blobs)
+    if local_extractor is not None:
+        local_answers = extract_local(blobs, extraction_prompt, local_extractor, extraction_cache, refresh, metrics)
+        answers = [(raw_text, None) if raw_text is not None else None for raw_text in local_answers]
+    remote = [blob for blob, answer in zip(blobs, answers) if answer is None]
+    if remote:
+        remote_answers = iter(extract_batch(
+            remote, extraction_prompt, model, extraction_cache, model_limiter, refresh, metrics, slicer=slicer
+        ))
+        answers = [answer if answer is not None else next(remote_answers) for answer in answers]
+    for blob, (raw_text, error) in zip(blobs, answers):
+        if error is not None:
+            extracted.append((None, error))
+            continue
+        with metrics.stage("parse", blob_uri(blob)) if metrics else nullcontext():
+            json_response = json.loads(raw_text)
         if not isinstance(json_response, list):
             json_response = [json_response]
-
-        new_rows = []
-        headers = sheet.row_values(1)
-
-        for item in json_response:
-            df = pd.DataFrame([item])
-            df = clean_data(df)
-
-            if df.empty:
-                print("Skipping — cleaned DataFrame is empty.")
-                continue
-
-            dedup_key = (
-                df["Owner"].iloc[0].strip(),
-                df["Statement Period"].iloc[0].strip(),
-                df["Property Address"].iloc[0].strip()
-            )
-
-            if dedup_key not in existing_keys:
-                row_data = [df[col].iloc[0] if col in df.columns else "0" for col in headers]
-                new_rows.append(row_data)
-                existing_keys.add(dedup_key)
-
-                # Append to Expenses Long sheet
-                expense_columns = [
-                    "Advertising", "Hydro", "Plumbing", "General Repairs", "Appliance Repair",
-                    "Lease Up (Billable)", "Condo Fees", "Mgmt Fee", "Garbage Removal", "Other Billable",
-                    "Electrical", "Credit Check (NB)", "Lease Up (NB)", "Unit Cleaning", "NSF Expense"
-                ]
-
-                for col in expense_columns:
-                    if col in df.columns:
-                        value = df[col].iloc[0]
-                        try:
-                            value_float = float(value)
-                            if value_float != 0:
-                                expenses_long_sheet.append_row([
-                                    df["Owner"].iloc[0],
-                                    df["Property Address"].iloc[0],
-                                    df["Statement Period"].iloc[0],
-                                    col,
-                                    value_float
-                                ])
-                        except ValueError:
-                            print(f"Skipping invalid float in {col} for {df['Property Address'].iloc[0]}")
-
-        if new_rows:
-            sheet.append_rows(new_rows, value_input_option='RAW')
-            print(f"Appended {len(new_rows)} new row(s).")
-        else:
+        extracted.append((json_response, None))
+    return extracted
+
+# === CLEAN EACH PDF'S RECORDS (cleaning stage, runs in listing order) === #
+# Returns one (rows, failures, error) triple per blob. With a `tolerance`, the
+# whole batch is then reconciled in one pass: rows whose totals don't add up
+# move from `rows` to `failures` (see reconciliation.check_statements).
+def clean_pdfs(blobs, extracted, metrics=None, tolerance=None):
+    cleaned = []
+    for blob, (json_response, error) in zip(blobs, extracted):
+        if error is not None:
+            cleaned.append((None, None, error))
+            continue
+        try:
+            # Every property in this statement is cleaned in one vectorized pass.
+            with metrics.stage("clean", blob_uri(blob)) if metrics else nullcontext():
+                cleaned.append((clean_records(json_response), None, None))
+        except Exception as e:
+            cleaned.append((None, None, e))
+    if tolerance is not None:
+        with metrics.stage("reconcile") if metrics else nullcontext():
+            reconciled = reconcile_frames([df for df, _, _ in cleaned], tolerance)
+        cleaned = [
+            (rows, failures if error is None else None, error)
+            for (rows, failures), (_, _, error) in zip(reconciled, cleaned)
+        ]
+    return cleaned
+
+# === DEDUP AND WRITE ONE PDF'S CLEANED ROWS (writer stage, runs in listing order) === #
+# Rows with a new key are appended. With `replace` (--refresh, re-extraction),
+# rows whose key is already in the sheet are rewritten in place when their
+# values changed, and so are their Expenses Long rows when `expenses_index` is
+# given (a category that dropped to 0 is rewritten as 0). Parquet / rollup sinks
+# get the new rows, and for replaced rows their old values (as read from the
+# sheet) to remove along with the new ones.
+def process_pdf(pdf_uri, df, headers, key_index, sheet_writer, expenses_writer, table_sinks=None, replace=False,
+                expenses_index=None):
+    print(f"\nProcessing: {pdf_uri}")
+    try:
+        if df.empty:
+            print("Skipping — cleaned DataFrame is empty.")
+            return 0
+
+        rows = df.reindex(columns=headers, fill_value="0").values.tolist()
+        feed_sinks = table_sinks is not None and any(table_sinks.values())
+        previous = key_index.previous_values(rows) if replace and feed_sinks else None
+        statuses = key_index.upsert(sheet_writer, rows, replace=replace)
+        new_df = df[[status == "new" for status in statuses]]
+        updated_df = df[[status == "updated" for status in statuses]]
+
+        if not new_df.empty:
+            # Append to Expenses Long sheet
+            long_rows = melt_expenses(new_df).values.tolist()
+            if expenses_index is not None:
+                expenses_index.upsert(expenses_writer, long_rows)
+            else:
+                expenses_writer.extend(long_rows)
+            if feed_sinks:
+                feed_table_sinks(table_sinks, new_df)
+            print(f"Queued {len(new_df)} new row(s).")
+        if not updated_df.empty:
+            if expenses_index is not None:
+                long_rows = melt_expenses(updated_df, drop_zero=False).values.tolist()
+                long_rows = [row for row in long_rows if row[-1] != 0 or row in expenses_index]
+                expenses_index.upsert(expenses_writer, long_rows, replace=True)
+            if feed_sinks:
+                replaced = [values for values, status in zip(previous, statuses) if status == "updated"]
+                feed_table_sinks(table_sinks, updated_df, replaced=pd.DataFrame(replaced, columns=headers))
+            print(f"Queued {len(updated_df)} changed row(s) to update in place.")
+        if new_df.empty and updated_df.empty:
             print("No new data. Already processed.")
+        return len(new_df)
 
     except Exception as e:
         print(f"Error processing {pdf_uri}:\n{e}")
+        return None
+
+# === OPTIONAL TABLE OUTPUTS (Parquet tables, rollups) FED WITH EACH RUN'S WRITES === #
+EXPENSES_LONG_PARQUET_COLUMNS = EXPENSE_ID_COLUMNS + ["Expense Category", "Amount", "Period Month", "Period Year"]
+
+# With `rebuild` the rows handed over are the full history and replace the
+# tables instead of being added to them.
+def open_table_sinks(stack, headers, parquet_dir=None, rollup_dir=None, rebuild=False):
+    table_sinks = {"wide": [], "long": []}
+    if parquet_dir:
+        from parquet_sink import ParquetSink
+        table_sinks["wide"].append(stack.enter_context(ParquetSink(
+            parquet_dir, "pdf_extracted", headers, TEXT_COLUMNS, key_columns=SHEET_KEY_COLUMNS, rebuild=rebuild
+        )))
+        table_sinks["long"].append(stack.enter_context(ParquetSink(
+            parquet_dir, "expenses_long", EXPENSES_LONG_PARQUET_COLUMNS,
+            [col for col in EXPENSES_LONG_PARQUET_COLUMNS if col != "Amount"], key_columns=EXPENSE_ID_COLUMNS,
+            rebuild=rebuild
+        )))
+    if rollup_dir:
+        from rollups import RollupSink
+        table_sinks["wide"].append(stack.enter_context(RollupSink(rollup_dir, rebuild=rebuild)))
+    return table_sinks
+
+# `replaced` holds the old wide rows of the rows in `df` that were replaced in
+# place; every sink removes them (a statement's whole Expenses Long block, for
+# the long table) before taking `df`.
+def feed_table_sinks(table_sinks, df, replaced=None):
+    for sink in table_sinks["wide"]:
+        if replaced is not None:
+            sink.remove(replaced)
+        sink.append(df)
+    if table_sinks["long"]:
+        long_df = melt_expenses(df, id_columns=EXPENSE_ID_COLUMNS + ["Period Month", "Period Year"])
+        for sink in table_sinks["long"]:
+            if replaced is not None:
+                sink.remove(replaced)
+            sink.append(long_df)
+
+# === RUN THE PIPELINE AGAINST ANY STORAGE / MODEL / SPREADSHEET BACKEND === #
+def run(storage, model, spreadsheet, bucket_name, pdf_folder, max_workers=4, model_rpm=60, sheets_rpm=60,
+        flush_rows=500, refresh=False, process_all=False, cache_path=DEFAULT_CACHE_PATH,
+        manifest_path=DEFAULT_MANIFEST_PATH, parquet_dir=None, rollup_dir=None, max_in_flight=None, batch_size=1,
+        report_dir=None, profile_clean=False, local_text=False, min_confidence=None, slice_pages=False,
+        derived_cache_path=DEFAULT_DERIVED_CACHE_PATH, reconcile_tolerance=None, reextract=True,
+        sheet_index_path=DEFAULT_SHEET_INDEX_PATH):
+    summary = {"pdfs": 0, "rows": 0, "failed": 0, "seconds": {}}
+    metrics = RunMetrics("statements")
+    sheet = spreadsheet.sheet1
+    headers = list(SHEET_HEADERS)
+    with metrics.stage("sheet_setup"):
+        expenses_long_sheet = get_or_create_expense_long_sheet(spreadsheet)
+        quarantine_sheet = get_or_create_quarantine_sheet(spreadsheet) if reconcile_tolerance is not None else None
+    metrics.count("sheets_api_calls", 1 if quarantine_sheet is None else 2)
+
+    extraction_cache = ExtractionCache(cache_path)
+    manifest = IngestionManifest("statements", manifest_path)
+
+    model_limiter = TokenBucket(rate_per_minute=model_rpm)
+    sheets_limiter = TokenBucket(rate_per_minute=sheets_rpm)
+    # Existing rows are only replaced by --refresh, for re-uploaded PDFs and by re-extraction;
+    # the Expenses Long index is only needed then. --refresh compares every row, so it reads
+    # whole rows up front; the others read just the rows they touch.
+    replace = refresh
+    open_expenses_index = partial(
+        SheetKeyIndex, spreadsheet, expenses_long_sheet, EXPENSES_LONG_HEADERS, EXPENSES_LONG_KEY_COLUMNS,
+        sheet_index_path, limiter=sheets_limiter, metrics=metrics, read_values=refresh
+    )
+    with metrics.stage("load_keys"):
+        key_index = SheetKeyIndex(
+            spreadsheet, sheet, headers, SHEET_KEY_COLUMNS, sheet_index_path, limiter=sheets_limiter, metrics=metrics,
+            read_values=refresh
+        )
+        key_index.ensure_header()
+        expenses_index = None
+        if refresh or (reconcile_tolerance is not None and reextract):
+            expenses_index = open_expenses_index()
+    # Lazily listed; only new, changed or previously failed blobs reach the model, unless
+    # --all or --refresh (which re-extracts everything) asks for every blob. Changed ones
+    # (re-uploaded PDFs) replace the rows their previous version wrote.
+    changed = set()
+    pdf_files = manifest.iter_pending(
+        get_pdf_files(storage, bucket_name, pdf_folder, metrics), changed=changed, include_done=process_all or refresh
+    )
+    completed = []
+
+    local_extractor = None
+    if local_text:
+        from text_extractor import MIN_CONFIDENCE, LocalExtractor
+        local_extractor = LocalExtractor(
+            max_workers=max_workers, min_confidence=MIN_CONFIDENCE if min_confidence is None else min_confidence
+        )
+    slicer = None
+    if slice_pages:
+        from pdf_slicer import PdfSlicer
+        slicer = PdfSlicer("statements", derived_cache_path)
+    extract = partial(
+        extract_pdfs, model=model, extraction_cache=extraction_cache, model_limiter=model_limiter, refresh=refresh,
+        metrics=metrics, local_extractor=local_extractor, slicer=slicer
+    )
+    clean = partial(clean_pdfs, metrics=metrics, tolerance=reconcile_tolerance)
+    profiler = None
+    if profile_clean:
+        profiler = StageProfiler(os.path.join(report_dir or DEFAULT_REPORT_DIR, "statements-clean.prof"))
+        clean = profiler.wrap(clean)
+
+    # Listing, extraction workers, cleaning and the writers below run as overlapping stages joined
+    # by bounded queues; results arrive in listing order so dedup stays deterministic.
+    # Every writer flushes whatever is still buffered on exit, even if the loop raises.
+    # The table outputs are entered first so they close last: if the loop or a writer's final
+    # flush fails they see it and drop their buffered rows instead of writing them.
+    with metrics.stage("stream"), ExitStack() as stack:
+        if local_extractor is not None:
+            stack.enter_context(local_extractor)
+        if slicer is not None:
+            stack.enter_context(slicer)
+        table_sinks = open_table_sinks(stack, headers, parquet_dir=parquet_dir, rollup_dir=rollup_dir)
+        sheet_writer = stack.enter_context(
+            BufferedSheetWriter(sheet, flush_rows=flush_rows, limiter=sheets_limiter, metrics=metrics)
+        )
+        expenses_writer = stack.enter_context(
+            BufferedSheetWriter(expenses_long_sheet, flush_rows=flush_rows, limiter=sheets_limiter, metrics=metrics)
+        )
+        quarantine_writer = None
+        if quarantine_sheet is not None:
+            quarantine_writer = stack.enter_context(
+                BufferedSheetWriter(quarantine_sheet, flush_rows=flush_rows, limiter=sheets_limiter, metrics=metrics)
+            )
+
+        def quarantine(blob, failures, attempt):
+            rows = failures.assign(**{"Source PDF": blob_uri(blob), "Attempt": attempt})
+            quarantine_writer.extend(rows.reindex(columns=QUARANTINE_COLUMNS).values.tolist())
+            metrics.count("quarantine_rows", len(rows))
+            metrics.pdf(blob_uri(blob), quarantined=len(rows))
+            summary["quarantine_rows"] = summary.get("quarantine_rows", 0) + len(rows)
+
+        # Called between results and while waiting on slow ones, so buffered rows reach the
+        # sheet on time even when no new rows are being queued.
+        def flush_due():
+            for writer in (sheet_writer, expenses_writer, quarantine_writer):
+                if writer is not None:
+                    writer.maybe_flush()
+
+        held = []  # (blob, failures) waiting for re-extraction
+        stages = stream_in_order(
+            batched(pdf_files, batch_size), extract, clean, max_workers=max_workers, max_in_flight=max_in_flight,
+            on_tick=flush_due
+        )
+        for blobs, cleaned, batch_error in stages:
+            for blob, (df, failures, error) in zip(blobs, cleaned or [(None, None, batch_error)] * len(blobs)):
+                summary["pdfs"] += 1
+                if error is not None:
+                    print(f"Error processing {blob_uri(blob)}:\n{error}")
+                    manifest.mark_failed(blob, error)
+                    metrics.pdf(blob_uri(blob), status="failed", error=str(error))
+                    summary["failed"] += 1
+                    continue
+                replace_rows = replace or blob.name in changed
+                if replace_rows and expenses_index is None:
+                    # First re-uploaded PDF of the run: the Expenses Long rows queued so far are
+                    # written first, so the index loaded now already counts them.
+                    expenses_writer.flush()
+                    expenses_index = open_expenses_index()
+                with metrics.stage("process", blob_uri(blob)):
+                    row_count = process_pdf(
+                        blob_uri(blob), df, headers, key_index, sheet_writer, expenses_writer, table_sinks,
+                        replace=replace_rows, expenses_index=expenses_index
+                    )
+                if row_count is None:
+                    manifest.mark_failed(blob, "processing error")
+                    metrics.pdf(blob_uri(blob), status="failed", error="processing error")
+                    summary["failed"] += 1
+                else:
+                    completed.append((blob, row_count))
+                    metrics.pdf(blob_uri(blob), status="done", rows=row_count)
+                    summary["rows"] += row_count
+                    if failures is not None and not failures.empty:
+                        if reextract:
+                            held.append((blob, failures))
+                        else:
+                            quarantine(blob, failures, attempt=1)
+
+        # Only the PDFs with failing rows go back to the model, with the stricter prompt; their
+        # passing rows are already queued and are only rewritten if the new answer changed them.
+        # Rows that still fail are quarantined.
+        if held:
+            print(f"\nRe-extracting {len(held)} PDF(s) whose totals don't reconcile.")
+            metrics.count("pdfs_reextracted", len(held))
+            first_failures = {blob_uri(blob): failures for blob, failures in held}
+            strict_extract = partial(extract, local_extractor=None, extraction_prompt=strict_prompt)
+            stages = stream_in_order(
+                batched([blob for blob, _ in held], batch_size), strict_extract, clean, max_workers=max_workers,
+                max_in_flight=max_in_flight, on_tick=flush_due
+            )
+            for blobs, cleaned, batch_error in stages:
+                for blob, (df, failures, error) in zip(blobs, cleaned or [(None, None, batch_error)] * len(blobs)):
+                    if error is not None:
+                        print(f"Re-extraction failed for {blob_uri(blob)}: {error}")
+                        quarantine(blob, first_failures[blob_uri(blob)], attempt=1)
+                        continue
+                    with metrics.stage("process", blob_uri(blob)):
+                        row_count = process_pdf(
+                            blob_uri(blob), df, headers, key_index, sheet_writer, expenses_writer, table_sinks,
+                            replace=True, expenses_index=expenses_index
+                        )
+                    if row_count is None:
+                        quarantine(blob, first_failures[blob_uri(blob)], attempt=1)
+                        continue
+                    metrics.count("rows_recovered", row_count)
+                    metrics.pdf(blob_uri(blob), rows=row_count, recovered=row_count)
+                    summary["rows"] += row_count
+                    if not failures.empty:
+                        quarantine(blob, failures, attempt=2)
+
+    # Only mark PDFs as ingested once their rows have been flushed to the sheet.
+    manifest.mark_done_many(completed)
+    for index in (key_index, expenses_index):
+        if index is not None:
+            index.save()
+            index.close()
+    manifest.close()
+
+    print(f"Extraction cache: {extraction_cache.hits} hit(s), {extraction_cache.misses} miss(es).")
+    evicted = extraction_cache.evict()
+    if evicted:
+        print(f"Evicted {evicted} stale cache entr{'y' if evicted == 1 else 'ies'}.")
+    extraction_cache.close()
+
+    for name in ("pdfs", "rows", "failed"):
+        metrics.count(name, summary[name])
+    summary["report"] = metrics.finish()
+    summary["seconds"] = {
+        stage: summary["report"]["stages"].get(stage, {}).get("seconds", 0.0)
+        for stage in ("load_keys", "stream", "process")
+    }
+    if profiler is not None:
+        profiler.dump()
+    if report_dir:
+        metrics.write(report_dir)
+    return summary
+
+# === RE-CLEAN CACHED RESPONSES (no model calls) === #
+# Rebuilds the cleaned wide and long tables from the latest cached response per
+# PDF (from the model or the local text-layer parser), e.g. after changing
+# clean_data or the prompt. Output goes to fresh CSV files (and optionally
+# rebuilt Parquet tables / rollups) rather than into the live sheet.
+def load_cached_statements(cache_path=DEFAULT_CACHE_PATH):
+    extraction_cache = ExtractionCache(cache_path)
+    records = []
+    pdfs = 0
+    for source_uri, raw_text in extraction_cache.iter_responses(model_name=(MODEL_NAME, LOCAL_MODEL_NAME)):
+        try:
+            json_response = json.loads(raw_text)
+        except ValueError as e:
+            print(f"Skipping unreadable cached response for {source_uri}: {e}")
+            continue
+        records.extend(json_response if isinstance(json_response, list) else [json_response])
+        pdfs += 1
+    extraction_cache.close()
+
+    # One vectorized cleaning pass over the whole cache.
+    df = clean_records(records)
+    if not df.empty:
+        keys = df[["Owner", "Statement Period", "Property Address"]].apply(lambda col: col.str.strip())
+        df = df[~keys.duplicated()]
+    return df, pdfs
+
+
+def reclean(cache_path=DEFAULT_CACHE_PATH, output_dir="recleaned", parquet_dir=None, rollup_dir=None):
+    df, pdfs = load_cached_statements(cache_path)
+    os.makedirs(output_dir, exist_ok=True)
+    headers = list(SHEET_HEADERS)
+    df.reindex(columns=headers, fill_value="0").to_csv(os.path.join(output_dir, "pdf_extracted.csv"), index=False)
+    melt_expenses(df).to_csv(os.path.join(output_dir, "expenses_long.csv"), index=False)
+
+    # The Parquet tables and rollups are rebuilt from scratch (and swapped in once
+    # complete) rather than appended to; an empty cache leaves them alone.
+    if df.empty and (parquet_dir or rollup_dir):
+        print("No cached rows; Parquet tables and rollups left as they are.")
+    elif parquet_dir or rollup_dir:
+        with ExitStack() as stack:
+            feed_table_sinks(
+                open_table_sinks(stack, headers, parquet_dir=parquet_dir, rollup_dir=rollup_dir, rebuild=True), df
+            )
 
-    time.sleep(15)
+    print(f"Re-cleaned {len(df)} row(s) from {pdfs} cached PDF response(s) into {output_dir}/.")
+    return df
 
 # === MAIN DRIVER === #
-pdf_files = get_pdf_files(bucket_name, pdf_folder)
-existing_keys = load_existing_keys(sheet)
+# Kept for `python Pdfs_data_extracted.py ...`; settings come from flags, RENTAL_* env vars or the
+# config file, with interactive prompts only for missing values on a terminal.
+def main():
+    from cli import main as cli_main
+    return cli_main(["statements"] + sys.argv[1:])
 
-if pdf_files:
-    for pdf_uri in pdf_files:
-        process_pdf(pdf_uri, sheet, existing_keys)
 
-print("\nAll PDFs processed successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,563 @@
+import base64
+import csv
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+
+from sheet_writer import column_letter
+
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+# Page objects in an uncompressed PDF, for FakeModel's per-page charges.
+PAGE_OBJECT_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+class StorageError(Exception):
+    pass
+
+
+# Raised by the local stand-ins with the same `.code` the Google clients use, so
+# extraction_engine.is_retryable() treats them exactly like real 429/503s.
+class InjectedAPIError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message or f"Injected API error {code}")
+        self.code = code
+
+
+class QuotaExceeded(InjectedAPIError):
+    def __init__(self, message="Quota exceeded for quota metric 'Requests' per minute"):
+        super().__init__(429, message)
+
+
+# === CALL STATS (shared by every backend) === #
+class CallStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.seconds = {}
+
+    def record(self, op, seconds):
+        with self.lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            self.seconds[op] = self.seconds.get(op, 0.0) + seconds
+
+    def timed(self, op, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record(op, time.perf_counter() - start)
+
+
+def load_credentials(service_account_file, scopes=None):
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(service_account_file, scopes=scopes)
+
+
+# Builds a value on first access (thread-safe) and reuses it afterwards.
+class Lazy:
+    def __init__(self, factory):
+        self.factory = factory
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.value is None:
+            with self.lock:
+                if self.value is None:
+                    self.value = self.factory()
+        return self.value
+
+
+# === GOOGLE BACKENDS === #
+# Constructors only record settings; credentials, google-* imports and API
+# clients are created on first use so building a backend costs nothing.
+class GCSStorage:
+    def __init__(self, service_account_file):
+        self._client = Lazy(lambda: self._make_client(service_account_file))
+        self.stats = CallStats()
+
+    @staticmethod
+    def _make_client(service_account_file):
+        from google.cloud import storage
+        return storage.Client(credentials=load_credentials(service_account_file))
+
+    @property
+    def client(self):
+        return self._client.get()
+
+    # Pages are fetched lazily as the caller iterates, so work can start on the
+    # first page while later ones are still being listed.
+    def iter_pdfs(self, bucket_name, prefix, page_size=1000):
+        from google.api_core.exceptions import GoogleAPIError
+        try:
+            for blob in self.client.list_blobs(bucket_name, prefix=prefix, page_size=page_size):
+                if blob.name.endswith(".pdf"):
+                    yield blob
+        except GoogleAPIError as e:
+            raise StorageError(str(e)) from e
+
+    def list_pdfs(self, bucket_name, prefix):
+        return self.stats.timed("list", lambda: list(self.iter_pdfs(bucket_name, prefix)))
+
+
+# `response_schema` (an OpenAPI-style dict) constrains single-document answers.
+# Batch answers are keyed by source URI, which a response schema can't
+# express, so batches rely on the prompt alone.
+class VertexModel:
+    def __init__(self, model_name, project_id, service_account_file, location="us-central1", prefix_cache_ttl=3600,
+                 response_schema=None):
+        self.model_name = model_name
+        self.response_schema = response_schema
+        self.project_id = project_id
+        self.service_account_file = service_account_file
+        self.location = location
+        self.prefix_cache_ttl = prefix_cache_ttl
+        self._model = Lazy(self._make_model)
+        self._prefixed = {}
+        self._prefix_lock = threading.Lock()
+        self.stats = CallStats()
+
+    def _make_model(self):
+        import vertexai
+        from vertexai.preview.generative_models import GenerativeModel
+        vertexai.init(project=self.project_id, location=self.location,
+                      credentials=load_credentials(self.service_account_file))
+        return GenerativeModel(model_name=self.model_name, generation_config={"response_mime_type": "application/json"})
+
+    @property
+    def model(self):
+        return self._model.get()
+
+    # Local files (LocalBlob) and pre-sliced PDFs (pdf_slicer.SlicedPdf) are
+    # sent inline; bucket objects by URI. Not hasattr(blob, "path"):
+    # google.cloud.storage.Blob has a .path property too.
+    def pdf_part(self, blob):
+        from vertexai.preview.generative_models import Part
+        if isinstance(blob, LocalBlob) or getattr(blob, "sliced", False):
+            return Part.from_data(data=blob.download_as_bytes(), mime_type="application/pdf")
+        return Part.from_uri(f"gs://{blob.bucket.name}/{blob.name}", mime_type="application/pdf")
+
+    def generate(self, blob, prompt):
+        model = self.model
+        if self.response_schema is None:
+            return self.stats.timed("generate", model.generate_content, [self.pdf_part(blob), prompt])
+        generation_config = {"response_mime_type": "application/json", "response_schema": self.response_schema}
+        return self.stats.timed(
+            "generate", model.generate_content, [self.pdf_part(blob), prompt], generation_config=generation_config
+        )
+
+    # The static prompt becomes the system instruction of a context cache, so a
+    # batch request only carries the documents. Context caching has a minimum
+    # size and needs a versioned model name; when it can't be used the prompt is
+    # still sent once per batch as a plain system instruction.
+    def _prefixed_model(self, instruction):
+        with self._prefix_lock:
+            if instruction not in self._prefixed:
+                self.model  # runs vertexai.init()
+                from vertexai.preview.generative_models import GenerativeModel
+                generation_config = {"response_mime_type": "application/json"}
+                try:
+                    from vertexai.preview import caching
+                    cached_content = caching.CachedContent.create(
+                        model_name=self.model_name, system_instruction=instruction,
+                        ttl=datetime.timedelta(seconds=self.prefix_cache_ttl)
+                    )
+                    model = GenerativeModel.from_cached_content(cached_content, generation_config=generation_config)
+                    print(f"Prompt prefix cached as {cached_content.name}.")
+                except Exception as e:
+                    print(f"Prompt prefix caching unavailable ({e.__class__.__name__}); sending it per batch.")
+                    model = GenerativeModel(
+                        model_name=self.model_name, system_instruction=instruction, generation_config=generation_config
+                    )
+                self._prefixed[instruction] = model
+            return self._prefixed[instruction]
+
+    def generate_batch(self, blobs, prompt):
+        from google.api_core.exceptions import FailedPrecondition, NotFound
+        from vertexai.preview.generative_models import Part
+        from batch_extraction import BATCH_INSTRUCTIONS
+        from extraction_cache import blob_uri
+        instruction = prompt + BATCH_INSTRUCTIONS
+        model = self._prefixed_model(instruction)
+        contents = []
+        for blob in blobs:
+            contents += [Part.from_text(f"Document: {blob_uri(blob)}"), self.pdf_part(blob)]
+        try:
+            return self.stats.timed("generate_batch", model.generate_content, contents)
+        except (NotFound, FailedPrecondition):
+            # An expired or deleted context cache fails every later call; rebuild it next
+            # time. Other errors (429/503 retries included) keep using the same cache.
+            with self._prefix_lock:
+                self._prefixed.pop(instruction, None)
+            raise
+
+
+class GoogleSpreadsheet:
+    def __init__(self, service_account_file, sheet_name):
+        self._spreadsheet = Lazy(lambda: self._open(service_account_file, sheet_name))
+
+    @staticmethod
+    def _open(service_account_file, sheet_name):
+        import gspread
+        client = gspread.authorize(load_credentials(service_account_file, scopes=SHEETS_SCOPES))
+        return client.open(sheet_name)
+
+    @property
+    def spreadsheet(self):
+        return self._spreadsheet.get()
+
+    @property
+    def sheet1(self):
+        return self.spreadsheet.sheet1
+
+    def worksheet_or_create(self, title, headers, rows=1000, cols=20):
+        from gspread.exceptions import WorksheetNotFound
+        try:
+            worksheet = self.spreadsheet.worksheet(title)
+            print(f"📄 Found existing tab: {title}")
+        except WorksheetNotFound:
+            print(f"Tab '{title}' not found. Creating it in your Google Sheet...")
+            worksheet = self.spreadsheet.add_worksheet(title=title, rows=str(rows), cols=str(cols))
+            worksheet.insert_row(headers, index=1)
+        return worksheet
+
+    # (stable id of the worksheet, token that changes whenever the spreadsheet
+    # is edited). sheet_index.SheetKeyIndex reuses its cached key index while
+    # the token is unchanged. The token is the file's Drive modifiedTime.
+    def change_token(self, worksheet):
+        spreadsheet = self.spreadsheet
+        get_last_update = getattr(spreadsheet, "get_lastUpdateTime", None)  # gspread >= 6
+        token = get_last_update() if get_last_update else spreadsheet.lastUpdateTime
+        return f"{spreadsheet.id}/{worksheet.id}", token
+
+
+# === LOCAL STORAGE: a directory per bucket === #
+class LocalBucketRef:
+    def __init__(self, name):
+        self.name = name
+
+
+class LocalBlob:
+    def __init__(self, path, name, bucket):
+        self.path = path
+        self.name = name
+        self.bucket = bucket
+        stat = os.stat(path)
+        self.generation = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.crc32c = None
+        self._md5_hash = None
+
+    @property
+    def uri(self):
+        return f"file://{os.path.abspath(self.path)}"
+
+    @property
+    def md5_hash(self):
+        if self._md5_hash is None:
+            with open(self.path, "rb") as f:
+                self._md5_hash = base64.b64encode(hashlib.md5(f.read()).digest()).decode("ascii")
+        return self._md5_hash
+
+    def download_as_bytes(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+        self.stats = CallStats()
+
+    def iter_pdfs(self, bucket_name, prefix, page_size=1000):
+        bucket_dir = os.path.join(self.root, bucket_name)
+        if not os.path.isdir(bucket_dir):
+            raise StorageError(f"Local bucket not found: {bucket_dir}")
+        bucket = LocalBucketRef(bucket_name)
+        names = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), bucket_dir).replace(os.sep, "/")
+                if name.startswith(prefix) and name.endswith(".pdf"):
+                    names.append(name)
+        # GCS lists lexicographically; keep the same order.
+        for name in sorted(names):
+            yield LocalBlob(os.path.join(bucket_dir, *name.split("/")), name, bucket)
+
+    def list_pdfs(self, bucket_name, prefix):
+        return self.stats.timed("list", lambda: list(self.iter_pdfs(bucket_name, prefix)))
+
+
+# === FAKE / REPLAY MODEL === #
+# Answers come from `replay_dir/<blob name>.json` when present, otherwise from
+# `responder(blob, prompt) -> str`. Latency and 429/503 errors can be injected,
+# and `drop_rate` leaves documents out of batch answers to exercise retries.
+# `page_tokens` / `page_latency` charge each PDF page sent, like a real model
+# reading page images, so sliced PDFs show up as cheaper and faster calls.
+class FakeModel:
+    def __init__(self, responder=None, replay_dir=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_codes=(429, 503), seed=0, model_name="fake-model", drop_rate=0.0,
+                 page_tokens=0, page_latency=0.0):
+        self.responder = responder
+        self.replay_dir = replay_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.drop_rate = drop_rate
+        self.page_tokens = page_tokens
+        self.page_latency = page_latency
+        self.model_name = model_name
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = CallStats()
+        self.errors = 0
+
+    def _respond(self, blob, prompt):
+        if self.replay_dir:
+            replay_path = os.path.join(self.replay_dir, blob.name + ".json")
+            if os.path.exists(replay_path):
+                with open(replay_path, encoding="utf-8") as f:
+                    return f.read()
+        if self.responder is None:
+            raise ValueError(f"No recorded response for {blob.name}")
+        return self.responder(blob, prompt)
+
+    def _pages(self, blobs):
+        if not (self.page_tokens or self.page_latency):
+            return 0
+        return sum(max(1, len(PAGE_OBJECT_RE.findall(blob.download_as_bytes()))) for blob in blobs)
+
+    def _call(self, pages=0):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter) + self.page_latency * pages
+            fail = self.random.random() < self.error_rate
+            code = self.random.choice(self.error_codes) if fail else None
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.errors += 1
+            raise InjectedAPIError(code)
+
+    @staticmethod
+    def _response(text, prompt_tokens):
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=len(text) // 4)
+        )
+
+    def generate(self, blob, prompt):
+        start = time.perf_counter()
+        try:
+            pages = self._pages([blob])
+            self._call(pages)
+            return self._response(self._respond(blob, prompt), len(prompt) // 4 + self.page_tokens * pages)
+        finally:
+            self.stats.record("generate", time.perf_counter() - start)
+
+    # Mirrors VertexModel.generate_batch: the prompt is treated as a cached
+    # prefix, so only the per-document markers count as prompt tokens.
+    def generate_batch(self, blobs, prompt):
+        from extraction_cache import blob_uri
+        start = time.perf_counter()
+        try:
+            pages = self._pages(blobs)
+            self._call(pages)
+            answers = {}
+            for blob in blobs:
+                with self.lock:
+                    dropped = self.random.random() < self.drop_rate
+                if not dropped:
+                    answers[blob_uri(blob)] = json.loads(self._respond(blob, prompt))
+            prompt_tokens = sum(len(blob_uri(blob)) for blob in blobs) // 4 + self.page_tokens * pages
+            return self._response(json.dumps(answers), prompt_tokens)
+        finally:
+            self.stats.record("generate_batch", time.perf_counter() - start)
+
+
+# === IN-MEMORY / CSV WORKSHEETS WITH SHEETS-STYLE QUOTAS === #
+A1_RE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+# "C2:C" -> (2, 1, 3, None): zero-based first column / row and exclusive ends,
+# None when the range is open.
+def _a1_bounds(a1):
+    first_col, first_row, last_col, last_row = A1_RE.match(a1.upper()).groups()
+    if last_col is None and last_row is None:
+        last_col, last_row = first_col, first_row
+    return (
+        _column_index(first_col) if first_col else 0,
+        int(first_row) - 1 if first_row else 0,
+        _column_index(last_col) + 1 if last_col else None,
+        int(last_row) if last_row else None,
+    )
+
+
+class MemoryWorksheet:
+    def __init__(self, title, rows=None, read_quota_per_minute=60, write_quota_per_minute=60, clock=time.monotonic):
+        self.title = title
+        self.rows = [list(row) for row in rows or []]
+        self.read_quota = read_quota_per_minute
+        self.write_quota = write_quota_per_minute
+        self.clock = clock
+        self.windows = {"read": deque(), "write": deque()}
+        self.lock = threading.Lock()
+        self.stats = CallStats()
+        self.instance = uuid.uuid4().hex
+        self.version = 0
+
+    def _request(self, kind):
+        quota = self.read_quota if kind == "read" else self.write_quota
+        with self.lock:
+            now = self.clock()
+            window = self.windows[kind]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if quota is not None and len(window) >= quota:
+                raise QuotaExceeded()
+            window.append(now)
+
+    def _persist(self):
+        self.version += 1
+
+    def change_token(self):
+        return f"memory/{self.instance}", str(self.version)
+
+    def row_values(self, row):
+        self._request("read")
+        self.stats.record("read", 0.0)
+        return list(self.rows[row - 1]) if 0 < row <= len(self.rows) else []
+
+    def get_all_values(self):
+        self._request("read")
+        self.stats.record("read", 0.0)
+        return [list(row) for row in self.rows]
+
+    # Ranges like "1:1", "C2:C" or "A5:AA5"; trailing empty rows are left out,
+    # as the Sheets API does.
+    def batch_get(self, ranges, **kwargs):
+        self._request("read")
+        self.stats.record("read", 0.0)
+        results = []
+        with self.lock:
+            for a1 in ranges:
+                first_col, first_row, last_col, last_row = _a1_bounds(a1)
+                values = [list(row[first_col:last_col]) for row in self.rows[first_row:last_row]]
+                while values and not any(values[-1]):
+                    values.pop()
+                results.append([row if any(row) else [] for row in values])
+        return results
+
+    def batch_update(self, data, value_input_option="RAW", **kwargs):
+        self._request("write")
+        start = time.perf_counter()
+        with self.lock:
+            for update in data:
+                first_col, first_row, _, _ = _a1_bounds(update["range"])
+                for offset, values in enumerate(update["values"]):
+                    number = first_row + offset
+                    while len(self.rows) <= number:
+                        self.rows.append([])
+                    row = self.rows[number]
+                    row.extend([""] * (first_col + len(values) - len(row)))
+                    row[first_col:first_col + len(values)] = list(values)
+            self._persist()
+        self.stats.record("write", time.perf_counter() - start)
+
+    # Answers like the Sheets API: updatedRange says where the rows landed.
+    def append_rows(self, values, value_input_option="RAW", **kwargs):
+        self._request("write")
+        start = time.perf_counter()
+        with self.lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(row) for row in values)
+            self._persist()
+        self.stats.record("write", time.perf_counter() - start)
+        width = max((len(row) for row in values), default=1)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:{column_letter(width - 1)}{len(self.rows)}"}}
+
+    def append_row(self, values, value_input_option="RAW", **kwargs):
+        self.append_rows([values], value_input_option=value_input_option)
+
+    def insert_row(self, values, index=1, **kwargs):
+        self._request("write")
+        with self.lock:
+            self.rows.insert(index - 1, list(values))
+            self._persist()
+        self.stats.record("write", 0.0)
+
+    def delete_rows(self, start_index, end_index=None):
+        self._request("write")
+        with self.lock:
+            del self.rows[start_index - 1:(end_index or start_index)]
+            self._persist()
+        self.stats.record("write", 0.0)
+
+
+class CsvWorksheet(MemoryWorksheet):
+    def __init__(self, path, title, **kwargs):
+        rows = []
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.reader(f))
+        super().__init__(title, rows=rows, **kwargs)
+        self.path = path
+
+    def _persist(self):
+        with open(self.path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(self.rows)
+
+    def change_token(self):
+        stat = os.stat(self.path) if os.path.exists(self.path) else None
+        return os.path.abspath(self.path), f"{stat.st_mtime_ns}:{stat.st_size}" if stat else "missing"
+
+
+class MemorySpreadsheet:
+    def __init__(self, csv_dir=None, **quota_kwargs):
+        self.csv_dir = csv_dir
+        self.quota_kwargs = quota_kwargs
+        self.worksheets = {}
+        self.sheet1 = self._new_worksheet("Sheet1")
+
+    def _new_worksheet(self, title):
+        if self.csv_dir:
+            os.makedirs(self.csv_dir, exist_ok=True)
+            worksheet = CsvWorksheet(os.path.join(self.csv_dir, f"{title}.csv"), title, **self.quota_kwargs)
+        else:
+            worksheet = MemoryWorksheet(title, **self.quota_kwargs)
+        self.worksheets[title] = worksheet
+        return worksheet
+
+    def worksheet_or_create(self, title, headers, rows=1000, cols=20):
+        if title in self.worksheets:
+            return self.worksheets[title]
+        worksheet = self._new_worksheet(title)
+        if not worksheet.rows:
+            worksheet.rows.append(list(headers))
+            worksheet._persist()
+        return worksheet
+
+    def change_token(self, worksheet):
+        return worksheet.change_token()
+
+    def api_calls(self):
+        return sum(sum(ws.stats.calls.values()) for ws in self.worksheets.values())
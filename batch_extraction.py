@@ -0,0 +1,129 @@
+import json
+import time
+from itertools import islice
+from extraction_cache import ExtractionCache, blob_uri
+from extraction_engine import call_with_backoff
+
+# Appended to the static extraction prompt when several PDFs share one request.
+# Together they form the model's system instruction, which VertexModel keeps in
+# a reusable context cache so it is not resent with every batch.
+BATCH_INSTRUCTIONS = """
+
+This request contains several PDF documents. Each document is preceded by a text part of the form
+"Document: <source URI>". Extract every document independently, following the instructions above, and
+return ONE JSON object whose keys are the source URIs exactly as given and whose values are exactly what
+you would return for that document on its own.
+"""
+
+
+def batched(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, max(1, size)))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_batch_response(text):
+    answers = json.loads(text)
+    if not isinstance(answers, dict):
+        raise ValueError(f"Expected a JSON object keyed by source URI, got {type(answers).__name__}")
+    return {str(uri).strip(): value for uri, value in answers.items()}
+
+
+def _call_model(method, target, prompt, model_limiter, blobs, metrics):
+    if metrics is None:
+        return call_with_backoff(method, target, prompt, limiter=model_limiter)
+    start = time.perf_counter()
+    try:
+        response = call_with_backoff(method, target, prompt, limiter=model_limiter, on_retry=metrics.retried)
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.add_time("model", seconds)
+        metrics.count("model_requests")
+        for blob in blobs:
+            metrics.pdf(blob_uri(blob), model_seconds=seconds, model_requests=1)
+    metrics.usage(response, [blob_uri(blob) for blob in blobs])
+    return response
+
+
+# === ONE MODEL REQUEST PER BATCH, SPLIT AND RETRIED ON FAILURE === #
+# A batch that fails outright (non-retryable error, unparsable JSON) is split in
+# half; documents missing from an otherwise good answer are re-sent as a smaller
+# batch. A batch of one uses the plain single-document request, so every PDF
+# ends with either its own answer or its own error.
+def _generate(blobs, prompt, model, model_limiter, answers, metrics=None):
+    if len(blobs) == 1:
+        blob = blobs[0]
+        try:
+            response = _call_model(model.generate, blob, prompt, model_limiter, [blob], metrics)
+            raw_text = response.text.strip()
+            json.loads(raw_text)
+            answers[blob_uri(blob)] = (raw_text, None)
+        except Exception as e:
+            answers[blob_uri(blob)] = (None, e)
+        return
+
+    try:
+        response = _call_model(model.generate_batch, blobs, prompt, model_limiter, blobs, metrics)
+        batch_answers = parse_batch_response(response.text)
+    except Exception as e:
+        print(f"Batch of {len(blobs)} PDF(s) failed ({e.__class__.__name__}: {e}); splitting.")
+        half = len(blobs) // 2
+        _generate(blobs[:half], prompt, model, model_limiter, answers, metrics)
+        _generate(blobs[half:], prompt, model, model_limiter, answers, metrics)
+        return
+
+    missing = []
+    for blob in blobs:
+        uri = blob_uri(blob)
+        if batch_answers.get(uri) is None:
+            missing.append(blob)
+        else:
+            answers[uri] = (json.dumps(batch_answers[uri], ensure_ascii=False), None)
+    if missing:
+        print(f"Batch answer missing {len(missing)} of {len(blobs)} PDF(s); retrying those.")
+        if len(missing) == len(blobs):
+            half = len(blobs) // 2
+            _generate(blobs[:half], prompt, model, model_limiter, answers, metrics)
+            _generate(blobs[half:], prompt, model, model_limiter, answers, metrics)
+        else:
+            _generate(missing, prompt, model, model_limiter, answers, metrics)
+
+
+# === EXTRACT A BATCH OF PDFS (runs in worker threads) === #
+# Returns one (raw_text, error) pair per blob, in order. Cached answers are used
+# as-is; only the misses go to the model. Each document's answer is cached under
+# the same key single-document mode uses, so the two modes share one cache.
+# With a `slicer` (pdf_slicer.PdfSlicer), misses are sent as derived PDFs that
+# keep only the pages the prompt needs; answers are still keyed by the source.
+def extract_batch(blobs, prompt, model, extraction_cache, model_limiter, refresh=False, metrics=None, slicer=None):
+    results = {}
+    cache_keys = {}
+    misses = []
+    for blob in blobs:
+        uri = blob_uri(blob)
+        cache_keys[uri] = ExtractionCache.make_key(blob, prompt, model.model_name)
+        raw_text = None if refresh else extraction_cache.get(cache_keys[uri])
+        if raw_text is None:
+            misses.append(blob)
+        else:
+            results[uri] = (raw_text, None)
+        if metrics is not None:
+            metrics.count("cache_misses" if raw_text is None else "cache_hits")
+            metrics.pdf(uri, cached=raw_text is not None)
+
+    if misses:
+        answers = {}
+        sent = [slicer.prepare(blob, metrics) for blob in misses] if slicer is not None else misses
+        _generate(sent, prompt, model, model_limiter, answers, metrics)
+        for blob in misses:
+            uri = blob_uri(blob)
+            raw_text, error = answers[uri]
+            # Only answers that parsed are cached, so a garbled one is retried next run.
+            if error is None:
+                extraction_cache.put(cache_keys[uri], uri, model.model_name, prompt, raw_text)
+            results[uri] = (raw_text, error)
+
+    return [results[blob_uri(blob)] for blob in blobs]
@@ -0,0 +1,97 @@
+# Benchmark for data_cleaner: per-row cleaning (the old process_pdf path) vs one
+# vectorized clean_records() pass over the whole batch.
+#
+#   python -m benchmarks.bench_clean_data            # 10k and 100k rows
+#   python -m benchmarks.bench_clean_data 5000 50000
+import random
+import sys
+import time
+
+import pandas as pd
+
+from data_cleaner import RENAME_MAP, clean_data, clean_records, melt_expenses
+
+TEXT_KEYS = {"Owner Name", "Left Corner Address and Postal Code", "Statement Period", "Statement Date", "Address"}
+STREETS = ["King St.", "Princess Street", "Brock  St", "Division St.,", "Union Street"]
+OWNERS = ["Jane Doe", "John Smith", "Acme Holdings Inc", "R. Patel"]
+
+
+def synthetic_records(n, seed=7):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        month = rng.randint(1, 12)
+        year = rng.choice([2022, 2023, 2024, 2025])
+        rec = {
+            "Owner Name": rng.choice(OWNERS),
+            "Left Corner Address and Postal Code": f"{rng.randint(1, 999)} Bath Rd, Kingston ON K7M {rng.randint(1, 9)}A{rng.randint(1, 9)}",
+            "Statement Period": f"{year}-{month:02d}-01 - {year}-{month:02d}-28",
+            "Statement Date": f"{year}-{month:02d}-28",
+            "Address": f"{rng.randint(1, 400)} {rng.choice(STREETS)} Unit {i % 37}",
+        }
+        # Optional fields are left out of some records entirely, as the model does.
+        if rng.random() < 0.2:
+            del rec["Statement Date"]
+        if rng.random() < 0.1:
+            del rec["Left Corner Address and Postal Code"]
+        for key in RENAME_MAP:
+            if key in TEXT_KEYS:
+                continue
+            roll = rng.random()
+            if roll < 0.1:
+                continue
+            if roll < 0.5:
+                rec[key] = ""
+            elif roll < 0.8:
+                rec[key] = f"${rng.uniform(0, 5000):,.2f}"
+            else:
+                rec[key] = round(rng.uniform(0, 5000), 2)
+        records.append(rec)
+    # Sprinkle in the summary column the cleaner must drop.
+    if records:
+        records[0]["Address"] = "All Properties"
+    return records
+
+
+def per_row(records):
+    frames = [clean_data(pd.DataFrame([rec])) for rec in records]
+    return [f for f in frames if not f.empty]
+
+
+def check_equivalence(records):
+    batch = clean_records(records)
+    rows = per_row(records)
+    assert len(rows) == len(batch), (len(rows), len(batch))
+    for i, row_df in enumerate(rows):
+        for col in row_df.columns:
+            a, b = row_df[col].iloc[0], batch[col].iloc[i]
+            assert (pd.isna(a) and pd.isna(b)) or a == b, (i, col, a, b)
+    long_batch = melt_expenses(batch)
+    # Rows without any expense melt to an empty, untyped frame; leave them out.
+    long_rows = pd.concat([m for m in (melt_expenses(r) for r in rows) if not m.empty], ignore_index=True)
+    assert long_batch.equals(long_rows)
+
+
+def bench(n):
+    records = synthetic_records(n)
+
+    sample = records[: min(n, 1000)]
+    start = time.perf_counter()
+    per_row(sample)
+    per_row_rate = len(sample) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    df = clean_records(records)
+    melt_expenses(df)
+    batch_rate = n / (time.perf_counter() - start)
+
+    print(f"{n:>8} rows | per-row {per_row_rate:>10,.0f} rows/s (1k sample) | "
+          f"batch {batch_rate:>10,.0f} rows/s | speedup {batch_rate / per_row_rate:>6.1f}x")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    check_equivalence(synthetic_records(500))
+    print("Batch output matches per-row output.")
+    for size in sizes:
+        bench(size)
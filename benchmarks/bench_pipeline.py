@@ -0,0 +1,171 @@
+# End-to-end benchmark for both extraction scripts, run entirely offline:
+# a directory-backed bucket of synthetic PDFs, a fake model with configurable
+# latency / 429-503 injection, and in-memory worksheets that enforce
+# Sheets-style per-minute quotas.
+#
+#   python -m benchmarks.bench_pipeline                      # 100 and 1,000 PDFs
+#   python -m benchmarks.bench_pipeline 100 1000 10000 --latency 0.2 --workers 16
+#   python -m benchmarks.bench_pipeline 500 --pipeline tax --error-rate 0.05
+#   python -m benchmarks.bench_pipeline 1000 --batch-size 10 --drop-rate 0.02
+#   python -m benchmarks.bench_pipeline 1000 --pipeline statements --text-layer 0.8 --local-text
+#   python -m benchmarks.bench_pipeline 500 --text-layer 1 --slice-pages --page-latency 0.05
+#   python -m benchmarks.bench_pipeline 1000 --pipeline statements --reconcile --bad-rate 0.05
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+from functools import partial
+
+import Pdfs_data_extracted
+import property_tax_script
+from backends import FakeModel, LocalStorage, MemorySpreadsheet
+from benchmarks.synthetic_pdf import statement_pdf_bytes, statement_records, tax_notice_pdf_bytes
+from statement_schema import compact_record
+
+BUCKET = "bench-bucket"
+PREFIX = "batch/"
+
+
+# `text_layer` is the fraction written as real statements / tax notices with a
+# text layer; the rest are placeholders with no text, like scans.
+def write_synthetic_pdfs(root, count, text_layer=0.0, pipeline="statements"):
+    bucket_dir = os.path.join(root, BUCKET, PREFIX)
+    os.makedirs(bucket_dir, exist_ok=True)
+    rng = random.Random(count)
+    for i in range(count):
+        with open(os.path.join(bucket_dir, f"statement_{i:06d}.pdf"), "wb") as f:
+            if rng.random() < text_layer and pipeline == "tax":
+                f.write(tax_notice_pdf_bytes(seed=i))
+            elif rng.random() < text_layer:
+                f.write(statement_pdf_bytes(statement_records(1 + i % 3, seed=i), filler_pages=i % 2))
+            else:
+                f.write(b"%PDF-1.4\n% synthetic statement " + str(i).encode() + b"\n%%EOF\n")
+
+
+# Answers reconcile, except that `bad_rate` of the PDFs come back with a
+# misread amount (a garbled digit or a shifted total) unless re-extracted with
+# the stricter prompt.
+def statement_responder(blob, prompt, bad_rate=0.0):
+    seed = zlib.crc32(blob.name.encode())
+    rng = random.Random(seed)
+    # Answers the way the model does under RESPONSE_SCHEMA: short keys, numeric amounts.
+    records = [compact_record(record) for record in statement_records(1 + seed % 3, seed=seed)]
+    if prompt != Pdfs_data_extracted.strict_prompt and rng.random() < bad_rate:
+        rec = rng.choice(records)
+        if rng.random() < 0.5:
+            rec["net"] = round(rec["net"] + 90, 2)
+        else:
+            rec["expenses_total"] = round(rec["expenses_total"] + 100, 2)
+    return json.dumps(records)
+
+
+def tax_responder(blob, prompt):
+    rng = random.Random(zlib.crc32(blob.name.encode()))
+    address = f"{rng.randint(1, 999)} {blob.name[-10:-4]} Street"
+    roll_number = f"1011-{rng.randint(100000, 999999)}"
+    assessment = round(rng.uniform(200_000, 900_000), 2)
+    # Raw facts only: one assessment, and a printed levy for the latest final year.
+    return json.dumps([
+        {"Property Address": address, "Roll Number": roll_number, "Year": 2021, "Assessment Value": assessment,
+         "Tax Rate": "", "Property Tax": ""},
+        {"Property Address": address, "Roll Number": roll_number, "Year": 2024, "Assessment Value": "",
+         "Tax Rate": 1.478321, "Property Tax": round(assessment * 0.01478321, 2)},
+    ])
+
+
+def bench(pipeline, count, options):
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        write_synthetic_pdfs(workdir, count, options.text_layer, pipeline)
+        extra_options = {"slice_pages": options.slice_pages}
+        if pipeline == "statements":
+            extra_options["local_text"] = options.local_text
+            extra_options["reconcile_tolerance"] = 0.01 if options.reconcile else None
+        storage = LocalStorage(workdir)
+        model = FakeModel(
+            responder=partial(statement_responder, bad_rate=options.bad_rate) if pipeline == "statements"
+            else tax_responder,
+            latency=options.latency, jitter=options.jitter, error_rate=options.error_rate,
+            drop_rate=options.drop_rate, page_tokens=options.page_tokens, page_latency=options.page_latency, seed=count
+        )
+        spreadsheet = MemorySpreadsheet(
+            read_quota_per_minute=options.sheets_quota, write_quota_per_minute=options.sheets_quota
+        )
+        module = Pdfs_data_extracted if pipeline == "statements" else property_tax_script
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = module.run(
+                storage, model, spreadsheet, BUCKET, PREFIX, max_workers=options.workers,
+                model_rpm=options.model_rpm, sheets_rpm=options.sheets_quota, flush_rows=options.flush_rows,
+                batch_size=options.batch_size,
+                cache_path=os.path.join(workdir, "cache.sqlite"),
+                manifest_path=os.path.join(workdir, "manifest.sqlite"),
+                derived_cache_path=os.path.join(workdir, "derived.sqlite"),
+                sheet_index_path=os.path.join(workdir, "sheet_index.sqlite"), **extra_options
+            )
+        wall = time.perf_counter() - start
+
+        model_calls = model.stats.calls.get("generate", 0) + model.stats.calls.get("generate_batch", 0)
+        sheet_calls = spreadsheet.api_calls()
+        report = summary["report"]
+        counters = report["counters"]
+        print(f"\n[{pipeline}] {count} PDFs — {wall:.2f}s wall, {count / wall:,.1f} PDFs/s, "
+              f"{summary['rows']} rows, {summary['failed']} failed")
+        print(f"  API calls per PDF: model {model_calls / count:.2f} "
+              f"(incl. {model.errors} injected errors, {counters.get('retries', 0)} retries), "
+              f"sheets {sheet_calls / count:.3f}")
+        if options.slice_pages:
+            print(f"  pages sent to the model: {counters.get('pages_sent', 0)} of {counters.get('pages_total', 0)}")
+        if extra_options.get("reconcile_tolerance") is not None:
+            print(f"  reconcile: {counters.get('pdfs_reextracted', 0)} PDF(s) re-extracted, "
+                  f"{counters.get('rows_recovered', 0)} row(s) recovered, "
+                  f"{counters.get('quarantine_rows', 0)} quarantine row(s)")
+        if extra_options.get("local_text"):
+            print(f"  text layer: {counters.get('local_extracted', 0)} parsed locally, "
+                  f"{counters.get('local_fallback', 0)} sent to the model")
+        print(f"  tokens per PDF: input {counters.get('model_input_tokens', 0) / count:,.0f}, "
+              f"output {counters.get('model_output_tokens', 0) / count:,.0f}")
+        # Worker stages are summed across threads (busy time), not wall time.
+        print("  stages: " + " | ".join(
+            f"{stage} {totals['seconds']:.2f}s" for stage, totals in report["stages"].items() if stage != "stream"
+        ))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument("sizes", nargs="*", type=int, default=[100, 1000], help="Batch sizes (number of PDFs).")
+    parser.add_argument("--pipeline", choices=["statements", "tax", "both"], default="both")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call, in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01, help="Fraction of model calls that fail with 429/503.")
+    parser.add_argument("--batch-size", type=int, default=1, help="PDFs per model request.")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="Fraction of documents the fake model leaves out of a batch answer.")
+    parser.add_argument("--text-layer", type=float, default=0.0,
+                        help="Fraction of PDFs written as multi-page documents with a real text layer.")
+    parser.add_argument("--local-text", action="store_true", help="Parse statement text layers locally first.")
+    parser.add_argument("--slice-pages", action="store_true", help="Send the model only the relevant pages.")
+    parser.add_argument("--reconcile", action="store_true", help="Reconcile statement totals and re-extract failures.")
+    parser.add_argument("--bad-rate", type=float, default=0.0,
+                        help="Fraction of statement answers with a misread amount (fixed by the strict prompt).")
+    parser.add_argument("--page-tokens", type=int, default=258, help="Fake model input tokens per PDF page.")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Fake model latency per PDF page, in seconds.")
+    parser.add_argument("--model-rpm", type=float, default=100_000)
+    parser.add_argument("--sheets-quota", type=int, default=60, help="Sheets requests per minute, per worksheet.")
+    parser.add_argument("--flush-rows", type=int, default=5000)
+    options = parser.parse_args()
+
+    pipelines = ["statements", "tax"] if options.pipeline == "both" else [options.pipeline]
+    for size in options.sizes:
+        for pipeline in pipelines:
+            bench(pipeline, size, options)
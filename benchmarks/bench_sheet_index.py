@@ -0,0 +1,94 @@
+# Benchmark for the sheet key index: what startup reads from a statements tab of
+# N rows with the old full-sheet scan (get_all_values) vs SheetKeyIndex, cold
+# (ranged batch_get of row 1 and the key columns) and warm (change token
+# unchanged, nothing read), plus the calls of a replacing upsert of 2% of the rows,
+# half of them changed (the rows are read once to compare, the changed half
+# written back in one batch_update).
+# The in-memory worksheet has no network, so "cells read" is the number that
+# scales with the real Sheets API's transfer time.
+#
+#   python -m benchmarks.bench_sheet_index            # 10k and 100k rows
+#   python -m benchmarks.bench_sheet_index 5000 50000
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from backends import MemorySpreadsheet
+from data_cleaner import SHEET_HEADERS
+from Pdfs_data_extracted import SHEET_KEY_COLUMNS
+from sheet_index import SheetKeyIndex
+from sheet_writer import BufferedSheetWriter
+
+STREETS = ["King St", "Princess Street", "Brock St", "Division Street", "Union St"]
+OWNERS = ["Jane Doe", "John Smith", "Acme Holdings Inc", "R Patel"]
+
+
+def synthetic_rows(n, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        year, month = 2020 + i // 12 % 6, i % 12 + 1
+        row = [round(rng.uniform(0, 5000), 2) for _ in SHEET_HEADERS]
+        row[0] = rng.choice(OWNERS)
+        row[1] = "K7M 1A1"
+        row[2] = f"{year}-{month:02d}-01 - {year}-{month:02d}-28"
+        row[3] = f"{i // 72 + 1} {rng.choice(STREETS)}"
+        rows.append(row)
+    return rows
+
+
+def bench(n):
+    workdir = tempfile.mkdtemp(prefix="bench_sheet_index_")
+    try:
+        path = os.path.join(workdir, "index.sqlite")
+        rows = synthetic_rows(n)
+        spreadsheet = MemorySpreadsheet(read_quota_per_minute=None, write_quota_per_minute=None)
+        sheet = spreadsheet.sheet1
+        sheet.rows = [list(SHEET_HEADERS)] + [list(row) for row in rows]
+
+        start = time.perf_counter()
+        values = sheet.get_all_values()
+        keys = {(row[0].strip(), row[2].strip(), row[3].strip()) for row in values[1:]}
+        scan_seconds = time.perf_counter() - start
+        scan_cells = sum(len(row) for row in values)
+
+        start = time.perf_counter()
+        index = SheetKeyIndex(spreadsheet, sheet, SHEET_HEADERS, SHEET_KEY_COLUMNS, path)
+        cold_seconds = time.perf_counter() - start
+        cold_cells = len(SHEET_HEADERS) + len(SHEET_KEY_COLUMNS) * n
+        assert len(index.rows) == len(keys), (len(index.rows), len(keys))
+        index.save()
+        index.close()
+
+        start = time.perf_counter()
+        index = SheetKeyIndex(spreadsheet, sheet, SHEET_HEADERS, SHEET_KEY_COLUMNS, path)
+        warm_seconds = time.perf_counter() - start
+        assert index.from_cache and len(index.rows) == len(keys)
+
+        changed = [list(row) for row in rows[:: 100]]
+        for row in changed:
+            row[4] += 1
+        unchanged = [list(row) for row in rows[1:: 100]]
+        calls_before = spreadsheet.api_calls()
+        with BufferedSheetWriter(sheet, flush_rows=len(changed) + 1, first_flush_seconds=3600) as writer:
+            statuses = index.upsert(writer, changed + unchanged, replace=True)
+        index.close()
+        assert statuses.count("updated") == len(changed) and statuses.count(None) == len(unchanged)
+        assert all(sheet.rows[i * 100 + 1][4] == row[4] for i, row in enumerate(changed))
+
+        print(f"{n:>8} rows | full scan {scan_cells:>10,} cells {scan_seconds * 1000:>7.1f} ms | "
+              f"key index cold {cold_cells:>9,} cells {cold_seconds * 1000:>7.1f} ms | "
+              f"warm 0 cells {warm_seconds * 1000:>7.1f} ms | "
+              f"upsert {len(changed) + len(unchanged):,} rows ({len(changed):,} changed) in "
+              f"{spreadsheet.api_calls() - calls_before} call(s)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,158 @@
+# Minimal PDF writer for the benchmarks: real text-layer PDFs (Helvetica, one
+# content stream per page) laid out like the owner statements the extraction
+# prompt describes — a label column on the left, one column per property with
+# its address on top, and the owner / period / "Prepared by" block at the
+# bottom of the last page. No third-party dependencies.
+import random
+
+from statement_schema import LABELS, keys_in_group
+
+# Helvetica advance widths (1/1000 em) for the characters used in amounts.
+AMOUNT_WIDTHS = {**{d: 556 for d in "0123456789"}, ",": 278, ".": 278, "-": 333, "(": 333, ")": 333, "$": 556}
+
+INCOME_KEYS = [LABELS[key] for key in keys_in_group("income")]
+EXPENSE_KEYS = [LABELS[key] for key in keys_in_group("expense")]
+STREETS = ["King St", "Princess Street", "Brock St", "Division Street", "Union St", "Johnson Street"]
+OWNERS = ["Jane Doe", "John Smith", "Acme Holdings Inc", "R Patel"]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _amount_width(text, size):
+    return sum(AMOUNT_WIDTHS.get(ch, 556) for ch in text) * size / 1000
+
+
+def pdf_bytes(pages, width=792, height=612):
+    # pages: list of [(x, y, size, text, bold), ...]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>",
+    ]
+    page_ids = []
+    for items in pages:
+        stream = "\n".join(
+            f"BT /{'F2' if bold else 'F1'} {size} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET"
+            for x, y, size, text, bold in items
+        ).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> "
+            b"/Contents %d 0 R >>" % (width, height, content_id)
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+# === RECONCILING STATEMENT DATA === #
+# Records use the prompt's keys; totals add up, as on a real statement.
+def statement_records(properties, seed=0):
+    rng = random.Random(seed)
+    owner = rng.choice(OWNERS)
+    year, month = rng.choice([2023, 2024, 2025]), rng.randint(1, 12)
+    footer = f"Prepared by Limestone Property Management, 1 Bath Rd, Kingston ON K7M {rng.randint(1, 9)}A{rng.randint(1, 9)}"
+    records = []
+    for _ in range(properties):
+        rec = {
+            "Owner Name": owner,
+            "Left Corner Address and Postal Code": footer,
+            "Statement Period": f"{year}-{month:02d}-01 - {year}-{month:02d}-28",
+            "Statement Date": f"{year}-{month:02d}-28",
+            "Address": f"{rng.randint(1, 400)} {rng.choice(STREETS)}",
+        }
+        income = 0.0
+        for key in INCOME_KEYS:
+            value = round(rng.uniform(900, 2500), 2) if key == "Rent Income" or rng.random() < 0.2 else None
+            rec[key] = f"{value:,.2f}" if value is not None else ""
+            income += value or 0.0
+        expenses = 0.0
+        for key in EXPENSE_KEYS:
+            value = round(rng.uniform(10, 400), 2) if rng.random() < 0.3 else None
+            rec[key] = f"{value:,.2f}" if value is not None else ""
+            expenses += value or 0.0
+        rec["Total Income"] = f"{income:,.2f}"
+        rec["Total Expenses"] = f"{expenses:,.2f}"
+        rec["Net Income"] = f"{income - expenses:,.2f}"
+        records.append(rec)
+    return records
+
+
+def statement_pdf_bytes(records, filler_pages=0):
+    size, label_x, first_col, col_width, top = 7, 30, 420, 110, 560
+    pdf_label = {key: key.replace("–", "-") for key in LABELS.values()}
+    items = []
+    for i, rec in enumerate(records):
+        items.append((first_col + i * col_width - 90, top, size, rec["Address"], True))
+
+    y = top - 24
+    rows = [("Income", None)] + [(key, key) for key in INCOME_KEYS] + [("Total Income", "Total Income")]
+    rows += [("Expenses", None)] + [(pdf_label[key], key) for key in EXPENSE_KEYS]
+    rows += [("Total Expenses", "Total Expenses"), ("Net Income", "Net Income")]
+    for label, key in rows:
+        values = [rec.get(key, "") for rec in records] if key else []
+        if key and not any(values) and key not in ("Total Income", "Total Expenses", "Net Income"):
+            continue  # statements only print the lines that have an amount somewhere
+        items.append((label_x, y, size, label, key is None))
+        for i, value in enumerate(values):
+            if value:
+                right = first_col + i * col_width
+                items.append((right - _amount_width(value, size), y, size, value, False))
+        y -= 11
+
+    footer = records[0]
+    prepared_by, _, postal_block = footer["Left Corner Address and Postal Code"].partition(", ")
+    items += [
+        (label_x, 60, size, prepared_by, False),
+        (label_x, 50, size, postal_block, False),
+        (label_x, 36, size, f"Owner: {footer['Owner Name']}", False),
+        (first_col, 50, size, f"Statement period: {footer['Statement Period']}", False),
+        (first_col, 40, size, f"Statement date: {footer['Statement Date']}", False),
+    ]
+    filler = [[(label_x, top, size, f"Notes page {n + 1}: nothing to extract here.", False)] for n in range(filler_pages)]
+    return pdf_bytes(filler + [items])
+
+
+# === TAX NOTICE: cover letter, levy table, remittance stub, information page === #
+# Only the levy table holds facts the tax prompt asks for.
+def tax_notice_pdf_bytes(seed=0):
+    rng = random.Random(seed)
+    size, x = 8, 40
+    address = f"{rng.randint(1, 999)} {rng.choice(STREETS)}"
+    assessment = round(rng.uniform(200_000, 900_000), 2)
+    levy = [(year, rate, round(assessment * rate / 100, 2)) for year, rate in ((2023, 1.444608), (2024, 1.478321))]
+    cover = [
+        (x, 560, size, "City of Kingston - Taxation Office", True),
+        (x, 540, size, "Dear property owner,", False),
+        (x, 528, size, "Your final property tax bill is enclosed. Please keep this notice for your records.", False),
+    ]
+    table = [
+        (x, 560, size, f"Property: {address}", True),
+        (x, 548, size, f"Roll Number: 1011-{rng.randint(100000, 999999)}", False),
+        (x, 536, size, f"Assessment Value: {assessment:,.2f}", False),
+        (x, 516, size, "Year      Tax Rate (%)      Property Tax Levy", True),
+    ] + [
+        (x, 504 - 12 * i, size, f"{year}      {rate:.6f}      {tax:,.2f}", False) for i, (year, rate, tax) in enumerate(levy)
+    ]
+    stub = [
+        (x, 560, size, "Remittance stub - detach and return with your payment", True),
+        (x, 548, size, f"Amount due: {levy[-1][2] / 2:,.2f}", False),
+    ]
+    info = [(x, 560, size, "Ways to pay: online banking, pre-authorized payments, or in person.", False)]
+    return pdf_bytes([cover, table, stub, info])
@@ -0,0 +1,273 @@
+import argparse
+import configparser
+import os
+import sys
+
+# Keep this module's imports to the standard library: `--dry-run` and
+# `--list-only` must start without loading pandas, vertexai or gspread. The
+# pipeline modules are imported inside the command handlers that need them.
+
+DEFAULT_CONFIG_PATH = "rental_insights.ini"
+ENV_PREFIX = "RENTAL_"
+
+# name -> (type, default, help, commands, interactive prompt)
+SETTINGS = {
+    "project_id": (str, None, "Google Cloud project ID.", ("statements", "tax"),
+                   "Enter your Google Cloud project ID: "),
+    "bucket": (str, None, "Cloud Storage bucket name.", ("statements", "tax"),
+               "Enter your Google Cloud bucket name: "),
+    "prefix": (str, None, "Folder path inside the bucket (e.g. batch1_MM/ or tax/).", ("statements", "tax"),
+               "Enter the folder path inside the bucket (e.g., batch1_MM/): "),
+    "sheet_name": (str, None, "Google Sheet name.", ("statements", "tax"),
+                   "Enter your Google Sheet name: "),
+    "local_root": (str, None, "Read PDFs from LOCAL_ROOT/<bucket>/ instead of Cloud Storage.",
+                   ("statements", "tax"), None),
+    "service_account_file": (str, None, "Path to the service account JSON.", ("statements", "tax"),
+                             "Enter the path to your service account file (e.g., sa.json): "),
+    "workers": (int, 4, "Concurrent extraction workers.", ("statements", "tax"), None),
+    "model_rpm": (float, 60.0, "Gemini requests-per-minute quota.", ("statements", "tax"), None),
+    "sheets_rpm": (float, 60.0, "Sheets write requests per minute.", ("statements", "tax"), None),
+    "batch_size": (int, 1, "PDFs per model request; above 1 the prompt is sent once as a cached prefix.",
+                   ("statements", "tax"), None),
+    "min_confidence": (float, 1.0, "With --local-text, share of layout checks a parsed PDF must pass to skip "
+                       "the model.", ("statements",), None),
+    "tolerance": (float, 0.01, "With --reconcile, how far (in dollars) a total may be from the sum of its parts.",
+                  ("statements",), None),
+    "flush_rows": (int, 500, "Rows to buffer per sheet write.", ("statements", "tax"), None),
+    "rate_version": (str, "kingston-residential-2025", "Built-in tax rate table version.",
+                     ("tax", "tax-recompute", "property-join"), None),
+    "rate_table": (str, None, "CSV (Year,Rate) overriding the built-in tax rate table.",
+                   ("tax", "tax-recompute", "property-join"), None),
+    "report_dir": (str, "run_reports", "Where each run's JSON report and Prometheus textfile are written.",
+                   ("statements", "tax"), None),
+    "cache_path": (str, ".extraction_cache.sqlite", "SQLite file holding cached model responses.",
+                   ("statements", "tax", "reclean", "tax-recompute", "property-join"), None),
+    "registry_path": (str, ".property_registry.sqlite", "SQLite file mapping raw addresses to property IDs.",
+                      ("property-join",), None),
+    "derived_cache_path": (str, ".derived_pdfs.sqlite", "SQLite file holding page-sliced PDFs (--slice-pages).",
+                           ("statements", "tax"), None),
+    "sheet_index_path": (str, ".sheet_index.sqlite", "SQLite file caching each sheet's key -> row index.",
+                         ("statements", "tax"), None),
+    "manifest_path": (str, ".ingestion_manifest.sqlite", "SQLite file recording already-ingested PDFs.",
+                      ("statements", "tax"), None),
+    "parquet_dir": (str, None, "Also write partitioned Parquet tables here (needs pyarrow).",
+                    ("statements", "tax", "reclean", "tax-recompute"), None),
+    "rollup_dir": (str, None, "Incrementally update rollup CSV tables here.", ("statements", "reclean"), None),
+    "output_dir": (str, "recleaned", "Where re-cleaned CSV tables are written.",
+                   ("reclean", "tax-recompute", "property-join"), None),
+}
+
+REQUIRED = {
+    "statements": ["project_id", "bucket", "sheet_name", "service_account_file"],
+    "tax": ["project_id", "bucket", "sheet_name", "service_account_file"],
+    "reclean": [],
+    "tax-recompute": [],
+    "property-join": [],
+}
+
+
+def _flag(name):
+    return "--" + name.replace("_", "-")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Rental insights pipeline. Settings come from flags, then RENTAL_* environment "
+                    "variables, then the config file ([<command>] section, then [common])."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "statements": "Extract owner statements into the main sheet and the Expenses Long tab.",
+        "tax": "Extract property tax levies into the Property Tax Summary tab.",
+        "reclean": "Re-clean cached model responses into CSV/Parquet tables without any model calls.",
+        "tax-recompute": "Recompute the property tax summary from cached facts (e.g. after a rate change) "
+                         "without any model calls.",
+        "property-join": "Match statement and tax addresses to registered properties and write net income "
+                         "after property tax per property and year, from cached responses.",
+    }
+    for command, help_text in helps.items():
+        sub = subparsers.add_parser(command, help=help_text, description=help_text)
+        sub.add_argument("--config", help=f"INI config file (default: $RENTAL_CONFIG or {DEFAULT_CONFIG_PATH}).")
+        for name, (kind, default, help_text, commands, _) in SETTINGS.items():
+            if command in commands:
+                sub.add_argument(_flag(name), dest=name, type=kind, default=None, help=help_text)
+        sub.add_argument("--dry-run", action="store_true", help="Print the resolved settings and exit.")
+        sub.add_argument("--no-input", action="store_true", help="Never prompt; fail if a required setting is missing.")
+        if command in ("statements", "tax"):
+            sub.add_argument("--list-only", action="store_true",
+                             help="List the PDFs that would be processed (new/changed/failed) and exit.")
+            sub.add_argument("--refresh", action="store_true",
+                             help="Re-extract every PDF, ignoring cached model responses and the ingestion manifest, "
+                                  "and rewrite rows whose values changed.")
+            sub.add_argument("--all", action="store_true", help="Ignore the ingestion manifest and process every PDF.")
+            sub.add_argument("--profile-clean", action="store_true",
+                             help="Run the cleaning stage under cProfile and save the stats next to the run report.")
+            sub.add_argument("--slice-pages", action="store_true",
+                             help="Send the model only the pages it extracts from (needs pypdf).")
+        if command == "statements":
+            sub.add_argument("--local-text", action="store_true",
+                             help="Parse each PDF's text layer locally first (needs pypdf); only scans and "
+                                  "statements that don't reconcile go to the model.")
+            sub.add_argument("--reconcile", action="store_true",
+                             help="Check each row's income, expense and net totals; re-extract PDFs with failing "
+                                  "rows using a stricter prompt and quarantine rows that still fail.")
+            sub.add_argument("--no-reextract", action="store_true",
+                             help="With --reconcile, quarantine failing rows without re-extracting.")
+    return parser
+
+
+def load_config(path):
+    config = configparser.ConfigParser()
+    if path is None:
+        path = os.environ.get(ENV_PREFIX + "CONFIG")
+        if path is None and os.path.exists(DEFAULT_CONFIG_PATH):
+            path = DEFAULT_CONFIG_PATH
+    if path:
+        if not config.read(path, encoding="utf-8"):
+            raise SystemExit(f"Config file not found: {path}")
+    return config
+
+
+def resolve_settings(args):
+    config = load_config(args.config)
+    interactive = not args.no_input and sys.stdin.isatty()
+    settings = {}
+    for name, (kind, default, _, commands, prompt) in SETTINGS.items():
+        if args.command not in commands:
+            continue
+        value = getattr(args, name)
+        if value is None:
+            value = os.environ.get(ENV_PREFIX + name.upper())
+        for section in (args.command, "common"):
+            if value is None and config.has_option(section, name):
+                value = config.get(section, name)
+        must_have = name in REQUIRED[args.command] and not args.dry_run
+        # Listing only needs the bucket, plus credentials when it isn't a local directory.
+        if getattr(args, "list_only", False) and name != "bucket":
+            must_have = must_have and name == "service_account_file" and not settings.get("local_root")
+        if value is None and must_have and interactive and prompt:
+            value = input(prompt).strip() or None
+        if value is None:
+            if must_have:
+                raise SystemExit(f"Missing setting '{name}': pass {_flag(name)}, set "
+                                 f"{ENV_PREFIX}{name.upper()} or add it to the config file.")
+            value = default
+        settings[name] = kind(value) if value is not None else None
+    settings["prefix"] = settings.get("prefix") or ""
+    return settings
+
+
+# === BACKENDS (constructed lazily; no client is created until first use) === #
+def make_storage(settings):
+    from backends import GCSStorage, LocalStorage
+    if settings.get("local_root"):
+        return LocalStorage(settings["local_root"])
+    return GCSStorage(settings["service_account_file"])
+
+
+def make_model_and_spreadsheet(settings, model_name, response_schema=None):
+    from backends import GoogleSpreadsheet, VertexModel
+    model = VertexModel(
+        model_name, settings["project_id"], settings["service_account_file"], response_schema=response_schema
+    )
+    spreadsheet = GoogleSpreadsheet(settings["service_account_file"], settings["sheet_name"])
+    return model, spreadsheet
+
+
+# === COMMANDS === #
+def list_only(command, settings):
+    from backends import StorageError
+    from extraction_cache import blob_uri
+    from ingestion_manifest import IngestionManifest
+    pipeline = "statements" if command == "statements" else "property_tax"
+    try:
+        blobs = make_storage(settings).list_pdfs(settings["bucket"], settings["prefix"])
+    except StorageError as e:
+        raise SystemExit(f"Storage error: {e}")
+    manifest = IngestionManifest(pipeline, settings["manifest_path"])
+    counts = {}
+    for blob, state in manifest.classify(blobs):
+        counts[state] = counts.get(state, 0) + 1
+        print(f"{state:8} {blob_uri(blob)}")
+    manifest.close()
+    print(f"{len(blobs)} PDF(s): " + ", ".join(f"{n} {state}" for state, n in sorted(counts.items())))
+
+
+def run_pipeline(command, args, settings):
+    if command == "statements":
+        import Pdfs_data_extracted as pipeline
+    else:
+        import property_tax_script as pipeline
+    storage = make_storage(settings)
+    model, spreadsheet = make_model_and_spreadsheet(
+        settings, pipeline.MODEL_NAME, getattr(pipeline, "RESPONSE_SCHEMA", None)
+    )
+    options = dict(
+        max_workers=settings["workers"], model_rpm=settings["model_rpm"], sheets_rpm=settings["sheets_rpm"],
+        flush_rows=settings["flush_rows"], batch_size=settings["batch_size"], refresh=args.refresh, process_all=args.all,
+        cache_path=settings["cache_path"], manifest_path=settings["manifest_path"],
+        parquet_dir=settings["parquet_dir"], report_dir=settings["report_dir"], profile_clean=args.profile_clean,
+        slice_pages=args.slice_pages, derived_cache_path=settings["derived_cache_path"],
+        sheet_index_path=settings["sheet_index_path"]
+    )
+    if command == "statements":
+        options["rollup_dir"] = settings["rollup_dir"]
+        options["local_text"] = args.local_text
+        options["min_confidence"] = settings["min_confidence"]
+        options["reconcile_tolerance"] = settings["tolerance"] if args.reconcile else None
+        options["reextract"] = not args.no_reextract
+    else:
+        options["rate_version"] = settings["rate_version"]
+        options["rate_table_path"] = settings["rate_table"]
+    summary = pipeline.run(storage, model, spreadsheet, settings["bucket"], settings["prefix"], **options)
+    print(f"\nDone: {summary['pdfs']} PDF(s), {summary['rows']} new row(s), {summary['failed']} failed.")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = resolve_settings(args)
+
+    if args.dry_run:
+        print(f"[dry run] command: {args.command}")
+        for name, value in settings.items():
+            print(f"  {name} = {value!r}")
+        for flag in ("refresh", "all", "profile_clean", "slice_pages", "local_text", "reconcile", "no_reextract"):
+            if hasattr(args, flag):
+                print(f"  {flag} = {getattr(args, flag)!r}")
+        return 0
+
+    if getattr(args, "list_only", False):
+        list_only(args.command, settings)
+        return 0
+
+    if args.command == "reclean":
+        import Pdfs_data_extracted
+        Pdfs_data_extracted.reclean(
+            settings["cache_path"], settings["output_dir"],
+            parquet_dir=settings["parquet_dir"], rollup_dir=settings["rollup_dir"]
+        )
+        return 0
+
+    if args.command == "tax-recompute":
+        import property_tax_script
+        property_tax_script.recompute(
+            settings["cache_path"], settings["output_dir"], parquet_dir=settings["parquet_dir"],
+            rate_version=settings["rate_version"], rate_table_path=settings["rate_table"]
+        )
+        return 0
+
+    if args.command == "property-join":
+        from property_registry import build_property_year_table
+        build_property_year_table(
+            settings["cache_path"], settings["registry_path"], settings["output_dir"],
+            rate_version=settings["rate_version"], rate_table_path=settings["rate_table"]
+        )
+        return 0
+
+    run_pipeline(args.command, args, settings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,83 +1,130 @@
 import pandas as pd
 import re
+from functools import lru_cache
+
+from statement_schema import (  # noqa: F401  (re-exported for the pipelines)
+    EXPENSE_COLUMNS, INCOME_COLUMNS, KEY_COLUMNS, LABEL_COLUMNS, LABEL_KEYS, SHEET_HEADERS, TEXT_COLUMNS
+)
+
+# === PRECOMPILED PATTERNS === #
+CURRENCY_RE = re.compile(r"[$,]")
+POSTAL_CODE_RE = re.compile(r'(\b[A-Za-z]\d[A-Za-z][ -]?\d[A-Za-z]\d\b)')
+PERIOD_DATE_RE = re.compile(r'(\d{4})-(\d{2})-\d{2}')
+PERIOD_YEAR_RE = re.compile(r'(\d{4})')
+WHITESPACE_RE = re.compile(r"\s+")
+ADDRESS_PUNCT_RE = re.compile(r"[.,]")
+
+# Statement label -> sheet column (None = drop). Responses keyed by the short
+# schema keys are renamed with KEY_COLUMNS; see statement_schema.FIELDS.
+RENAME_MAP = LABEL_COLUMNS
+
+MONTH_NAMES = {
+    "01": "January", "02": "February", "03": "March", "04": "April",
+    "05": "May", "06": "June", "07": "July", "08": "August",
+    "09": "September", "10": "October", "11": "November", "12": "December"
+}
+
+EXPENSE_ID_COLUMNS = ["Owner", "Property Address", "Statement Period"]
+
+# Lists the numeric fields of a row that were present but didn't parse (and so
+# became 0). Not part of SHEET_HEADERS; reconciliation reads it.
+UNPARSED_COLUMN = "Unparsed Fields"
+BLANK_VALUES = ["", "-", "n/a", "na", "none", "null", "nan"]
+
+
+# The same few hundred addresses repeat every month, so each distinct string is
+# standardized once per process.
+@lru_cache(maxsize=65536)
+def standardize_address(address):
+    address = WHITESPACE_RE.sub(" ", address.strip().lower())
+    return ADDRESS_PUNCT_RE.sub("", address).title()
+
 
 def clean_data(df):
+    # Works on any number of rows: every step below is a column-wise operation,
+    # so a whole PDF (or a whole run) is cleaned in one pass.
+
     # === 1. Fill NaNs with 0 === #
-    df.fillna(0, inplace=True)
+    # Text columns become object first: pandas 3's str dtype rejects a 0, and a
+    # key missing from some records of a batch leaves NaNs in them.
+    text = [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])]
+    df = df.astype({col: object for col in text}).fillna(0)
 
     # === 2. Convert currency columns to float (remove $ and commas) === #
+    # Only text columns need it: responses under the response schema already
+    # carry amounts as numbers.
     for col in df.columns:
-        df[col] = df[col].astype(str).str.replace("$", "", regex=False).str.replace(",", "")
-
-    # === 3. Shorten column names === #
-    rename_map = {
-        "Owner Name": "Owner",
-        "Left Corner Address and Postal Code": "Postal Code",
-        "Statement Date": None,
-        "Address": "Property Address",
-        "Rent Income": "Rent",
-        "NSF Fee Income": "NSF Income",
-        "Maintenance Income": "Maintenance",
-        "Total Income": "Income Total",
-        "6800 - Common Area Repairs - 6865 - General Repairs/Maintenance": "General Repairs",
-        "6910 - Unit Repairs and Maintenance - Appliance Repair - 6915": "Appliance Repair",
-        "6700 - Billable Operating Expenses - 6710 - Advertising": "Advertising",
-        "6700 - Billable Operating Expenses - 6728 - Lease Up Expense": "Lease Up (Billable)",
-        "6800 - Common Area Repairs - 6890 - Plumbing Repairs": "Plumbing",
-        "Condo Fees": "Condo Fees",
-        "General Office Expenses - 6500 - 6585 - Management Fee Expense": "Mgmt Fee",
-        "6800 - Common Area Repairs - 6860 Garbage/Large Item Removal": "Garbage Removal",
-        "6740 - Occupancy Costs - 6760 – Hydro": "Hydro",
-        "6700 - Billable Operating Expenses – 6727": "Other Billable",
-        "6800 - Common Area Repairs - 6835 Electrical Repair": "Electrical",
-        "6700 - Non Billable Operating Expenses 6727 - Credit Check": "Credit Check (NB)",
-        "6700 - Non Billable Operating Expenses 6728 - Lease Up Expense": "Lease Up (NB)",
-        "6910 - Unit Repairs and Maintenance - Unit Cleaning - 6950": "Unit Cleaning",
-        "NSF Fee (Expense)": "NSF Expense",
-        "Total Expenses": "Expenses",
-        "Net Income": "Net"
-    }
-
-    df.rename(columns={k: v for k, v in rename_map.items() if v is not None}, inplace=True)
-    df.drop(columns=[k for k, v in rename_map.items() if v is None], inplace=True, errors='ignore')
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(str).str.replace(CURRENCY_RE, "", regex=True)
+
+    # === 3. Shorten column names (statement labels or short schema keys) === #
+    for column_map in (RENAME_MAP, KEY_COLUMNS):
+        df.rename(columns={k: v for k, v in column_map.items() if v is not None}, inplace=True)
+        df.drop(columns=[k for k, v in column_map.items() if v is None], inplace=True, errors='ignore')
 
     # === 4. Extract Postal Code from address string === #
     if "Postal Code" in df.columns:
-        df["Postal Code"] = df["Postal Code"].astype(str).str.extract(
-            r'(\b[A-Za-z]\d[A-Za-z][ -]?\d[A-Za-z]\d\b)', expand=False
-        ).fillna("")
+        df["Postal Code"] = df["Postal Code"].astype(str).str.extract(POSTAL_CODE_RE, expand=False).fillna("")
 
     # === 5. Extract Month and Year from Statement Period === #
     if "Statement Period" in df.columns:
         df["Statement Period"] = df["Statement Period"].astype(str)
-        df["Period Month"] = df["Statement Period"].str.extract(r'(\d{4})-(\d{2})-\d{2}', expand=True)[1]
-        df["Period Year"] = df["Statement Period"].str.extract(r'(\d{4})', expand=False)
+        df["Period Month"] = df["Statement Period"].str.extract(PERIOD_DATE_RE, expand=True)[1]
+        df["Period Year"] = df["Statement Period"].str.extract(PERIOD_YEAR_RE, expand=False)
 
-        df["Period Month"] = df["Period Month"].map({
-            "01": "January", "02": "February", "03": "March", "04": "April",
-            "05": "May", "06": "June", "07": "July", "08": "August",
-            "09": "September", "10": "October", "11": "November", "12": "December"
-        })
+        df["Period Month"] = df["Period Month"].map(MONTH_NAMES)
 
     # === 6. Standardize Property Address === #
     if "Property Address" in df.columns:
-        df["Property Address"] = (
-            df["Property Address"]
-            .astype(str)
-            .str.strip()
-            .str.lower()
-            .str.replace(r"\s+", " ", regex=True)
-            .str.replace(r"[.,]", "", regex=True)
-            .str.title()
-        )
+        df["Property Address"] = df["Property Address"].astype(str).map(standardize_address)
 
     # === 7. Ensure all numeric columns are valid float (0 if blank or invalid) === #
+    unparsed = pd.Series("", index=df.index)
     for col in df.columns:
-        if col not in ["Owner", "Property Address", "Postal Code", "Statement Period", "Period Month", "Period Year"]:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(float)
+        if col not in TEXT_COLUMNS:
+            values = pd.to_numeric(df[col], errors='coerce')
+            invalid = values.isna() & ~df[col].astype(str).str.strip().str.lower().isin(BLANK_VALUES)
+            if invalid.any():
+                unparsed = unparsed.mask(invalid, unparsed + col + ", ")
+            df[col] = values.fillna(0).astype(float)
+    df[UNPARSED_COLUMN] = unparsed.str.rstrip(", ")
 
     # === 8. Drop summary rows like "All Properties" === #
     if "Property Address" in df.columns:
         df = df[df["Property Address"].str.lower() != "all properties"]
 
     return df
+
+
+# === CLEAN A LIST OF RAW MODEL RECORDS IN ONE PASS === #
+# Answers cached before the short-key schema are keyed by the statement labels,
+# so a batch mixing both forms (e.g. a whole cache in reclean) has two columns
+# per field; they are merged into one, keyed by the short key, first.
+def clean_records(records):
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame.from_records(records)
+    keys = df.columns.map(lambda col: LABEL_KEYS.get(col, col))
+    if keys.has_duplicates:
+        df = pd.DataFrame(
+            {key: df.loc[:, keys == key].astype(object).bfill(axis=1).iloc[:, 0] for key in dict.fromkeys(keys)}
+        )
+    return clean_data(df).reset_index(drop=True)
+
+
+# === WIDE -> LONG EXPENSES (one row per non-zero expense cell, or per cell) === #
+def melt_expenses(df, id_columns=EXPENSE_ID_COLUMNS, drop_zero=True):
+    id_columns = list(id_columns)
+    long_columns = id_columns + ["Expense Category", "Amount"]
+    value_vars = [col for col in EXPENSE_COLUMNS if col in df.columns]
+    if df.empty or not value_vars:
+        return pd.DataFrame(columns=long_columns)
+
+    long_df = df.melt(
+        id_vars=id_columns, value_vars=value_vars,
+        var_name="Expense Category", value_name="Amount", ignore_index=False
+    )
+    if drop_zero:
+        long_df = long_df[long_df["Amount"] != 0]
+    # Keep the per-row order (each property's expenses together, in EXPENSE_COLUMNS order).
+    return long_df.sort_index(kind="stable")[long_columns].reset_index(drop=True)
@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = ".extraction_cache.sqlite"
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def blob_uri(blob):
+    # Local stand-in blobs (backends.LocalBlob) carry their own file:// URI.
+    uri = getattr(blob, "uri", None)
+    if uri:
+        return uri
+    return f"gs://{blob.bucket.name}/{blob.name}"
+
+
+# === CONTENT-ADDRESSED CACHE OF RAW MODEL RESPONSES === #
+# Keyed by the blob's content hash + generation, the prompt hash and the model
+# name, so a rerun over unchanged PDFs never pays for another model call while
+# any change to the file, the prompt or the model misses the cache.
+class ExtractionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=512 * 1024 * 1024, max_age_days=365):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                source_uri TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                response_text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(blob, prompt, model_name):
+        content_id = blob.md5_hash or blob.crc32c or ""
+        parts = [blob_uri(blob), content_id, str(blob.generation or ""), prompt_hash(prompt), model_name]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, cache_key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response_text FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, cache_key, source_uri, model_name, prompt, response_text):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, source_uri, model_name, prompt_hash(prompt), response_text,
+                 len(response_text.encode("utf-8")), now, now)
+            )
+            self.conn.commit()
+
+    # Latest cached response per source, for re-cleaning without any model calls.
+    # `model_name` may be one name or several.
+    def iter_responses(self, model_name=None, prompt=None):
+        query = "SELECT source_uri, response_text FROM responses WHERE 1 = 1"
+        params = []
+        if model_name is not None:
+            names = [model_name] if isinstance(model_name, str) else list(model_name)
+            query += f" AND model_name IN ({', '.join('?' * len(names))})"
+            params += names
+        if prompt is not None:
+            query += " AND prompt_hash = ?"
+            params.append(prompt_hash(prompt))
+        query += " ORDER BY source_uri, created_at"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        latest = {}
+        for source_uri, response_text in rows:
+            latest[source_uri] = response_text
+        yield from latest.items()
+
+    # Drop entries older than max_age, then least-recently-used ones until under max_bytes.
+    def evict(self):
+        with self.lock:
+            cutoff = time.time() - self.max_age_seconds
+            removed = self.conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for cache_key, size in self.conn.execute(
+                    "SELECT cache_key, size FROM responses ORDER BY last_access"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                    total -= size
+                    removed += 1
+            self.conn.commit()
+        return removed
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
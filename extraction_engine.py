@@ -0,0 +1,196 @@
+import queue
+import random
+import threading
+import time
+
+# HTTP status codes that mean "slow down" rather than "this request is broken".
+# google.api_core (TooManyRequests, ResourceExhausted, ServiceUnavailable) and
+# gspread's APIError both expose the status as `.code`.
+RETRYABLE_CODES = {429, 503}
+
+
+# === TOKEN BUCKET RATE LIMITER === #
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None, min_rate_per_minute=None):
+        self.max_rate = float(rate_per_minute)
+        self.rate = self.max_rate
+        self.min_rate = float(min_rate_per_minute or max(1.0, self.max_rate / 8))
+        self.capacity = float(burst or max(1.0, self.max_rate / 60))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60.0)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * 60.0 / self.rate
+            time.sleep(wait)
+
+    # Halve the rate when the backend throttles us, creep back up on success.
+    def throttled(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+def is_retryable(error):
+    code = getattr(error, "code", None)
+    if code is None:
+        response = getattr(error, "response", None)
+        code = getattr(response, "status_code", None)
+    try:
+        return int(code) in RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+# === CALL WITH ADAPTIVE BACKOFF === #
+# `on_retry(error, delay)` is called before each backoff sleep (e.g. to count retries).
+def call_with_backoff(fn, *args, limiter=None, max_retries=6, base_delay=2.0, max_delay=120.0, on_retry=None,
+                      **kwargs):
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            if limiter is not None:
+                limiter.throttled()
+            delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            print(f"Rate limited ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            if on_retry is not None:
+                on_retry(e, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.succeeded()
+        return result
+
+
+# === STREAMING STAGES WITH BOUNDED QUEUES === #
+# listing -> extraction workers -> transform (cleaning) -> caller (writers).
+#
+# A feeder thread pulls items lazily from `source` (e.g. a paginated blob
+# listing), `max_workers` threads run `extract`, one thread puts results back in
+# source order and runs `transform` on them, and the caller consumes
+# (item, result, error) tuples in that same order, so dedup and writes stay
+# deterministic. At most `max_in_flight` items exist between the feeder and the
+# caller at any time, which gives backpressure and keeps memory flat however
+# long the listing is. `on_tick` is called on the caller's thread about every
+# `tick_seconds`, between results and while waiting for one (e.g. to flush
+# buffered writes on time while a slow extraction is in flight).
+_DONE = object()
+
+
+class _SourceFailed:
+    def __init__(self, error):
+        self.error = error
+
+
+def stream_in_order(source, extract, transform=None, max_workers=4, max_in_flight=None, on_tick=None,
+                    tick_seconds=1.0):
+    max_workers = max(1, max_workers)
+    slots = threading.Semaphore(max_in_flight or max_workers * 16)
+    work_q = queue.Queue(maxsize=max_workers)
+    done_q = queue.Queue()
+    out_q = queue.Queue()
+    stop = threading.Event()
+
+    def feed():
+        count = 0
+        try:
+            for item in source:
+                while not slots.acquire(timeout=0.2):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                work_q.put((count, item))
+                count += 1
+        except Exception as e:
+            done_q.put(_SourceFailed(e))
+        finally:
+            for _ in range(max_workers):
+                work_q.put(_DONE)
+            done_q.put((_DONE, count))
+
+    def work():
+        while True:
+            task = work_q.get()
+            if task is _DONE:
+                return
+            seq, item = task
+            try:
+                done_q.put((seq, item, extract(item), None))
+            except Exception as e:
+                done_q.put((seq, item, None, e))
+
+    def reorder_and_transform():
+        pending = {}
+        next_seq = 0
+        total = None
+        while total is None or next_seq < total:
+            message = done_q.get()
+            if isinstance(message, _SourceFailed):
+                out_q.put(message)
+                return
+            if message[0] is _DONE:
+                total = message[1]
+            else:
+                pending[message[0]] = message[1:]
+            while next_seq in pending:
+                item, result, error = pending.pop(next_seq)
+                if error is None and transform is not None:
+                    try:
+                        result = transform(item, result)
+                    except Exception as e:
+                        result, error = None, e
+                out_q.put((item, result, error))
+                next_seq += 1
+        out_q.put(_DONE)
+
+    # Named so profilers (py-spy dump/record) show which stage each thread is.
+    threads = [
+        threading.Thread(target=feed, name="feeder", daemon=True),
+        threading.Thread(target=reorder_and_transform, name="transform", daemon=True),
+    ]
+    threads += [threading.Thread(target=work, name=f"extract-{i}", daemon=True) for i in range(max_workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        last_tick = time.monotonic()
+        while True:
+            if on_tick is not None and time.monotonic() - last_tick >= tick_seconds:
+                on_tick()
+                last_tick = time.monotonic()
+            try:
+                message = out_q.get(timeout=tick_seconds if on_tick is not None else None)
+            except queue.Empty:
+                continue
+            if message is _DONE:
+                return
+            if isinstance(message, _SourceFailed):
+                raise message.error
+            yield message
+            slots.release()
+    finally:
+        stop.set()
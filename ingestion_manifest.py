@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import time
+
+DEFAULT_MANIFEST_PATH = ".ingestion_manifest.sqlite"
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+# === INCREMENTAL INGESTION MANIFEST === #
+# Remembers every blob a pipeline has seen (name, generation, status, row count,
+# timestamp) so listing can skip PDFs that were already ingested successfully
+# and only hand new, changed (new generation) or previously failed blobs to the
+# model.
+class IngestionManifest:
+    def __init__(self, pipeline, path=DEFAULT_MANIFEST_PATH):
+        self.pipeline = pipeline
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS blobs (
+                pipeline TEXT NOT NULL,
+                name TEXT NOT NULL,
+                generation TEXT NOT NULL,
+                status TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (pipeline, name)
+            )"""
+        )
+        self.conn.commit()
+
+    def _known(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, generation, status FROM blobs WHERE pipeline = ?", (self.pipeline,)
+            ).fetchall()
+        return {name: (generation, status) for name, generation, status in rows}
+
+    # (blob, state) for each blob, where state is "new", "changed", "failed" or "done".
+    def classify(self, blobs):
+        known = self._known()
+        for blob in blobs:
+            seen = known.get(blob.name)
+            if seen is None:
+                yield blob, "new"
+            elif seen[0] != str(blob.generation or ""):
+                yield blob, "changed"
+            elif seen[1] != STATUS_DONE:
+                yield blob, STATUS_FAILED
+            else:
+                yield blob, STATUS_DONE
+
+    def pending(self, blobs):
+        todo = []
+        skipped = 0
+        for blob, state in self.classify(blobs):
+            if state == STATUS_DONE:
+                skipped += 1
+                continue
+            todo.append(blob)
+        print(f"Manifest: {len(todo)} new/changed/failed PDF(s), {skipped} already ingested.")
+        return todo
+
+    # Streaming variant of pending() for lazily listed blobs. The names of blobs
+    # that changed since they were ingested are added to `changed` as they go by,
+    # so the caller can replace the rows their previous version wrote.
+    # `include_done` (--all) yields the already ingested blobs too.
+    def iter_pending(self, blobs, changed=None, include_done=False):
+        for blob, state in self.classify(blobs):
+            if state == "changed" and changed is not None:
+                changed.add(blob.name)
+            if include_done or state != STATUS_DONE:
+                yield blob
+
+    def _record(self, entries):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.pipeline, blob.name, str(blob.generation or ""), status, row_count, error, now)
+                 for blob, status, row_count, error in entries]
+            )
+            self.conn.commit()
+
+    def mark_done(self, blob, row_count):
+        self._record([(blob, STATUS_DONE, row_count, None)])
+
+    def mark_done_many(self, results):
+        self._record([(blob, STATUS_DONE, row_count, None) for blob, row_count in results])
+
+    def mark_failed(self, blob, error):
+        self._record([(blob, STATUS_FAILED, 0, str(error)[:1000])])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
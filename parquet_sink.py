@@ -0,0 +1,257 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+UNKNOWN_PARTITION = "unknown"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _partition_value(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == "":
+        return UNKNOWN_PARTITION
+    return re.sub(r"[\\/=]", "_", str(value).strip())
+
+
+def _move_into(source, target):
+    if not os.path.exists(target):
+        os.replace(source, target)
+        return
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            _move_into(path, os.path.join(target, name))
+        else:
+            os.replace(path, os.path.join(target, name))
+    os.rmdir(source)
+
+
+# === PARTITIONED PARQUET SINK === #
+# Buffers cleaned rows for a run and writes one new part file per partition on
+# flush (append-only: existing files are never rewritten). Files land under
+# <root>/<table>/<value>/<value>/... (e.g. pdf_extracted/2024/March) so readers
+# can load only the partitions they need. The partition columns are kept inside
+# each file, because Power BI's folder connector doesn't read them from the path;
+# the directories are deliberately not hive-style `col=value` names, which
+# pyarrow and pandas would parse into a second, differently typed copy of the
+# same columns. Partitions that accumulate `compact_threshold` part files are
+# merged back into one on close.
+#
+# Rows replaced in the sheet are replaced here too: remove() takes their old
+# values, and on flush each partition holding one of those `key_columns` keys
+# is rewritten without it, before the replacements are appended as usual.
+#
+# If the run fails the buffered rows and removals are dropped rather than
+# written, since some of them may never have reached the sheet; rows that did
+# are picked up by the next `reclean` / `tax-recompute`.
+#
+# With `rebuild` (reclean / tax-recompute, which hand over the full history)
+# the table is written to a hidden staging directory next to it and swapped in
+# on close, replacing the old table; if the run fails the old one is kept.
+class ParquetSink:
+    def __init__(self, root, table, columns, text_columns, partition_cols=("Period Year", "Period Month"),
+                 compact_threshold=16, key_columns=None, rebuild=False):
+        self.root = root
+        self.table = table
+        self.columns = list(columns)
+        self.text_columns = set(text_columns)
+        self.partition_cols = list(partition_cols)
+        self.key_columns = list(key_columns or [])
+        self.compact_threshold = compact_threshold
+        self.staging = os.path.join(root, f".{table}.rebuild-{uuid.uuid4().hex[:8]}") if rebuild else None
+        self.frames = []
+        self.removed = []
+        self.touched = set()
+        self.rows_written = 0
+        self.rows_removed = 0
+        self.lock = threading.Lock()
+        _require_pyarrow()
+        if self.staging is None:
+            self._rename_hive_dirs()
+
+    @property
+    def table_dir(self):
+        return self.staging or os.path.join(self.root, self.table)
+
+    def append(self, df):
+        if df is not None and not df.empty:
+            with self.lock:
+                self.frames.append(df)
+
+    def append_rows(self, rows):
+        if rows:
+            self.append(pd.DataFrame(rows, columns=self.columns))
+
+    def discard(self):
+        with self.lock:
+            dropped = sum(len(df) for df in self.frames)
+            self.frames, self.removed = [], []
+        return dropped
+
+    def _keys(self, df):
+        return list(zip(*[df[col].fillna("").astype(str).str.strip() for col in self.key_columns]))
+
+    # Rows buffered earlier in this run under a removed key are dropped right
+    # away; stored ones on flush.
+    def remove(self, df):
+        if df is None or df.empty:
+            return
+        if not self.key_columns:
+            raise ValueError(f"Parquet table '{self.table}' has no key columns to remove rows by.")
+        removed = set(self._keys(df))
+        with self.lock:
+            self.frames = [frame.loc[[key not in removed for key in self._keys(frame)]] for frame in self.frames]
+            self.removed.append(df[self.key_columns + self.partition_cols])
+
+    def remove_rows(self, rows):
+        if rows:
+            self.remove(pd.DataFrame(rows, columns=self.columns))
+
+    def _drop_removed(self, removed):
+        _, pq = _require_pyarrow()
+        dropped = 0
+        for key, group in removed.groupby(self.partition_cols, dropna=False, sort=True):
+            directory = self._partition_dir(key)
+            if not os.path.isdir(directory):
+                continue
+            parts = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+            if not parts:
+                continue
+            stored = pd.concat(
+                [pq.read_table(os.path.join(directory, f)).to_pandas() for f in parts], ignore_index=True
+            )
+            keys = set(self._keys(group))
+            keep = [key not in keys for key in self._keys(stored)]
+            if all(keep):
+                continue
+            if any(keep):
+                name = f"compacted-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+                self._write_file(stored.loc[keep], directory, name)
+            for f in parts:
+                os.remove(os.path.join(directory, f))
+            dropped += len(keep) - sum(keep)
+        return dropped
+
+    def _typed(self, df):
+        df = df.reindex(columns=self.columns)
+        for col in self.columns:
+            if col in self.text_columns:
+                df[col] = df[col].fillna("").astype(str)
+            else:
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype("float64")
+        return df
+
+    def _partition_dir(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        parts = [_partition_value(value) for _, value in zip(self.partition_cols, key)]
+        return os.path.join(self.table_dir, *parts)
+
+    # Tables written with hive-style `col=value` directories are moved to the
+    # plain layout, so appends and replacements find their existing partitions.
+    def _rename_hive_dirs(self, directory=None, depth=0):
+        directory = directory or self.table_dir
+        if depth >= len(self.partition_cols) or not os.path.isdir(directory):
+            return
+        prefix = f"{self.partition_cols[depth]}="
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.startswith(prefix) and os.path.isdir(path):
+                target = os.path.join(directory, name[len(prefix):])
+                _move_into(path, target)
+                path = target
+            self._rename_hive_dirs(path, depth + 1)
+
+    def _write_file(self, df, directory, name):
+        pa, pq = _require_pyarrow()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        tmp_path = path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def flush(self):
+        with self.lock:
+            frames, self.frames = self.frames, []
+            removed, self.removed = self.removed, []
+        if removed:
+            dropped = self._drop_removed(pd.concat(removed, ignore_index=True))
+            self.rows_removed += dropped
+            print(f"Removed {dropped} replaced row(s) from Parquet table '{self.table}'.")
+        if not frames:
+            return 0
+        df = self._typed(pd.concat(frames, ignore_index=True))
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        for key, group in df.groupby(self.partition_cols, dropna=False, sort=True):
+            directory = self._partition_dir(key)
+            self._write_file(group, directory, f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet")
+            self.touched.add(directory)
+        self.rows_written += len(df)
+        print(f"Wrote {len(df)} row(s) to Parquet table '{self.table}'.")
+        return len(df)
+
+    def compact(self, directories=None, min_files=None):
+        _, pq = _require_pyarrow()
+        min_files = min_files or self.compact_threshold
+        if directories is None:
+            directories = [dirpath for dirpath, _, _ in os.walk(self.table_dir)]
+        compacted = 0
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            parts = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+            if len(parts) < max(2, min_files):
+                continue
+            merged = pd.concat(
+                [pq.read_table(os.path.join(directory, f)).to_pandas() for f in parts], ignore_index=True
+            )
+            self._write_file(merged, directory, f"compacted-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+            for f in parts:
+                os.remove(os.path.join(directory, f))
+            compacted += 1
+        return compacted
+
+    def _swap_in(self):
+        final = os.path.join(self.root, self.table)
+        os.makedirs(self.staging, exist_ok=True)
+        old = None
+        if os.path.exists(final):
+            old = f"{self.staging}.old"
+            os.replace(final, old)
+        os.replace(self.staging, final)
+        if old is not None:
+            shutil.rmtree(old)
+        self.staging = None
+        print(f"Replaced Parquet table '{self.table}' with the rebuilt one.")
+
+    def close(self):
+        self.flush()
+        self.compact(sorted(self.touched))
+        if self.staging is not None:
+            self._swap_in()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.staging is not None:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            print(f"Kept the existing Parquet table '{self.table}'; the rebuild failed.")
+            return False
+        if exc_type is not None:
+            print(f"Left Parquet table '{self.table}' as it was; the run failed ({self.discard()} buffered row(s) dropped).")
+            return False
+        self.close()
+        return False
@@ -0,0 +1,174 @@
+import hashlib
+import io
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from extraction_cache import blob_uri
+
+DEFAULT_DERIVED_CACHE_PATH = ".derived_pdfs.sqlite"
+# Bump when the page selection below changes, so cached slices are rebuilt.
+SLICER_VERSION = "1"
+
+AMOUNT_RE = re.compile(r"\d[\d,]*\.\d{2}")
+
+# === WHICH PAGES THE MODEL NEEDS === #
+# A page is kept when it matches one of its profile's patterns. "Data" patterns
+# only count on pages that also carry amounts, so a cover letter that merely
+# mentions "property tax" is dropped while the levy table is kept.
+PROFILES = {
+    # Property columns (income / expense lines and totals), and the last page's
+    # Owner / Statement period / Prepared by footer.
+    "statements": {
+        "data": re.compile(r"total income|total expenses|net income|\b6\d{3}\b", re.IGNORECASE),
+        "always": re.compile(r"\bowner:|statement period|statement date", re.IGNORECASE),
+    },
+    # Assessment and levy tables.
+    "tax": {
+        "data": re.compile(r"assess|levy|tax rate|property tax|roll (?:number|no)|interim|final", re.IGNORECASE),
+        "always": None,
+    },
+}
+
+
+def select_pages(page_texts, profile):
+    patterns = PROFILES[profile]
+    keep = []
+    for number, text in enumerate(page_texts):
+        if patterns["always"] is not None and patterns["always"].search(text):
+            keep.append(number)
+        elif patterns["data"].search(text) and AMOUNT_RE.search(text):
+            keep.append(number)
+    return keep
+
+
+# Returns (derived bytes or None, kept page numbers, total pages). None means
+# "send the original": no text layer (a scan), nothing matched, or every page
+# is needed anyway.
+def slice_pdf(data, profile):
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    page_texts = [page.extract_text() or "" for page in reader.pages]
+    if not any(text.strip() for text in page_texts):
+        return None, list(range(total)), total
+    keep = select_pages(page_texts, profile)
+    if not keep or len(keep) == total:
+        return None, list(range(total)), total
+
+    writer = PdfWriter()
+    for number in keep:
+        writer.add_page(reader.pages[number])
+    writer.compress_identical_objects(remove_orphans=True)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue(), keep, total
+
+
+# === A SLICED PDF STANDS IN FOR ITS SOURCE BLOB === #
+# Same URI, hashes and generation (so extraction cache keys don't change), but
+# download_as_bytes() returns the derived PDF, which VertexModel sends inline.
+class SlicedPdf:
+    sliced = True
+
+    def __init__(self, source, data, pages, total_pages):
+        self.source = source
+        self.data = data
+        self.pages = pages
+        self.total_pages = total_pages
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    @property
+    def uri(self):
+        return blob_uri(self.source)
+
+    def download_as_bytes(self):
+        return self.data
+
+
+# === PAGE SLICER WITH A CACHE OF DERIVED PDFS === #
+# Keyed by the source blob's URI, content hash and generation plus the profile
+# and SLICER_VERSION; a changed PDF or page selection misses. Entries record the
+# kept pages even when the original is sent whole, so a source is only
+# downloaded and parsed once.
+class PdfSlicer:
+    def __init__(self, profile, path=DEFAULT_DERIVED_CACHE_PATH):
+        try:
+            import pypdf  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Page slicing needs pypdf: pip install pypdf") from e
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown slicing profile '{profile}'. Known: {', '.join(sorted(PROFILES))}")
+        self.profile = profile
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS derived_pdfs (
+                cache_key TEXT PRIMARY KEY,
+                source_uri TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                pages TEXT NOT NULL,
+                total_pages INTEGER NOT NULL,
+                data BLOB,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def make_key(self, blob):
+        content_id = blob.md5_hash or blob.crc32c or ""
+        parts = [blob_uri(blob), content_id, str(blob.generation or ""), self.profile, SLICER_VERSION]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _lookup(self, cache_key):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT pages, total_pages, data FROM derived_pdfs WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+
+    def _store(self, cache_key, blob, pages, total_pages, data):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO derived_pdfs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, blob_uri(blob), self.profile, json.dumps(pages), total_pages, data, time.time())
+            )
+            self.conn.commit()
+
+    # Returns the SlicedPdf to send in place of `blob`, or `blob` itself.
+    def prepare(self, blob, metrics=None):
+        start = time.perf_counter()
+        cache_key = self.make_key(blob)
+        row = self._lookup(cache_key)
+        if row is not None:
+            pages, total_pages, data = json.loads(row[0]), row[1], row[2]
+        else:
+            try:
+                data, pages, total_pages = slice_pdf(blob.download_as_bytes(), self.profile)
+            except Exception as e:
+                # Unreadable here doesn't mean unreadable for the model; send it as is.
+                print(f"Could not slice {blob_uri(blob)} ({e.__class__.__name__}: {e}); sending the whole PDF.")
+                return blob
+            self._store(cache_key, blob, pages, total_pages, data)
+        if metrics is not None:
+            metrics.add_time("slice", time.perf_counter() - start)
+            metrics.count("pages_total", total_pages)
+            metrics.count("pages_sent", len(pages))
+            metrics.pdf(blob_uri(blob), pages_total=total_pages, pages_sent=len(pages))
+        if data is None:
+            return blob
+        return SlicedPdf(blob, data, pages, total_pages)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
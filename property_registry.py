@@ -0,0 +1,280 @@
+import re
+import sqlite3
+import threading
+import time
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import pandas as pd
+
+from data_cleaner import POSTAL_CODE_RE
+
+DEFAULT_REGISTRY_PATH = ".property_registry.sqlite"
+
+# Canonical (Canada Post style) abbreviations for street types and directions.
+STREET_TYPES = {
+    "street": "st", "st": "st", "avenue": "ave", "ave": "ave", "av": "ave", "road": "rd", "rd": "rd",
+    "drive": "dr", "dr": "dr", "crescent": "cres", "cres": "cres", "cr": "cres", "boulevard": "blvd",
+    "blvd": "blvd", "court": "crt", "crt": "crt", "ct": "crt", "place": "pl", "pl": "pl", "lane": "lane",
+    "ln": "lane", "terrace": "terr", "terr": "terr", "way": "way", "circle": "cir", "cir": "cir",
+    "square": "sq", "sq": "sq", "parkway": "pky", "pky": "pky", "pkwy": "pky", "highway": "hwy",
+    "hwy": "hwy", "trail": "trail", "trl": "trail", "gate": "gate", "grove": "grove", "heights": "hts",
+    "hts": "hts", "row": "row", "path": "path",
+}
+DIRECTIONS = {
+    "north": "n", "n": "n", "south": "s", "s": "s", "east": "e", "e": "e", "west": "w", "w": "w",
+}
+UNIT_RE = re.compile(r"\b(?:unit|apt|apartment|suite|ste)\s*#?\s*([a-z0-9]+)\b|#\s*([a-z0-9]+)\b")
+UNIT_PREFIX_RE = re.compile(r"^([a-z0-9]+)\s*-\s*(\d+[a-z]?)\b")  # "5-123 main st" = unit 5, number 123
+NON_WORD_RE = re.compile(r"[^a-z0-9# -]")
+SPACES_RE = re.compile(r"\s+")
+
+MATCH_THRESHOLD = 0.75
+
+
+# === ADDRESS CANONICALIZATION (memoized) === #
+# Returns (civic number, street name, street type, direction, unit). The same
+# raw strings come back month after month, so results are cached per string.
+@lru_cache(maxsize=65536)
+def parse_address(raw):
+    text = POSTAL_CODE_RE.sub(" ", str(raw).lower())
+    text = SPACES_RE.sub(" ", NON_WORD_RE.sub(" ", text)).strip()
+
+    unit = ""
+    prefix = UNIT_PREFIX_RE.match(text)
+    if prefix:
+        unit, text = prefix.group(1), text[prefix.end(1):].lstrip(" -")
+    else:
+        found = UNIT_RE.search(text)
+        if found:
+            unit = found.group(1) or found.group(2)
+            text = (text[:found.start()] + " " + text[found.end():]).strip()
+    tokens = text.replace("-", " ").replace("#", " ").split()
+
+    civic = tokens.pop(0) if tokens and tokens[0][0].isdigit() else ""
+    name, street_type, direction = [], "", ""
+    for token in tokens:
+        # Everything after the street type (and direction) is city / province.
+        if street_type:
+            if not direction and token in DIRECTIONS:
+                direction = DIRECTIONS[token]
+            break
+        if name and token in STREET_TYPES:
+            street_type = STREET_TYPES[token]
+        else:
+            name.append(token)
+    return civic, " ".join(name), street_type, direction, unit
+
+
+def canonical_address(raw):
+    civic, name, street_type, direction, unit = parse_address(raw)
+    canonical = " ".join(part for part in (civic, name, street_type, direction) if part)
+    return f"{canonical} unit {unit}" if unit else canonical
+
+
+def block_key(parsed):
+    civic, name = parsed[0], parsed[1]
+    return f"{civic}|{name[:1]}"
+
+
+def postal_code(raw):
+    found = POSTAL_CODE_RE.search(str(raw))
+    return found.group(1).upper().replace(" ", "").replace("-", "") if found else ""
+
+
+# === PERSISTENT PROPERTY REGISTRY === #
+# Maps raw address strings to stable property IDs. Lookups go raw string ->
+# alias table -> canonical address -> approximate match inside a blocking index
+# (same civic number and street-name initial, same unit and direction, similar
+# street name, no conflicting postal code) -> new property. A missing direction
+# doesn't match a present one: "12 King St" may be either "12 King St E" or
+# "12 King St W", so it can't stand in for both. Everything is held in dicts for the
+# run and new properties/aliases are written back on flush/close.
+class PropertyRegistry:
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, threshold=MATCH_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS properties (
+                property_id INTEGER PRIMARY KEY,
+                canonical TEXT NOT NULL UNIQUE,
+                display_address TEXT NOT NULL,
+                postal_code TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS aliases (
+                raw TEXT PRIMARY KEY,
+                property_id INTEGER NOT NULL
+            )"""
+        )
+        self.conn.commit()
+        self.by_canonical = {}
+        self.properties = {}
+        self.blocks = {}
+        for property_id, canonical, display, postal in self.conn.execute(
+            "SELECT property_id, canonical, display_address, postal_code FROM properties"
+        ):
+            self._index(property_id, canonical, display, postal)
+        self.aliases = dict(self.conn.execute("SELECT raw, property_id FROM aliases"))
+        self.new_properties = []
+        self.new_aliases = []
+        self.postal_updates = {}
+
+    def _index(self, property_id, canonical, display, postal):
+        self.by_canonical[canonical] = property_id
+        self.properties[property_id] = {"canonical": canonical, "display": display, "postal": postal}
+        parsed = parse_address(canonical)
+        self.blocks.setdefault(block_key(parsed), []).append(property_id)
+
+    def _approximate(self, parsed, postal):
+        civic, name, street_type, direction, unit = parsed
+        best, best_score = None, self.threshold
+        for property_id in self.blocks.get(block_key(parsed), []):
+            candidate = self.properties[property_id]
+            c_civic, c_name, c_type, c_direction, c_unit = parse_address(candidate["canonical"])
+            if c_unit != unit or (street_type and c_type and c_type != street_type):
+                continue
+            if c_direction != direction:
+                continue
+            if postal and candidate["postal"] and candidate["postal"] != postal:
+                continue
+            score = SequenceMatcher(None, name, c_name).ratio()
+            if score >= best_score:
+                best, best_score = property_id, score
+        return best
+
+    def resolve(self, raw, postal=""):
+        raw = str(raw).strip()
+        postal = postal_code(postal) or postal_code(raw)
+        with self.lock:
+            property_id = self.aliases.get(raw)
+            if property_id is None:
+                parsed = parse_address(raw)
+                canonical = canonical_address(raw)
+                property_id = self.by_canonical.get(canonical)
+                if property_id is None:
+                    property_id = self._approximate(parsed, postal)
+                if property_id is None:
+                    property_id = max(self.properties, default=0) + 1
+                    self._index(property_id, canonical, raw, postal)
+                    self.new_properties.append(property_id)
+                self.aliases[raw] = property_id
+                self.new_aliases.append((raw, property_id))
+            if postal and not self.properties[property_id]["postal"]:
+                self.properties[property_id]["postal"] = postal
+                self.postal_updates[property_id] = postal
+            return property_id
+
+    # Resolves each distinct (address, postal code) pair once and maps the result back.
+    def resolve_series(self, addresses, postal_codes=None):
+        addresses = addresses.fillna("").astype(str)
+        if postal_codes is None:
+            postal_codes = pd.Series("", index=addresses.index)
+        pairs = pd.DataFrame({"address": addresses, "postal": postal_codes.fillna("").astype(str)})
+        unique = pairs.drop_duplicates()
+        ids = {(a, p): self.resolve(a, p) for a, p in zip(unique["address"], unique["postal"])}
+        return pd.Series([ids[pair] for pair in zip(pairs["address"], pairs["postal"])], index=addresses.index)
+
+    def display_address(self, property_id):
+        return self.properties[property_id]["display"]
+
+    def flush(self):
+        with self.lock:
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO properties VALUES (?, ?, ?, ?, ?)",
+                [(pid, self.properties[pid]["canonical"], self.properties[pid]["display"],
+                  self.properties[pid]["postal"], now) for pid in self.new_properties]
+            )
+            self.conn.executemany(
+                "UPDATE properties SET postal_code = ? WHERE property_id = ?",
+                [(postal, pid) for pid, postal in self.postal_updates.items()]
+            )
+            self.conn.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)", self.new_aliases)
+            self.conn.commit()
+            self.new_properties, self.new_aliases, self.postal_updates = [], [], {}
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# === NET INCOME AFTER PROPERTY TAX, PER PROPERTY AND YEAR === #
+PROPERTY_YEAR_COLUMNS = [
+    "Property ID", "Property Address", "Postal Code", "Year", "Months", "Income Total", "Expenses", "Net",
+    "Property Tax", "Net After Tax"
+]
+
+
+# Statements (cleaned wide rows) are summed per property-year; the tax summary
+# is turned into a dict keyed by (property ID, year) and probed once per row,
+# an in-memory hash join. Years with no tax record keep a blank tax.
+def join_net_income_after_tax(statements_df, tax_df, registry):
+    if statements_df.empty:
+        return pd.DataFrame(columns=PROPERTY_YEAR_COLUMNS)
+
+    statements = pd.DataFrame({
+        "Property ID": registry.resolve_series(
+            statements_df["Property Address"], statements_df.get("Postal Code")
+        ),
+        "Year": pd.to_numeric(statements_df["Period Year"], errors="coerce"),
+        "Income Total": statements_df["Income Total"],
+        "Expenses": statements_df["Expenses"],
+        "Net": statements_df["Net"],
+    }).dropna(subset=["Year"])
+    statements["Year"] = statements["Year"].astype(int)
+    yearly = statements.groupby(["Property ID", "Year"], sort=True).agg(
+        Months=("Net", "size"), **{col: (col, "sum") for col in ["Income Total", "Expenses", "Net"]}
+    ).reset_index().round({"Income Total": 2, "Expenses": 2, "Net": 2})
+
+    tax_by_key = {}
+    if not tax_df.empty:
+        tax_ids = registry.resolve_series(tax_df["Property Address"])
+        tax_years = pd.to_numeric(tax_df["Year"], errors="coerce")
+        tax_amounts = pd.to_numeric(tax_df["Property Tax"], errors="coerce")
+        for key in zip(tax_ids, tax_years, tax_amounts):
+            if not pd.isna(key[1]) and not pd.isna(key[2]):
+                tax_by_key.setdefault((key[0], int(key[1])), key[2])
+
+    yearly["Property Tax"] = [tax_by_key.get(key) for key in zip(yearly["Property ID"], yearly["Year"])]
+    yearly["Property Tax"] = pd.to_numeric(yearly["Property Tax"], errors="coerce")
+    yearly["Net After Tax"] = (yearly["Net"] - yearly["Property Tax"]).round(2)
+    yearly["Property Address"] = yearly["Property ID"].map(registry.display_address)
+    yearly["Postal Code"] = yearly["Property ID"].map(lambda pid: registry.properties[pid]["postal"])
+    return yearly.reindex(columns=PROPERTY_YEAR_COLUMNS)
+
+
+# === BUILD THE JOINED TABLE FROM CACHED RESPONSES (no model calls) === #
+def build_property_year_table(cache_path, registry_path=DEFAULT_REGISTRY_PATH, output_dir="recleaned",
+                              rate_version=None, rate_table_path=None):
+    import os
+    import Pdfs_data_extracted
+    import property_tax_script
+    from tax_engine import DEFAULT_RATE_VERSION
+
+    statements_df, statement_pdfs = Pdfs_data_extracted.load_cached_statements(cache_path)
+    tax_df, tax_pdfs = property_tax_script.load_cached_summary(
+        cache_path, rate_version or DEFAULT_RATE_VERSION, rate_table_path
+    )
+    with PropertyRegistry(registry_path) as registry:
+        table = join_net_income_after_tax(statements_df, tax_df, registry)
+        properties = len(registry.properties)
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, "property_year_net_after_tax.csv")
+    table.to_csv(path, index=False)
+    matched = int(table["Property Tax"].notna().sum())
+    print(f"Joined {statement_pdfs} statement and {tax_pdfs} tax PDF response(s): {len(table)} property-year row(s), "
+          f"{matched} with property tax, {properties} registered propert{'y' if properties == 1 else 'ies'} -> {path}")
+    return table
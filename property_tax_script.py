@@ -1,173 +1,296 @@
-import os
-import time
 import json
-import vertexai
+import os
+import sys
 import pandas as pd
-import gspread
-from google.cloud import storage
-from vertexai.preview.generative_models import GenerativeModel, Part
-from google.oauth2 import service_account
-from gspread.exceptions import WorksheetNotFound
-
-# === USER INPUT === #
-project_id = input("Enter your Google Cloud project ID: ").strip()
-bucket_name = input("Enter your Cloud Storage bucket name: ").strip()
-folder_path = input("Enter the folder path inside the bucket (e.g., tax/): ").strip()
-sheet_name = input("Enter the name of your Google Sheet (created manually): ").strip()
-service_account_file = input("Enter path to your service account JSON (e.g., sa.json): ").strip()
-
-# === CREDENTIALS === #
-scopes = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-]
-gcp_creds = service_account.Credentials.from_service_account_file(service_account_file)
-gsheets_creds = service_account.Credentials.from_service_account_file(service_account_file, scopes=scopes)
-
-vertexai.init(project=project_id, location="us-central1", credentials=gcp_creds)
-gsheets_client = gspread.authorize(gsheets_creds)
-storage_client = storage.Client(credentials=gcp_creds)
+from contextlib import ExitStack, nullcontext
+from functools import partial
+from extraction_cache import DEFAULT_CACHE_PATH, ExtractionCache, blob_uri
+from ingestion_manifest import DEFAULT_MANIFEST_PATH, IngestionManifest
+from extraction_engine import TokenBucket, stream_in_order
+from batch_extraction import batched, extract_batch
+from pdf_slicer import DEFAULT_DERIVED_CACHE_PATH
+from sheet_index import DEFAULT_SHEET_INDEX_PATH, SheetKeyIndex
+from sheet_writer import BufferedSheetWriter
+from run_report import DEFAULT_REPORT_DIR, RunMetrics, StageProfiler, timed_iter
+from tax_engine import DEFAULT_RATE_VERSION, SUMMARY_COLUMNS, compute_tax, facts_frame, load_rate_table, rate_table
+
+MODEL_NAME = "gemini-1.5-flash"
+
+summary_headers = list(SUMMARY_COLUMNS)
 
 # === GET EXISTING SHEET + CREATE TAB IF NEEDED === #
-def get_or_create_summary_sheet(sheet_name, tab_name, headers):
-    spreadsheet = gsheets_client.open(sheet_name)
-
-    try:
-        worksheet = spreadsheet.worksheet(tab_name)
-        print(f"📄 Found existing tab: {tab_name}")
-    except WorksheetNotFound:
-        print(f"Tab '{tab_name}' not found. Creating it in your Google Sheet...")
-        worksheet = spreadsheet.add_worksheet(title=tab_name, rows="1000", cols="20")
-        worksheet.insert_row(headers, index=1)
-
-    return worksheet
-
-summary_headers = [
-    "Property Address", "Roll Number", "Assessment Value", "Year", "Tax Rate Used",
-    "Property Tax", "First Half Payment", "Second Half Payment", "Monthly Payment"
-]
-
-summary_sheet = get_or_create_summary_sheet(sheet_name, "Property Tax Summary", summary_headers)
+def get_or_create_summary_sheet(spreadsheet, tab_name, headers):
+    return spreadsheet.worksheet_or_create(tab_name, headers, rows=1000, cols=20)
 
 # === GEMINI PROMPT === #
+# The model only reads printed facts; rates, taxes and payments are derived
+# locally by tax_engine.compute_tax().
 prompt = """
 
-Extract structured property tax data from each uploaded property assessment and tax levy PDF. Each PDF contains data for a single property.
-
-Return a flat structured table (CSV or list of JSON objects). Each row must include the following columns:
-
-- Property Address
-- Roll Number
-- Assessment Value
-- Year (2021 to 2025)
-- Tax Rate Used
-- Property Tax
-- First Half Payment (50% of the previous year's Property Tax)
-- Second Half Payment (Property Tax - First Half), except for 2025
-- Monthly Payment (Property Tax ÷ 12)
-
-Year-by-Year Calculation Rules:
-
-1. **Tax Rate Used**:
-   - Extract from PDF if shown.
-   - If missing, use these City of Kingston residential tax rates:
-     - 2020: 1.309528%
-     - 2021: 1.365454%
-     - 2022: 1.399366%
-     - 2023: 1.444608%
-     - 2024: 1.478321%
-     - 2025: 1.556000% (only if confirmed)
-
-2. **Property Tax**:
-   - Extract from PDF if available.
-   - If missing, calculate as:
-     `Property Tax = Assessment Value × Tax Rate Used`
-
-3. **First Half Payment**:
-   - For 2021:
-     - Use the 2020 tax calculated as:
-       `Assessment Value × 1.309528%`
-     - First Half = 50% of that amount
-   - For 2022 to 2025:
-     - First Half = 50% of the **previous year’s** Property Tax
-       (use either extracted or calculated value)
-
-4. **Second Half Payment**:
-   - For 2021 to 2024:  
-     `Second Half = Property Tax - First Half`
-   - For 2025:  
-     `Second Half = 0.0` (2025 final bill not yet available)
-
-5. **Monthly Payment**:
-   - `Monthly = Property Tax ÷ 12`
-
-Output Format & Requirements:
-
-- Always extract Property Address and Roll Number exactly as shown in the PDF.
-- Use year-specific Assessment Values if available; otherwise reuse the only one listed.
-- Round all numeric values (taxes, rates, payments) to 2 decimal places.
-- Output must be clean, machine-readable (CSV or JSON).
-- Do not leave any fields blank or null unless data is entirely unavailable and cannot be inferred.
-
-Goal:
-
-To automate the accurate and complete extraction of property tax records across 2021 to 2025, reflecting the City of Kingston's billing model — including interim/final split logic, default rate handling, and safeguards for missing future data like 2025’s final tax.
+Extract the raw property tax facts printed in each uploaded property assessment and tax levy PDF. Each PDF contains data for a single property. Do not calculate, estimate or fill in any values.
 
-"""
+Return a JSON array with one object for each tax year (2020 to 2025) that the PDF shows information for. Each object must have these keys:
 
-# === INITIALIZE GEMINI === #
-model = GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config={"response_mime_type": "application/json"}
-)
+- Property Address: exactly as shown in the PDF
+- Roll Number: exactly as shown in the PDF
+- Year: the tax year
+- Assessment Value: the assessment value for that year, if printed
+- Tax Rate: the residential tax rate printed for that year, as a percentage (e.g. 1.365454), if printed
+- Property Tax: the total property tax printed for that year, if printed
 
-# === GET PDF FILES FROM GCS === #
-def get_pdf_uris(bucket_name, folder_path):
-    blobs = storage_client.list_blobs(bucket_name, prefix=folder_path)
-    return [f"gs://{bucket_name}/{blob.name}" for blob in blobs if blob.name.endswith(".pdf")]
+Rules:
 
-# === LOAD EXISTING RECORD KEYS === #
-def load_existing_keys(sheet):
-    rows = sheet.get_all_values()[1:]  # Skip header
-    return {(row[0].strip(), row[3].strip()) for row in rows if len(row) >= 4}  # (Property Address, Year)
+- Use "" for any value that is not printed in the PDF.
+- If the PDF shows an assessment value without any year, return one object with Year "" holding it.
+- Copy numbers as printed, without currency symbols or thousands separators.
 
-# === PROCESS INDIVIDUAL PDF === #
-def process_pdf(pdf_uri, summary_sheet, existing_keys):
-    print(f"\nProcessing: {pdf_uri}")
-    try:
-        part = Part.from_uri(pdf_uri, mime_type="application/pdf")
-        response = model.generate_content([part, prompt])
-        records = json.loads(response.text)
+"""
 
+# === GET PDF FILES FROM STORAGE (streamed page by page) === #
+def get_pdf_blobs(storage, bucket_name, folder_path, metrics=None):
+    blobs = storage.iter_pdfs(bucket_name, folder_path)
+    return timed_iter(blobs, metrics, "list") if metrics is not None else blobs
+
+# Rows are keyed by (Property Address, Year); see sheet_index.py.
+SUMMARY_KEY_COLUMNS = ["Property Address", "Year"]
+
+# === EXTRACT A BATCH OF PDFS (runs in worker threads) === #
+# batch_size=1 sends one PDF per request; larger batches share one request and
+# a cached prompt prefix. With a slicer, the model only gets the pages with
+# assessment / levy tables. Returns one (records, error) pair per blob.
+def extract_pdfs(blobs, model, extraction_cache, model_limiter, refresh=False, metrics=None, slicer=None):
+    extracted = []
+    answers = extract_batch(blobs, prompt, model, extraction_cache, model_limiter, refresh, metrics, slicer=slicer)
+    for blob, (raw_text, error) in zip(blobs, answers):
+        if error is not None:
+            extracted.append((None, error))
+            continue
+        with metrics.stage("parse", blob_uri(blob)) if metrics else nullcontext():
+            records = json.loads(raw_text)
         if not isinstance(records, list):
             records = [records]
-
-        new_rows = []
-        for rec in records:
-            key = (rec["Property Address"].strip(), str(rec["Year"]).strip())
-            if key in existing_keys:
-                continue
-
-            row = [rec.get(col, "") for col in summary_headers]
-            new_rows.append(row)
-            existing_keys.add(key)
+        extracted.append((records, None))
+    return extracted
+
+# === COMPUTE DERIVED TAX FIELDS FOR A BATCH (runs in listing order) === #
+# The facts of every PDF in the batch go through the tax engine in one pass.
+def compute_pdfs(blobs, extracted, rates, metrics=None):
+    frames = [facts_frame(records).assign(Source=i) for i, (records, error) in enumerate(extracted) if error is None]
+    by_source = {}
+    if frames:
+        with metrics.stage("tax_engine") if metrics else nullcontext():
+            summary = compute_tax(pd.concat(frames, ignore_index=True), rates, group_column="Source")
+            by_source = {i: group.drop(columns="Source") for i, group in summary.groupby("Source", sort=False)}
+    computed = []
+    for i, (records, error) in enumerate(extracted):
+        if error is not None:
+            computed.append((None, error))
+        elif i in by_source:
+            computed.append((by_source[i].to_dict("records"), None))
+        else:
+            computed.append(([], None))
+    return computed
+
+# === PROCESS INDIVIDUAL PDF (runs in order) === #
+# New (Property Address, Year) keys are appended; with `replace` (--refresh),
+# existing rows whose values changed are rewritten in place, and replaced in
+# the Parquet sink too.
+def process_pdf(pdf_uri, records, key_index, summary_writer, parquet_sink=None, replace=False):
+    print(f"\nProcessing: {pdf_uri}")
+    try:
+        rows = [[rec.get(col, "") for col in summary_headers] for rec in records]
+        previous = key_index.previous_values(rows) if replace and parquet_sink is not None else None
+        statuses = key_index.upsert(summary_writer, rows, replace=replace)
+        new_rows = [row for row, status in zip(rows, statuses) if status == "new"]
+        updated = statuses.count("updated")
 
         if new_rows:
-            summary_sheet.append_rows(new_rows, value_input_option='RAW')
-            print(f"Appended {len(new_rows)} new rows.")
-        else:
+            if parquet_sink is not None:
+                parquet_sink.append_rows(new_rows)
+            print(f"Queued {len(new_rows)} new rows.")
+        if updated:
+            if parquet_sink is not None:
+                parquet_sink.remove_rows([values for values, status in zip(previous, statuses) if status == "updated"])
+                parquet_sink.append_rows([row for row, status in zip(rows, statuses) if status == "updated"])
+            print(f"Queued {updated} changed row(s) to update in place.")
+        if not new_rows and not updated:
             print("No new rows to add (already processed).")
+        return len(new_rows)
 
     except Exception as e:
         print(f"Error processing {pdf_uri}: {e}")
-
-    time.sleep(10)
+        return None
+
+# === OPTIONAL PARQUET OUTPUT === #
+def open_parquet_sink(stack, parquet_dir=None, rebuild=False):
+    if not parquet_dir:
+        return None
+    from parquet_sink import ParquetSink
+    return stack.enter_context(ParquetSink(
+        parquet_dir, "property_tax_summary", summary_headers,
+        ["Property Address", "Roll Number", "Year"], partition_cols=["Year"], key_columns=SUMMARY_KEY_COLUMNS,
+        rebuild=rebuild
+    ))
+
+# === RUN THE PIPELINE AGAINST ANY STORAGE / MODEL / SPREADSHEET BACKEND === #
+def run(storage, model, spreadsheet, bucket_name, folder_path, max_workers=4, model_rpm=60, sheets_rpm=60,
+        flush_rows=500, refresh=False, process_all=False, cache_path=DEFAULT_CACHE_PATH,
+        manifest_path=DEFAULT_MANIFEST_PATH, parquet_dir=None, max_in_flight=None, batch_size=1,
+        rate_version=DEFAULT_RATE_VERSION, rate_table_path=None, report_dir=None, profile_clean=False,
+        slice_pages=False, derived_cache_path=DEFAULT_DERIVED_CACHE_PATH, sheet_index_path=DEFAULT_SHEET_INDEX_PATH):
+    summary = {"pdfs": 0, "rows": 0, "failed": 0, "seconds": {}}
+    metrics = RunMetrics("property_tax")
+    with metrics.stage("sheet_setup"):
+        summary_sheet = get_or_create_summary_sheet(spreadsheet, "Property Tax Summary", summary_headers)
+    metrics.count("sheets_api_calls")
+
+    extraction_cache = ExtractionCache(cache_path)
+    manifest = IngestionManifest("property_tax", manifest_path)
+
+    model_limiter = TokenBucket(rate_per_minute=model_rpm)
+    sheets_limiter = TokenBucket(rate_per_minute=sheets_rpm)
+    with metrics.stage("load_keys"):
+        key_index = SheetKeyIndex(
+            spreadsheet, summary_sheet, summary_headers, SUMMARY_KEY_COLUMNS, sheet_index_path,
+            limiter=sheets_limiter, metrics=metrics, read_values=refresh
+        )
+    # Lazily listed; only new, changed or previously failed blobs reach the model, unless
+    # --all or --refresh (which re-extracts everything) asks for every blob. Changed ones
+    # (re-uploaded PDFs) replace the rows their previous version wrote.
+    changed = set()
+    pdf_blobs = manifest.iter_pending(
+        get_pdf_blobs(storage, bucket_name, folder_path, metrics), changed=changed, include_done=process_all or refresh
+    )
+    completed = []
+
+    slicer = None
+    if slice_pages:
+        from pdf_slicer import PdfSlicer
+        slicer = PdfSlicer("tax", derived_cache_path)
+    extract = partial(
+        extract_pdfs, model=model, extraction_cache=extraction_cache, model_limiter=model_limiter, refresh=refresh,
+        metrics=metrics, slicer=slicer
+    )
+    rates = load_rate_table(rate_table_path) if rate_table_path else rate_table(rate_version)
+    compute = partial(compute_pdfs, rates=rates, metrics=metrics)
+    profiler = None
+    if profile_clean:
+        profiler = StageProfiler(os.path.join(report_dir or DEFAULT_REPORT_DIR, "property_tax-compute.prof"))
+        compute = profiler.wrap(compute)
+
+    # Listing, extraction workers and the writer below run as overlapping stages joined by
+    # bounded queues; results arrive in listing order so dedup stays deterministic.
+    # Every writer flushes whatever is still buffered on exit, even if the loop raises.
+    # The table outputs are entered first so they close last: if the loop or a writer's final
+    # flush fails they see it and drop their buffered rows instead of writing them.
+    with metrics.stage("stream"), ExitStack() as stack:
+        if slicer is not None:
+            stack.enter_context(slicer)
+        parquet_sink = open_parquet_sink(stack, parquet_dir)
+        summary_writer = stack.enter_context(
+            BufferedSheetWriter(summary_sheet, flush_rows=flush_rows, limiter=sheets_limiter, metrics=metrics)
+        )
+        stages = stream_in_order(
+            batched(pdf_blobs, batch_size), extract, compute, max_workers=max_workers, max_in_flight=max_in_flight,
+            on_tick=summary_writer.maybe_flush
+        )
+        for blobs, computed, batch_error in stages:
+            for blob, (records, error) in zip(blobs, computed or [(None, batch_error)] * len(blobs)):
+                summary["pdfs"] += 1
+                if error is not None:
+                    print(f"Error processing {blob_uri(blob)}: {error}")
+                    manifest.mark_failed(blob, error)
+                    metrics.pdf(blob_uri(blob), status="failed", error=str(error))
+                    summary["failed"] += 1
+                    continue
+                with metrics.stage("process", blob_uri(blob)):
+                    row_count = process_pdf(
+                        blob_uri(blob), records, key_index, summary_writer, parquet_sink,
+                        replace=refresh or blob.name in changed
+                    )
+                if row_count is None:
+                    manifest.mark_failed(blob, "processing error")
+                    metrics.pdf(blob_uri(blob), status="failed", error="processing error")
+                    summary["failed"] += 1
+                else:
+                    completed.append((blob, row_count))
+                    metrics.pdf(blob_uri(blob), status="done", rows=row_count)
+                    summary["rows"] += row_count
+
+    # Only mark PDFs as ingested once their rows have been flushed to the sheet.
+    manifest.mark_done_many(completed)
+    manifest.close()
+    key_index.save()
+    key_index.close()
+
+    print(f"Extraction cache: {extraction_cache.hits} hit(s), {extraction_cache.misses} miss(es).")
+    extraction_cache.evict()
+    extraction_cache.close()
+
+    for name in ("pdfs", "rows", "failed"):
+        metrics.count(name, summary[name])
+    summary["report"] = metrics.finish()
+    summary["seconds"] = {
+        stage: summary["report"]["stages"].get(stage, {}).get("seconds", 0.0)
+        for stage in ("load_keys", "stream", "process")
+    }
+    if profiler is not None:
+        profiler.dump()
+    if report_dir:
+        metrics.write(report_dir)
+    return summary
+
+# === RECOMPUTE FROM CACHED FACTS (no model calls) === #
+# Re-derives the summary table from the latest cached facts per PDF, e.g. after
+# a rate table change. Output goes to a fresh CSV file (and optionally Parquet)
+# rather than into the live sheet.
+def load_cached_summary(cache_path=DEFAULT_CACHE_PATH, rate_version=DEFAULT_RATE_VERSION, rate_table_path=None):
+    rates = load_rate_table(rate_table_path) if rate_table_path else rate_table(rate_version)
+    extraction_cache = ExtractionCache(cache_path)
+    frames = []
+    responses = extraction_cache.iter_responses(model_name=MODEL_NAME, prompt=prompt)
+    for source, (source_uri, raw_text) in enumerate(responses):
+        try:
+            records = json.loads(raw_text)
+        except ValueError as e:
+            print(f"Skipping unreadable cached response for {source_uri}: {e}")
+            continue
+        frames.append(facts_frame(records if isinstance(records, list) else [records]).assign(Source=source))
+    extraction_cache.close()
+
+    if frames:
+        summary = compute_tax(pd.concat(frames, ignore_index=True), rates, group_column="Source")
+        summary = summary.drop(columns="Source")
+        keys = pd.DataFrame({"address": summary["Property Address"].str.strip(), "year": summary["Year"].astype(str)})
+        summary = summary[~keys.duplicated()]
+    else:
+        summary = pd.DataFrame(columns=summary_headers)
+    return summary, len(frames)
+
+
+def recompute(cache_path=DEFAULT_CACHE_PATH, output_dir="recleaned", parquet_dir=None,
+              rate_version=DEFAULT_RATE_VERSION, rate_table_path=None):
+    summary, pdfs = load_cached_summary(cache_path, rate_version, rate_table_path)
+    os.makedirs(output_dir, exist_ok=True)
+    summary.to_csv(os.path.join(output_dir, "property_tax_summary.csv"), index=False)
+    # The Parquet table is rebuilt and swapped in, not appended to; an empty
+    # cache leaves it alone.
+    if summary.empty and parquet_dir:
+        print("No cached rows; Parquet table left as it is.")
+    elif parquet_dir:
+        with ExitStack() as stack:
+            open_parquet_sink(stack, parquet_dir, rebuild=True).append(summary)
+
+    print(f"Recomputed {len(summary)} row(s) from {pdfs} cached PDF response(s) into {output_dir}/.")
+    return summary
 
 # === MAIN DRIVER === #
-pdf_uris = get_pdf_uris(bucket_name, folder_path)
-existing_keys = load_existing_keys(summary_sheet)
+# Kept for `python property_tax_script.py ...`; settings come from flags, RENTAL_* env vars or the
+# config file, with interactive prompts only for missing values on a terminal.
+def main():
+    from cli import main as cli_main
+    return cli_main(["tax"] + sys.argv[1:])
 
-for uri in pdf_uris:
-    process_pdf(uri, summary_sheet, existing_keys)
 
-print("\nAll PDFs processed and your Google Sheet has been updated!")
+if __name__ == "__main__":
+    sys.exit(main())
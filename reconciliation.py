@@ -0,0 +1,67 @@
+import pandas as pd
+
+from data_cleaner import EXPENSE_COLUMNS, INCOME_COLUMNS, UNPARSED_COLUMN
+
+DEFAULT_TOLERANCE = 0.01
+
+# One row per failed check. "Quarantine" tab / quarantine.csv columns.
+FAILURE_COLUMNS = ["Owner", "Property Address", "Statement Period", "Check", "Expected", "Actual", "Difference"]
+QUARANTINE_COLUMNS = ["Source PDF", "Attempt"] + FAILURE_COLUMNS
+
+TOTAL_COLUMNS = ["Income Total", "Expenses", "Net"]
+
+
+# === STATEMENT IDENTITIES, CHECKED OVER A WHOLE FRAME AT ONCE === #
+#   Income Total = Rent + NSF Income + Maintenance
+#   Expenses     = sum of the EXPENSE_COLUMNS
+#   Net          = Income Total - Expenses
+# plus any numeric field that was present but didn't parse. Sums more than
+# `tolerance` apart fail. Returns the failures, indexed like `df`.
+def check_statements(df, tolerance=DEFAULT_TOLERANCE):
+    values = df.reindex(columns=INCOME_COLUMNS + EXPENSE_COLUMNS + TOTAL_COLUMNS, fill_value=0.0)
+    checks = {
+        "Income Total = Rent + NSF Income + Maintenance": (
+            values[INCOME_COLUMNS].sum(axis=1), values["Income Total"]
+        ),
+        "Expenses = sum of expense categories": (values[EXPENSE_COLUMNS].sum(axis=1), values["Expenses"]),
+        "Net = Income Total - Expenses": (values["Income Total"] - values["Expenses"], values["Net"]),
+    }
+    ids = df.reindex(columns=FAILURE_COLUMNS[:3], fill_value="")
+    frames = []
+    for name, (expected, actual) in checks.items():
+        difference = actual - expected
+        failed = difference.abs() > tolerance + 1e-9
+        if failed.any():
+            frames.append(ids[failed].assign(
+                Check=name, Expected=expected[failed].round(2), Actual=actual[failed].round(2),
+                Difference=difference[failed].round(2)
+            ))
+    if UNPARSED_COLUMN in df.columns:
+        failed = df[UNPARSED_COLUMN] != ""
+        if failed.any():
+            frames.append(ids[failed].assign(
+                Check="Unparsed: " + df.loc[failed, UNPARSED_COLUMN], Expected="", Actual="", Difference=""
+            ))
+    if not frames:
+        return pd.DataFrame(columns=FAILURE_COLUMNS)
+    return pd.concat(frames).sort_index(kind="stable")[FAILURE_COLUMNS]
+
+
+# === SPLIT A BATCH OF CLEANED PDFS INTO PASSING ROWS AND FAILURES === #
+# `frames` holds one cleaned DataFrame (or None) per PDF; they're checked in
+# one pass. Returns one (passing rows, failures) pair per PDF.
+def reconcile_frames(frames, tolerance=DEFAULT_TOLERANCE):
+    present = [i for i, df in enumerate(frames) if df is not None and not df.empty]
+    results = [(df, pd.DataFrame(columns=FAILURE_COLUMNS)) for df in frames]
+    if not present:
+        return results
+    batch = pd.concat([frames[i] for i in present], keys=present, names=["pdf", "row"])
+    failures = check_statements(batch, tolerance)
+    passed = batch[~batch.index.isin(failures.index)]
+    passed_by_pdf = {i: df.droplevel("pdf") for i, df in passed.groupby(level="pdf", sort=False)}
+    failures_by_pdf = {}
+    if not failures.empty:
+        failures_by_pdf = {i: df.reset_index(drop=True) for i, df in failures.groupby(level="pdf", sort=False)}
+    for i in present:
+        results[i] = (passed_by_pdf.get(i, frames[i].iloc[:0]), failures_by_pdf.get(i, results[i][1]))
+    return results
@@ -0,0 +1,165 @@
+import os
+import threading
+
+import pandas as pd
+
+from data_cleaner import EXPENSE_COLUMNS, SHEET_HEADERS
+
+DEFAULT_ROLLUP_DIR = "rollups"
+
+# Measures carried by the property and owner rollups, all taken from the main
+# sheet's columns (SHEET_HEADERS) so the rollups can't drift from the sheet.
+INCOME_COLUMN = "Income Total"
+WIDE_MEASURES = [INCOME_COLUMN] + [col for col in SHEET_HEADERS if col in EXPENSE_COLUMNS] + ["Expenses", "Net"]
+
+# name -> (key columns, source table)
+ROLLUPS = {
+    "property_month": (["Property Address", "Period Year", "Period Month"], "wide"),
+    "owner_year": (["Owner", "Period Year"], "wide"),
+    "category_month": (["Expense Category", "Period Year", "Period Month"], "long"),
+}
+
+
+def _long_expenses(df):
+    value_vars = [col for col in EXPENSE_COLUMNS if col in df.columns]
+    long_df = df.melt(
+        id_vars=["Period Year", "Period Month"], value_vars=value_vars,
+        var_name="Expense Category", value_name="Amount"
+    )
+    return long_df[long_df["Amount"] != 0]
+
+
+def _aggregate(df, keys, measures):
+    df = df.copy()
+    for col in keys:
+        df[col] = df[col].fillna("").astype(str)
+    grouped = df.groupby(keys, sort=False)
+    out = grouped[measures].sum()
+    out["Count"] = grouped.size()
+    return out.reset_index()
+
+
+# === INCREMENTALLY MAINTAINED ROLLUP TABLES === #
+# Each run hands this sink only the rows it wrote: append() for new rows, and
+# remove() with the old values of rows it replaced in place. On close both are
+# aggregated and the difference is added onto the stored totals (sum/count are
+# additive), so the full history is never re-scanned. Tables are CSV files in
+# `root`.
+#
+# If the run fails the buffered rows are dropped rather than added, since some
+# of them may never have reached the sheet; rows that did are picked up by the
+# next `reclean`.
+#
+# With `rebuild` (reclean, which hands over the full history) the stored totals
+# are ignored and every table is replaced on close; if the run fails nothing
+# is written.
+class RollupSink:
+    def __init__(self, root=DEFAULT_ROLLUP_DIR, rebuild=False):
+        self.root = root
+        self.rebuild = rebuild
+        self.rebuilt = set()
+        self.frames = []
+        self.removed = []
+        self.lock = threading.Lock()
+
+    def append(self, df):
+        if df is not None and not df.empty:
+            with self.lock:
+                self.frames.append(df)
+
+    # `df` holds the values the rows had before they were replaced (as read
+    # back from the sheet, so amounts may be text).
+    def remove(self, df):
+        if df is not None and not df.empty:
+            with self.lock:
+                self.removed.append(df)
+
+    def discard(self):
+        with self.lock:
+            dropped = sum(len(df) for df in self.frames)
+            self.frames, self.removed = [], []
+        return dropped
+
+    def path(self, name):
+        return os.path.join(self.root, f"{name}.csv")
+
+    def load(self, name):
+        keys, _ = ROLLUPS[name]
+        path = self.path(name)
+        if not os.path.exists(path) or (self.rebuild and name not in self.rebuilt):
+            return None
+        return pd.read_csv(path, dtype={col: str for col in keys}, keep_default_na=False)
+
+    def _merge(self, name, increment):
+        keys, _ = ROLLUPS[name]
+        existing = self.load(name)
+        if existing is not None and not existing.empty:
+            increment = pd.concat([existing, increment], ignore_index=True)
+        # Union of both sides' measures: a column missing from this run (or from
+        # an older table) counts as 0 rather than being dropped.
+        measures = [col for col in increment.columns if col not in keys]
+        increment[measures] = increment[measures].fillna(0)
+        increment = increment.groupby(keys, sort=False)[measures].sum().reset_index()
+        # Groups whose rows were all replaced by rows under other keys are gone.
+        increment = increment[increment["Count"] > 0].copy()
+        numeric = increment.columns.difference(keys + ["Count"])
+        increment[numeric] = increment[numeric].round(2)
+        increment["Count"] = increment["Count"].astype(int)
+        increment = increment.sort_values(keys, kind="stable")
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path(name) + ".tmp"
+        increment.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path(name))
+        self.rebuilt.add(name)
+        return len(increment)
+
+    def flush(self):
+        with self.lock:
+            frames, self.frames = self.frames, []
+            removed, self.removed = self.removed, []
+        if not frames and not removed:
+            return
+        # Removed rows count with their sign flipped, Count included.
+        sources = {}
+        for part, sign in ((frames, 1), (removed, -1)):
+            if not part:
+                continue
+            # Every table always carries all of WIDE_MEASURES, so its schema
+            # doesn't depend on which categories a run happened to see.
+            wide = pd.concat(part, ignore_index=True)
+            wide = wide.reindex(columns=wide.columns.union(WIDE_MEASURES, sort=False))
+            wide[WIDE_MEASURES] = wide[WIDE_MEASURES].apply(pd.to_numeric, errors="coerce").fillna(0)
+            sources.setdefault("wide", []).append((wide, WIDE_MEASURES, sign))
+            sources.setdefault("long", []).append((_long_expenses(wide), ["Amount"], sign))
+        for name, (keys, source) in ROLLUPS.items():
+            parts = []
+            for df, cols, sign in sources[source]:
+                if not df.empty:
+                    aggregated = _aggregate(df, keys, cols)
+                    aggregated[cols + ["Count"]] *= sign
+                    parts.append(aggregated)
+            if not parts:
+                continue
+            total = self._merge(name, pd.concat(parts, ignore_index=True))
+            print(f"Rollup '{name}': {total} row(s).")
+
+    def close(self):
+        self.flush()
+        if self.rebuild:
+            # Tables the rebuilt history has no rows for.
+            for name in ROLLUPS:
+                if name not in self.rebuilt and os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.rebuild:
+            print("Kept the existing rollups; the rebuild failed.")
+            return False
+        if exc_type is not None:
+            print(f"Left the rollups as they were; the run failed ({self.discard()} buffered row(s) dropped).")
+            return False
+        self.close()
+        return False
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_REPORT_DIR = "run_reports"
+METRIC_PREFIX = "rental_pipeline"
+
+
+# === RUN METRICS === #
+# Thread-safe counters and stage timers shared by every stage of one pipeline
+# run. Stage seconds are summed across threads, so for the worker stages they
+# are busy time rather than wall time; the report's `wall_seconds` is the run
+# as a whole. Per-PDF entries collect whatever the stages record for that URI.
+class RunMetrics:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.wall_seconds = None
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.pdfs = {}
+
+    def add_time(self, stage, seconds, count=1):
+        with self.lock:
+            totals = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0})
+            totals["seconds"] += seconds
+            totals["count"] += count
+
+    @contextmanager
+    def stage(self, stage, pdf_uri=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add_time(stage, seconds)
+            if pdf_uri is not None:
+                self.pdf(pdf_uri, **{f"{stage}_seconds": seconds})
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    # Merges fields into the per-PDF entry; numeric fields add up.
+    def pdf(self, pdf_uri, **fields):
+        with self.lock:
+            entry = self.pdfs.setdefault(pdf_uri, {})
+            for name, value in fields.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and name in entry:
+                    entry[name] += value
+                else:
+                    entry[name] = value
+
+    # call_with_backoff(on_retry=...) hook.
+    def retried(self, error, delay):
+        self.count("retries")
+        self.count("retry_sleep_seconds", delay)
+
+    def usage(self, response, pdf_uris=()):
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self.count("model_input_tokens", input_tokens)
+        self.count("model_output_tokens", output_tokens)
+        # Batched requests report one usage for several PDFs; each gets an equal share.
+        for pdf_uri in pdf_uris:
+            self.pdf(pdf_uri, input_tokens=input_tokens / len(pdf_uris), output_tokens=output_tokens / len(pdf_uris))
+
+    def finish(self):
+        if self.wall_seconds is None:
+            self.wall_seconds = time.perf_counter() - self.start
+        return self.report()
+
+    def report(self):
+        with self.lock:
+            return {
+                "pipeline": self.pipeline,
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started_at)),
+                "wall_seconds": self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.start,
+                "stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                "counters": dict(self.counters),
+                "pdfs": {uri: dict(entry) for uri, entry in self.pdfs.items()},
+            }
+
+    # === OUTPUT === #
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.finish(), indent=2, sort_keys=True))
+        return path
+
+    # Prometheus textfile-collector format (node_exporter --collector.textfile.directory).
+    # Only run-level series are exported; per-PDF detail stays in the JSON report.
+    def write_prometheus(self, path):
+        report = self.finish()
+        label = f'pipeline="{self.pipeline}"'
+        lines = [
+            f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Unix time the last run started.",
+            f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}_last_run_timestamp_seconds{{{label}}} {self.started_at:.0f}",
+            f"# HELP {METRIC_PREFIX}_wall_seconds Wall time of the last run.",
+            f"# TYPE {METRIC_PREFIX}_wall_seconds gauge",
+            f"{METRIC_PREFIX}_wall_seconds{{{label}}} {report['wall_seconds']:.6f}",
+            f"# HELP {METRIC_PREFIX}_stage_seconds Time spent per stage in the last run (summed across threads).",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds gauge",
+        ]
+        for stage, totals in sorted(report["stages"].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds{{{label},stage="{stage}"}} {totals["seconds"]:.6f}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_calls Number of timed calls per stage in the last run.",
+            f"# TYPE {METRIC_PREFIX}_stage_calls gauge",
+        ]
+        for stage, totals in sorted(report["stages"].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_calls{{{label},stage="{stage}"}} {totals["count"]}')
+        for counter, value in sorted(report["counters"].items()):
+            lines += [
+                f"# TYPE {METRIC_PREFIX}_{counter} gauge",
+                f"{METRIC_PREFIX}_{counter}{{{label}}} {value}",
+            ]
+        _write_atomic(path, "\n".join(lines) + "\n")
+        return path
+
+    def write(self, report_dir=DEFAULT_REPORT_DIR):
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        json_path = self.write_json(os.path.join(report_dir, f"{self.pipeline}-{stamp}.json"))
+        prom_path = self.write_prometheus(os.path.join(report_dir, f"{self.pipeline}.prom"))
+        print(f"Run report: {json_path} (Prometheus: {prom_path})")
+        return json_path, prom_path
+
+
+# Yields from `iterable`, adding the time spent waiting on each item to `stage`
+# (e.g. paginated listing, where fetching the next page happens inside next()).
+def timed_iter(iterable, metrics, stage):
+    items = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        finally:
+            metrics.add_time(stage, time.perf_counter() - start)
+        yield item
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# === OPTIONAL PROFILER FOR THE CLEANING STAGE === #
+# Wraps a stage function so its calls run under one cProfile.Profile, dumped to
+# `path` when the run ends (view with `python -m pstats` or snakeviz). The
+# cleaning stage runs on its own thread named "transform", which is also what
+# to look for in `py-spy dump` / `py-spy record --threads`.
+class StageProfiler:
+    def __init__(self, path):
+        import cProfile
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def wrap(self, fn):
+        def profiled(*args, **kwargs):
+            return self.profile.runcall(fn, *args, **kwargs)
+        return profiled
+
+    def dump(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.profile.dump_stats(self.path)
+        print(f"Cleaning profile: {self.path}")
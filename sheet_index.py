@@ -0,0 +1,256 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from extraction_engine import call_with_backoff
+from sheet_writer import column_letter
+
+DEFAULT_SHEET_INDEX_PATH = ".sheet_index.sqlite"
+# Joins a key's values in the SQLite cache.
+KEY_SEPARATOR = "\x1f"
+
+
+# The Sheets API hands numbers back as text ("1234.5", "0"), so a cell that
+# parses as a number is compared as that number.
+def _cell(value):
+    text = "" if value is None else str(value).strip()
+    try:
+        return repr(float(text))
+    except ValueError:
+        return text
+
+
+# Rows read back from the sheet lose their trailing empty cells, so rows are
+# padded to `width` first.
+def _fingerprint(row, width):
+    cells = [_cell(value) for value in row[:width]] + [""] * (width - len(row))
+    return hashlib.sha1(json.dumps(cells).encode("utf-8")).hexdigest()
+
+
+# === KEY INDEX OF A WORKSHEET: key -> row number === #
+# Dedup and upserts only need each row's key, so only row 1 and the key columns
+# are read, in one ranged batch_get, instead of every cell of the tab. The index
+# is cached in SQLite with the spreadsheet's change token (see
+# backends.*.change_token); when the token hasn't moved since the last run's
+# save(), nothing is read from the sheet at all. Rows are fingerprinted, so
+# replacing a row with identical values is skipped: with `read_values` (runs
+# that replace rows, i.e. --refresh) the load reads whole rows instead of just
+# the key columns; otherwise an existing row whose fingerprint isn't known is
+# read on demand, all of one upsert's rows in one ranged batch_get.
+#
+# Appended rows are assumed to land right below the last row the index knows
+# about (nobody else appends to the tab during a run); BufferedSheetWriter
+# checks that against each append's updatedRange.
+class SheetKeyIndex:
+    def __init__(self, spreadsheet, worksheet, headers, key_columns, path=DEFAULT_SHEET_INDEX_PATH, limiter=None,
+                 metrics=None, read_values=False):
+        self.spreadsheet = spreadsheet
+        self.worksheet = worksheet
+        self.headers = list(headers)
+        self.width = len(self.headers)
+        self.read_values = read_values
+        self.positions = [self.headers.index(col) for col in key_columns]
+        self.layout = json.dumps([self.headers, self.positions])
+        self.limiter = limiter
+        self.metrics = metrics
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS sheet_index_state (
+                sheet_key TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                layout TEXT NOT NULL,
+                header TEXT NOT NULL,
+                next_row INTEGER NOT NULL,
+                saved_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS sheet_index_rows (
+                sheet_key TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                row_number INTEGER NOT NULL,
+                fingerprint TEXT,
+                PRIMARY KEY (sheet_key, row_key)
+            )"""
+        )
+        self.conn.commit()
+        self.rows = {}
+        self.fingerprints = {}
+        # Values of the rows this run has read or written, by key.
+        self.values = {}
+        self.changed = set()
+        self.header = []
+        self.next_row = 2
+        self.from_cache = False
+        self.load()
+
+    def _call(self, fn, *args, limiter=None):
+        result = call_with_backoff(fn, *args, limiter=limiter, on_retry=self.metrics.retried if self.metrics else None)
+        if self.metrics is not None:
+            self.metrics.count("sheets_api_calls")
+        return result
+
+    # A Drive metadata read for Google Sheets, so it isn't held to the Sheets limiter.
+    def _change_token(self):
+        try:
+            return self._call(self.spreadsheet.change_token, self.worksheet)
+        except Exception as e:
+            print(f"No change token for '{self.worksheet.title}' ({e.__class__.__name__}: {e}); "
+                  f"reading its keys from the sheet.")
+            return None, None
+
+    def key_of(self, row):
+        return tuple(str(row[i]).strip() if i < len(row) else "" for i in self.positions)
+
+    def __contains__(self, row):
+        return self.key_of(row) in self.rows
+
+    def load(self):
+        self.sheet_key, token = self._change_token()
+        state = None
+        if token is not None and not self.read_values:
+            state = self.conn.execute(
+                "SELECT token, layout, header, next_row FROM sheet_index_state WHERE sheet_key = ?", (self.sheet_key,)
+            ).fetchone()
+        if state is not None and state[0] == token and state[1] == self.layout:
+            self.header, self.next_row = json.loads(state[2]), state[3]
+            cached = [
+                (tuple(row_key.split(KEY_SEPARATOR)), row_number, fingerprint)
+                for row_key, row_number, fingerprint in self.conn.execute(
+                    "SELECT row_key, row_number, fingerprint FROM sheet_index_rows WHERE sheet_key = ?",
+                    (self.sheet_key,)
+                )
+            ]
+            self.rows = {key: row_number for key, row_number, _ in cached}
+            self.fingerprints = {key: fingerprint for key, _, fingerprint in cached if fingerprint is not None}
+            self.from_cache = True
+            print(f"Key index for '{self.worksheet.title}': {len(self.rows)} key(s), unchanged since last run.")
+            return
+
+        if self.read_values:
+            header, values = self._call(
+                self.worksheet.batch_get, ["1:1", f"A2:{column_letter(self.width - 1)}"], limiter=self.limiter
+            )
+            length = len(values)
+            keys = [self.key_of(row) for row in values]
+            self.values = dict(zip(reversed(keys), (list(row) for row in reversed(values))))
+        else:
+            letters = [column_letter(i) for i in self.positions]
+            header, *columns = self._call(
+                self.worksheet.batch_get, ["1:1"] + [f"{c}2:{c}" for c in letters], limiter=self.limiter
+            )
+            columns = [[str(cells[0]).strip() if cells else "" for cells in column] for column in columns]
+            length = max((len(column) for column in columns), default=0)
+            keys = list(zip(*[column + [""] * (length - len(column)) for column in columns]))
+        self.header = list(header[0]) if header else []
+        # Built back to front so a key that appears twice maps to its first row.
+        self.rows = dict(zip(reversed(keys), range(length + 1, 1, -1)))
+        self.rows.pop(("",) * len(self.positions), None)
+        self.next_row = length + 2
+        self.changed = set(self.rows)
+        print(f"Key index for '{self.worksheet.title}': {len(self.rows)} key(s) read from {length} row(s).")
+
+    # Row 1 is rewritten in place only when it differs from `headers`.
+    def ensure_header(self):
+        if self.header == self.headers:
+            return False
+        header_range = f"A1:{column_letter(len(self.headers) - 1)}1"
+        self._call(self.worksheet.batch_update, [{"range": header_range, "values": [self.headers]}])
+        self.header = list(self.headers)
+        print(f"Headers set on '{self.worksheet.title}'.")
+        return True
+
+    # Reads the existing rows of `keys` whose values this run hasn't seen yet.
+    def _fetch(self, keys):
+        missing = [key for key in dict.fromkeys(keys) if key in self.rows and key not in self.values]
+        if not missing:
+            return
+        last = column_letter(self.width - 1)
+        numbers = [self.rows[key] for key in missing]
+        results = self._call(
+            self.worksheet.batch_get, [f"A{number}:{last}{number}" for number in numbers], limiter=self.limiter
+        )
+        for key, values in zip(missing, results):
+            self.values[key] = list(values[0]) if values else []
+
+    def _known_fingerprint(self, key):
+        fingerprint = self.fingerprints.get(key)
+        if fingerprint is None and key in self.values:
+            fingerprint = self.fingerprints[key] = _fingerprint(self.values[key], self.width)
+        return fingerprint
+
+    # The values each row's key currently holds in the sheet (padded to the
+    # headers), or None for keys that aren't there yet. Call before upsert().
+    def previous_values(self, rows):
+        keys = [self.key_of(row) for row in rows]
+        self._fetch(keys)
+        return [
+            self.values[key][:self.width] + [""] * (self.width - len(self.values[key])) if key in self.values else None
+            for key in keys
+        ]
+
+    # New keys are appended (they take the next row numbers, in order); with
+    # `replace`, rows whose key exists and whose values differ are rewritten in
+    # place. Returns "new", "updated" or None (skipped) per row.
+    def upsert(self, writer, rows, replace=False):
+        keys = [self.key_of(row) for row in rows]
+        if replace:
+            self._fetch([key for key in keys if key not in self.fingerprints])
+        first_row = self.next_row
+        appends, updates, statuses = [], [], []
+        for key, row in zip(keys, rows):
+            fingerprint = _fingerprint(row, self.width)
+            row_number = self.rows.get(key)
+            if row_number is None:
+                self.rows[key] = self.next_row
+                self.next_row += 1
+                appends.append(row)
+                statuses.append("new")
+            elif replace and self._known_fingerprint(key) != fingerprint:
+                updates.append((row_number, row))
+                statuses.append("updated")
+            else:
+                statuses.append(None)
+                continue
+            self.fingerprints[key] = fingerprint
+            self.values[key] = list(row)
+            self.changed.add(key)
+        if appends:
+            writer.extend(appends, first_row=first_row)
+        if updates:
+            writer.update_rows(updates)
+        return statuses
+
+    # Call once the writers have flushed, so the stored token covers this run's
+    # own writes.
+    def save(self):
+        token = self._change_token()[1]
+        with self.conn:
+            if token is None:
+                self.conn.execute("DELETE FROM sheet_index_state WHERE sheet_key = ?", (self.sheet_key,))
+                return
+            if not self.from_cache:
+                self.conn.execute("DELETE FROM sheet_index_rows WHERE sheet_key = ?", (self.sheet_key,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sheet_index_rows VALUES (?, ?, ?, ?)",
+                [
+                    (self.sheet_key, KEY_SEPARATOR.join(key), self.rows[key], self._known_fingerprint(key))
+                    for key in self.changed
+                ]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sheet_index_state VALUES (?, ?, ?, ?, ?, ?)",
+                (self.sheet_key, token, self.layout, json.dumps(self.header), self.next_row, time.time())
+            )
+        self.changed = set()
+        self.from_cache = True
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,176 @@
+import re
+import threading
+import time
+
+from extraction_engine import call_with_backoff
+
+
+# 0 -> "A", 25 -> "Z", 26 -> "AA"
+def column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+# gspread's append_rows returns the API response, whose updatedRange
+# ("'Sheet1'!A10:AA12") says which row the appended block starts on.
+def appended_row(response):
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = re.match(r"[A-Z]*(\d+)", updated_range.rsplit("!", 1)[-1])
+    return int(match.group(1)) if match else None
+
+
+# === BUFFERED SHEET WRITER === #
+# Collects rows in memory and writes them with a single append_rows call per
+# flush; rows replaced in place (update_rows, see sheet_index.SheetKeyIndex)
+# go out in one batch_update right after that append. A flush happens when
+# `flush_rows` rows are waiting, when `flush_seconds` have passed since the last
+# write (`first_flush_seconds` for the very first one, so rows show up in the
+# sheet shortly after a run starts), or when the writer is closed. The time
+# limit is checked whenever rows are queued and by maybe_flush(), which the
+# drivers call periodically so rows don't wait for the next PDF to finish.
+# Used as a context manager it also flushes whatever is buffered if the run
+# fails.
+#
+# Callers that number the rows they append (sheet_index.SheetKeyIndex) pass the
+# row the first one should land on; if an append lands elsewhere (someone else
+# wrote to the tab mid-run) the in-place updates of that flush are dropped and
+# the writer refuses further writes, since row numbers can no longer be trusted.
+class BufferedSheetWriter:
+    def __init__(self, worksheet, flush_rows=500, flush_seconds=30.0, value_input_option="RAW", limiter=None,
+                 first_flush_seconds=3.0, metrics=None):
+        self.worksheet = worksheet
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.first_flush_seconds = first_flush_seconds
+        self.flushed = False
+        self.value_input_option = value_input_option
+        self.limiter = limiter
+        self.metrics = metrics
+        self.buffer = []
+        self.updates = []
+        # Row the first buffered row should land on, when the caller said so.
+        self.expected_row = None
+        self.error = None
+        self.rows_written = 0
+        self.rows_updated = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def append(self, row):
+        self.extend([row])
+
+    def extend(self, rows, first_row=None):
+        self._queue(rows, [], first_row)
+
+    # `updates` holds (row number, values) pairs.
+    def update_rows(self, updates):
+        self._queue([], updates)
+
+    def _queue(self, rows, updates, first_row=None):
+        with self.lock:
+            if rows and not self.buffer:
+                self.expected_row = first_row
+            elif rows and (first_row is None or self.expected_row is None
+                           or first_row != self.expected_row + len(self.buffer)):
+                # Rows of unknown position are mixed in: nothing to check.
+                self.expected_row = None
+            self.buffer.extend(rows)
+            self.updates.extend(updates)
+            due = len(self.buffer) + len(self.updates) >= self.flush_rows or self._interval_passed()
+        if due:
+            self.flush()
+
+    def _interval_passed(self):
+        interval = self.flush_seconds if self.flushed else self.first_flush_seconds
+        return time.monotonic() - self.last_flush >= interval
+
+    # Flushes if rows are waiting and the flush interval has passed.
+    def maybe_flush(self):
+        with self.lock:
+            due = bool(self.buffer or self.updates) and self._interval_passed()
+        return self.flush() if due else 0
+
+    # Appends go first: an update may target a row appended in the same flush.
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            expected_row = self.expected_row
+            rows, self.buffer = self.buffer, []
+            updates, self.updates = self.updates, []
+            self.last_flush = time.monotonic()
+            if not rows and not updates:
+                return 0
+            on_retry = self.metrics.retried if self.metrics else None
+            start = time.perf_counter()
+            if rows:
+                try:
+                    response = call_with_backoff(
+                        self.worksheet.append_rows, rows, value_input_option=self.value_input_option,
+                        limiter=self.limiter, on_retry=on_retry
+                    )
+                except Exception:
+                    # Put the rows back so a later flush (or the caller) can retry them.
+                    self.buffer = rows + self.buffer
+                    self.updates = updates + self.updates
+                    self.expected_row = expected_row
+                    raise
+                self.rows_written += len(rows)
+                if self.metrics is not None:
+                    self.metrics.count("sheets_api_calls")
+                    self.metrics.count("sheet_rows_written", len(rows))
+                landed = appended_row(response)
+                if expected_row is not None and landed is not None and landed != expected_row:
+                    self.error = RuntimeError(
+                        f"Rows appended to '{self.worksheet.title}' landed at row {landed}, not {expected_row}: "
+                        f"the tab changed during the run. {len(updates)} in-place update(s) were not written; "
+                        f"rerun to pick them up."
+                    )
+                    raise self.error
+            if updates:
+                data = [
+                    {"range": f"A{number}:{column_letter(len(values) - 1)}{number}", "values": [list(values)]}
+                    for number, values in updates
+                ]
+                try:
+                    call_with_backoff(
+                        self.worksheet.batch_update, data, value_input_option=self.value_input_option,
+                        limiter=self.limiter, on_retry=on_retry
+                    )
+                except Exception:
+                    self.updates = updates + self.updates
+                    raise
+                self.rows_updated += len(updates)
+                if self.metrics is not None:
+                    self.metrics.count("sheets_api_calls")
+                    self.metrics.count("sheet_rows_updated", len(updates))
+            self.flushed = True
+            if self.metrics is not None:
+                self.metrics.add_time("sheet_write", time.perf_counter() - start)
+        if rows:
+            print(f"Wrote {len(rows)} row(s) to '{self.worksheet.title}'.")
+        if updates:
+            print(f"Updated {len(updates)} row(s) in place in '{self.worksheet.title}'.")
+        return len(rows) + len(updates)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        except Exception as e:
+            if exc_type is None:
+                raise
+            print(f"Could not flush buffered rows to '{self.worksheet.title}': {e}")
+        return False
@@ -0,0 +1,135 @@
+# === OWNER STATEMENT FIELDS, DEFINED ONCE === #
+# The prompt's field list, the model's response_schema, the cleaner's rename
+# maps, the sheet headers and the income / expense groupings are all generated
+# from this table. The model answers with the short keys; the labels are what
+# the statement prints (and what older cached responses and the text-layer
+# parser's grid use), so both map to the same sheet column.
+#
+# short key -> (sheet column, or None to drop it; label on the statement; "text" or "amount"; group)
+FIELDS = {
+    "owner": ("Owner", "Owner Name", "text", None),
+    "prepared_by": ("Postal Code", "Left Corner Address and Postal Code", "text", None),
+    "period": ("Statement Period", "Statement Period", "text", None),
+    "statement_date": (None, "Statement Date", "text", None),
+    "address": ("Property Address", "Address", "text", None),
+    "rent": ("Rent", "Rent Income", "amount", "income"),
+    "nsf_income": ("NSF Income", "NSF Fee Income", "amount", "income"),
+    "maintenance": ("Maintenance", "Maintenance Income", "amount", "income"),
+    "income_total": ("Income Total", "Total Income", "amount", "total"),
+    "general_repairs": ("General Repairs", "6800 - Common Area Repairs - 6865 - General Repairs/Maintenance",
+                        "amount", "expense"),
+    "appliance_repair": ("Appliance Repair", "6910 - Unit Repairs and Maintenance - Appliance Repair - 6915",
+                         "amount", "expense"),
+    "advertising": ("Advertising", "6700 - Billable Operating Expenses - 6710 - Advertising", "amount", "expense"),
+    "lease_up": ("Lease Up (Billable)", "6700 - Billable Operating Expenses - 6728 - Lease Up Expense",
+                 "amount", "expense"),
+    "plumbing": ("Plumbing", "6800 - Common Area Repairs - 6890 - Plumbing Repairs", "amount", "expense"),
+    "condo_fees": ("Condo Fees", "Condo Fees", "amount", "expense"),
+    "mgmt_fee": ("Mgmt Fee", "General Office Expenses - 6500 - 6585 - Management Fee Expense", "amount", "expense"),
+    "garbage_removal": ("Garbage Removal", "6800 - Common Area Repairs - 6860 Garbage/Large Item Removal",
+                        "amount", "expense"),
+    "hydro": ("Hydro", "6740 - Occupancy Costs - 6760 – Hydro", "amount", "expense"),
+    "other_billable": ("Other Billable", "6700 - Billable Operating Expenses – 6727", "amount", "expense"),
+    "electrical": ("Electrical", "6800 - Common Area Repairs - 6835 Electrical Repair", "amount", "expense"),
+    "credit_check_nb": ("Credit Check (NB)", "6700 - Non Billable Operating Expenses 6727 - Credit Check",
+                        "amount", "expense"),
+    "lease_up_nb": ("Lease Up (NB)", "6700 - Non Billable Operating Expenses 6728 - Lease Up Expense",
+                    "amount", "expense"),
+    "unit_cleaning": ("Unit Cleaning", "6910 - Unit Repairs and Maintenance - Unit Cleaning - 6950",
+                      "amount", "expense"),
+    "nsf_expense": ("NSF Expense", "NSF Fee (Expense)", "amount", "expense"),
+    "expenses_total": ("Expenses", "Total Expenses", "amount", "total"),
+    "net": ("Net", "Net Income", "amount", "total"),
+}
+
+# How the prompt describes a field when its label alone isn't enough.
+PROMPT_HINTS = {
+    "rent": '"Rent", "Gross Rent", or "Rent Income"',
+    "nsf_income": '"NSF Fee Income" or "NSF Fee"',
+    "condo_fees": '"Condo Fees" or similar (e.g., "Strata Fees")',
+    "nsf_expense": '"NSF Fee" at the bottom of the expense block',
+}
+
+# Columns clean_data derives from Statement Period.
+DERIVED_COLUMNS = ["Period Month", "Period Year"]
+
+# Order of the expense categories in Expenses Long and the category rollups,
+# which predates FIELDS and differs from the sheet's column order. Expense
+# fields missing here follow, in FIELDS order.
+EXPENSE_ORDER = [
+    "advertising", "hydro", "plumbing", "general_repairs", "appliance_repair", "lease_up", "condo_fees", "mgmt_fee",
+    "garbage_removal", "other_billable", "electrical", "credit_check_nb", "lease_up_nb", "unit_cleaning",
+    "nsf_expense",
+]
+
+# === GENERATED TABLES === #
+LABELS = {key: label for key, (_, label, _, _) in FIELDS.items()}
+KEY_COLUMNS = {key: column for key, (column, _, _, _) in FIELDS.items()}
+LABEL_COLUMNS = {label: column for _, (column, label, _, _) in FIELDS.items()}
+LABEL_KEYS = {label: key for key, label in LABELS.items()}
+
+SHEET_HEADERS = [column for column, _, _, _ in FIELDS.values() if column] + DERIVED_COLUMNS
+TEXT_COLUMNS = [column for column, _, kind, _ in FIELDS.values() if column and kind == "text"] + DERIVED_COLUMNS
+AMOUNT_KEYS = [key for key, (_, _, kind, _) in FIELDS.items() if kind == "amount"]
+INCOME_COLUMNS = [column for column, _, _, group in FIELDS.values() if group == "income"]
+EXPENSE_COLUMNS = [
+    KEY_COLUMNS[key] for key in sorted(
+        (key for key, (_, _, _, group) in FIELDS.items() if group == "expense"),
+        key=lambda key: EXPENSE_ORDER.index(key) if key in EXPENSE_ORDER else len(EXPENSE_ORDER)
+    )
+]
+
+
+def keys_in_group(group):
+    return [key for key, (_, _, _, field_group) in FIELDS.items() if field_group == group]
+
+
+# === PROMPT PIECES === #
+def prompt_field_list(indent="    "):
+    return "\n".join(f'{indent}"{key}" ({kind}): {label}' for key, (_, label, kind, _) in FIELDS.items())
+
+
+def prompt_label_list(group, indent="    "):
+    lines = []
+    for key in keys_in_group(group):
+        described = PROMPT_HINTS.get(key) or f'"{LABELS[key]}"'
+        lines.append(f'{indent}* {described} as "{key}"')
+    return "\n".join(lines)
+
+
+# === STRUCTURED OUTPUT === #
+# Vertex AI response_schema (OpenAPI subset): an array of per-property objects
+# with short keys; amounts are numbers, null when the statement has none.
+def response_schema():
+    properties = {
+        key: {"type": "string"} if kind == "text" else {"type": "number", "nullable": True}
+        for key, (_, _, kind, _) in FIELDS.items()
+    }
+    return {
+        "type": "array",
+        "items": {"type": "object", "properties": properties, "required": ["owner", "period", "address"]},
+    }
+
+
+def _number(value):
+    text = str(value).strip().replace("$", "").replace(",", "")
+    if text.startswith("(") and text.endswith(")"):
+        text = "-" + text[1:-1]
+    try:
+        return float(text)
+    except ValueError:
+        return value
+
+
+# Label-keyed record with printed amounts -> the short-key form the model
+# returns under response_schema (blank amounts dropped).
+def compact_record(record):
+    compact = {}
+    for label, value in record.items():
+        key = LABEL_KEYS.get(label, label)
+        if key in AMOUNT_KEYS:
+            if value in ("", None):
+                continue
+            value = _number(value)
+        compact[key] = value
+    return compact
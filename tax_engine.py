@@ -0,0 +1,147 @@
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+
+# === RATE TABLES === #
+# City of Kingston residential rates, as a percentage of assessment. Add a new
+# version when rates are published or corrected instead of editing an existing
+# one, so earlier results can be reproduced. A CSV with Year,Rate columns can
+# be loaded with load_rate_table() to override the built-in tables.
+RATE_TABLES = {
+    "kingston-residential-2025": {
+        2020: 1.309528, 2021: 1.365454, 2022: 1.399366, 2023: 1.444608, 2024: 1.478321,
+        2025: 1.556000,  # only if confirmed
+    },
+}
+DEFAULT_RATE_VERSION = "kingston-residential-2025"
+
+# === BILLING RULES === #
+YEARS = range(2021, 2026)
+INTERIM_SHARE = 0.5  # first half (interim) bill = 50% of the previous year's tax
+FINAL_BILL_PENDING = {2025}  # years whose final (second half) bill isn't out yet
+
+# Raw facts the model extracts; everything else is computed here.
+FACT_COLUMNS = ["Property Address", "Roll Number", "Year", "Assessment Value", "Tax Rate", "Property Tax"]
+FACT_NUMERIC_COLUMNS = ["Year", "Assessment Value", "Tax Rate", "Property Tax"]
+
+SUMMARY_COLUMNS = [
+    "Property Address", "Roll Number", "Assessment Value", "Year", "Tax Rate Used",
+    "Property Tax", "First Half Payment", "Second Half Payment", "Monthly Payment"
+]
+
+NUMBER_RE = re.compile(r"[$,%\s]")
+
+
+def rate_table(version=DEFAULT_RATE_VERSION):
+    try:
+        return RATE_TABLES[version]
+    except KeyError:
+        raise ValueError(f"Unknown rate table '{version}'. Known: {', '.join(sorted(RATE_TABLES))}") from None
+
+
+def load_rate_table(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return {int(row["Year"]): float(NUMBER_RE.sub("", row["Rate"])) for row in csv.DictReader(f)}
+
+
+# === NORMALIZE EXTRACTED FACTS === #
+def facts_frame(records):
+    facts = pd.DataFrame(records).reindex(columns=FACT_COLUMNS)
+    for col in ["Property Address", "Roll Number"]:
+        facts[col] = facts[col].fillna("").astype(str).str.strip()
+    for col in FACT_NUMERIC_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(facts[col]):
+            facts[col] = facts[col].astype(str).str.replace(NUMBER_RE, "", regex=True)
+        facts[col] = pd.to_numeric(facts[col], errors="coerce")
+    return facts
+
+
+def _fill_along_years(values):
+    # Forward fill each property's row, then back fill what is still missing.
+    for flip in (False, True):
+        values = values[:, ::-1] if flip else values
+        positions = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+        np.maximum.accumulate(positions, axis=1, out=positions)
+        values = values[np.arange(values.shape[0])[:, None], positions]
+        values = values[:, ::-1] if flip else values
+    return values
+
+
+def _scatter_first(shape, rows, cols, values, fill=np.nan):
+    # out[row, col] = the first non-missing value for that cell.
+    out = np.full(shape, fill, dtype=object if fill == "" else float)
+    present = values != "" if fill == "" else ~np.isnan(values)
+    rows, cols, values = rows[present][::-1], cols[present][::-1], values[present][::-1]
+    out[rows, cols] = values  # reversed, so the first occurrence is written last and wins
+    return out
+
+
+# === COMPUTE DERIVED TAX COLUMNS (one vectorized pass) === #
+# For every property and every year in `years`:
+#   Tax Rate Used   = printed rate, else the rate table's rate
+#   Property Tax    = printed tax, else Assessment Value x Tax Rate Used
+#   First Half      = INTERIM_SHARE x previous year's Property Tax (the year
+#                     before the first one is computed the same way)
+#   Second Half     = Property Tax - First Half, or 0.0 while the final bill is pending
+#   Monthly Payment = Property Tax / 12
+# Year-specific assessments are used when printed; other years reuse the
+# nearest earlier (else later) one, or an assessment printed without a year.
+# Money is rounded to cents; rates keep the rate table's precision.
+# `group_column` keeps properties from different sources (e.g. PDFs) apart.
+# Facts are scattered into (property x year) arrays so every rule is a NumPy
+# operation over all properties at once.
+def compute_tax(facts, rates=None, years=YEARS, group_column=None):
+    rates = rate_table() if rates is None else rates
+    facts = facts if isinstance(facts, pd.DataFrame) else facts_frame(facts)
+    keys = ([group_column] if group_column else []) + ["Property Address"]
+    columns = ([group_column] if group_column else []) + SUMMARY_COLUMNS
+    facts = facts[facts["Property Address"] != ""]
+    if facts.empty:
+        return pd.DataFrame(columns=columns)
+
+    all_years = np.array([min(years) - 1] + list(years))
+    codes, properties = pd.MultiIndex.from_frame(facts[keys]).factorize()
+    year = facts["Year"].to_numpy()
+    dated = np.isin(year, all_years)
+    shape = (len(properties), len(all_years))
+    rows, cols = codes[dated], np.searchsorted(all_years, year[dated])
+
+    assessment = _scatter_first(shape, rows, cols, facts["Assessment Value"].to_numpy()[dated])
+    undated = np.isnan(year)
+    undated_assessment = _scatter_first(
+        (len(properties), 1), codes[undated], np.zeros(undated.sum(), dtype=int),
+        facts["Assessment Value"].to_numpy()[undated]
+    )
+    assessment = _fill_along_years(assessment)
+    assessment = np.where(np.isnan(assessment), undated_assessment, assessment)
+    roll_number = _scatter_first(
+        (len(properties), 1), codes, np.zeros(len(codes), dtype=int), facts["Roll Number"].to_numpy(), fill=""
+    )[:, 0]
+
+    table_rate = np.array([rates.get(int(y), np.nan) for y in all_years])
+    rate = _scatter_first(shape, rows, cols, facts["Tax Rate"].to_numpy()[dated])
+    rate = np.where(np.isnan(rate), table_rate, rate)
+    tax = _scatter_first(shape, rows, cols, facts["Property Tax"].to_numpy()[dated])
+    tax = np.where(np.isnan(tax), assessment * rate / 100, tax).round(2)
+
+    first_half = (tax[:, :-1] * INTERIM_SHARE).round(2)
+    tax, rate, assessment = tax[:, 1:], rate[:, 1:], assessment[:, 1:]
+    pending = np.isin(all_years[1:], list(FINAL_BILL_PENDING))
+    second_half = np.where(pending, 0.0, tax - first_half).round(2)
+
+    n_years = len(all_years) - 1
+    summary = pd.DataFrame({
+        **{key: properties.get_level_values(i).repeat(n_years) for i, key in enumerate(keys)},
+        "Roll Number": roll_number.repeat(n_years),
+        "Assessment Value": assessment.round(2).ravel(),
+        "Year": np.tile(all_years[1:], len(properties)),
+        "Tax Rate Used": rate.ravel(),
+        "Property Tax": tax.ravel(),
+        "First Half Payment": first_half.ravel(),
+        "Second Half Payment": second_half.ravel(),
+        "Monthly Payment": (tax / 12).round(2).ravel(),
+    }, columns=columns)
+    # Left blank only when a value can't be extracted or inferred.
+    return summary.astype(object).where(summary.notna(), "")
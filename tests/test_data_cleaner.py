@@ -0,0 +1,81 @@
+import json
+
+import pandas as pd
+
+from benchmarks.bench_clean_data import check_equivalence, synthetic_records
+from data_cleaner import clean_records, melt_expenses
+
+
+def test_batch_cleaning_matches_per_row_cleaning():
+    check_equivalence(synthetic_records(100))
+
+
+def test_currency_strings_become_numbers():
+    df = clean_records([{
+        "Owner Name": "Jane Doe",
+        "Statement Period": "2024-03-01 - 2024-03-31",
+        "Address": "12 King St.",
+        "Rent Income": "$1,234.50",
+        "6740 - Occupancy Costs - 6760 – Hydro": "$80.25",
+        "Total Income": 1234.5,
+    }])
+    assert df["Rent"].iloc[0] == 1234.5
+    assert df["Hydro"].iloc[0] == 80.25
+    assert df["Income Total"].iloc[0] == 1234.5
+    assert pd.api.types.is_numeric_dtype(df["Rent"])
+
+
+def test_short_keys_and_labels_clean_the_same():
+    labelled = clean_records([{
+        "Owner Name": "Jane Doe", "Statement Period": "2024-03-01 - 2024-03-31", "Address": "12 King St",
+        "Rent Income": "$900.00",
+    }])
+    compact = clean_records([{
+        "owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "12 King St", "rent": 900,
+    }])
+    assert labelled["Rent"].iloc[0] == compact["Rent"].iloc[0] == 900
+
+
+def test_melt_expenses_drops_zero_categories():
+    df = clean_records([{
+        "owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "12 King St",
+        "hydro": 80.25, "plumbing": 0,
+    }])
+    long_df = melt_expenses(df)
+    assert list(long_df["Expense Category"]) == ["Hydro"]
+    # Expenses Long keeps its own category order (Hydro before Plumbing), not the sheet's.
+    assert list(melt_expenses(df, drop_zero=False)["Expense Category"]) == ["Hydro", "Plumbing"]
+
+
+def test_records_with_different_keys_clean_like_single_rows():
+    records = [
+        {"owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "12 King St",
+         "statement_date": "2024-03-31", "prepared_by": "1 Bath Rd K7M 1A1", "rent": 900},
+        {"owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "40 Brock St", "hydro": "$80.25"},
+    ]
+    df = clean_records(records)
+    assert list(df["Property Address"]) == ["12 King St", "40 Brock St"]
+    assert list(df["Rent"]) == [900.0, 0.0] and list(df["Hydro"]) == [0.0, 80.25]
+    assert list(df["Postal Code"]) == ["K7M 1A1", ""]
+    check_equivalence(records)
+
+
+def test_reclean_reads_a_cache_mixing_labels_and_short_keys(tmp_path):
+    import Pdfs_data_extracted
+    from extraction_cache import ExtractionCache
+
+    cache_path = str(tmp_path / "cache.sqlite")
+    cache = ExtractionCache(cache_path)
+    old = {"Owner Name": "Jane Doe", "Statement Period": "2024-02-01 - 2024-02-29", "Address": "12 King St",
+           "Rent Income": "$900.00"}
+    new = {"owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "12 King St", "rent": 950}
+    cache.put("old", "gs://b/feb.pdf", Pdfs_data_extracted.MODEL_NAME, "old prompt", json.dumps(old))
+    cache.put("new", "gs://b/mar.pdf", Pdfs_data_extracted.MODEL_NAME, "new prompt", json.dumps([new]))
+    cache.close()
+
+    df = Pdfs_data_extracted.reclean(cache_path, str(tmp_path / "out"))
+    assert list(df["Statement Period"]) == ["2024-02-01 - 2024-02-29", "2024-03-01 - 2024-03-31"]
+    assert list(df["Owner"]) == ["Jane Doe", "Jane Doe"]
+    assert list(df["Rent"]) == [900.0, 950.0]
+    written = pd.read_csv(tmp_path / "out" / "pdf_extracted.csv")
+    assert list(written["Property Address"]) == ["12 King St", "12 King St"]
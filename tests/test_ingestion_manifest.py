@@ -0,0 +1,22 @@
+from types import SimpleNamespace
+
+from ingestion_manifest import IngestionManifest
+
+
+def _blob(name, generation):
+    return SimpleNamespace(name=name, generation=generation)
+
+
+def test_changed_blobs_are_reported_as_they_are_listed(tmp_path):
+    manifest = IngestionManifest("statements", str(tmp_path / "manifest.sqlite"))
+    manifest.mark_done_many([(_blob("a.pdf", 1), 2), (_blob("b.pdf", 1), 3)])
+    listed = [_blob("a.pdf", 1), _blob("b.pdf", 2), _blob("c.pdf", 1)]
+
+    changed = set()
+    assert [blob.name for blob in manifest.iter_pending(listed, changed=changed)] == ["b.pdf", "c.pdf"]
+    assert changed == {"b.pdf"}
+
+    changed = set()
+    pending = manifest.iter_pending(listed, changed=changed, include_done=True)
+    assert [blob.name for blob in pending] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert changed == {"b.pdf"}
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+from parquet_sink import ParquetSink
+
+COLUMNS = ["Owner", "Property Address", "Rent", "Period Month", "Period Year"]
+TEXT = ["Owner", "Property Address", "Period Month", "Period Year"]
+
+
+def _sink(root, **kwargs):
+    return ParquetSink(root, "pdf_extracted", COLUMNS, TEXT, key_columns=["Owner", "Property Address"], **kwargs)
+
+
+def _rows():
+    return [
+        ["Jane Doe", "12 King St", 900.0, "March", "2024"],
+        ["Jane Doe", "40 Brock St", 950.0, "April", "2024"],
+        ["Jane Doe", "12 King St", 800.0, "March", ""],
+    ]
+
+
+def test_tables_read_back_as_datasets(tmp_path):
+    with _sink(tmp_path) as sink:
+        sink.append_rows(_rows())
+    table_dir = tmp_path / "pdf_extracted"
+    assert sorted(os.listdir(table_dir)) == ["2024", "unknown"]
+
+    df = pd.read_parquet(table_dir).sort_values(["Period Year", "Rent"]).reset_index(drop=True)
+    assert list(df.columns) == COLUMNS
+    assert list(df["Period Year"]) == ["", "2024", "2024"]
+    assert list(df["Rent"]) == [800.0, 900.0, 950.0]
+    assert ds.dataset(table_dir, format="parquet", partitioning="hive").to_table().num_rows == 3
+
+    tax = ParquetSink(tmp_path, "property_tax_summary", ["Property Address", "Year", "Total"],
+                      ["Property Address", "Year"], partition_cols=["Year"])
+    with tax:
+        tax.append_rows([["12 King St", "2024", 3100.0], ["12 King St", "2023", 2900.0]])
+    assert sorted(pd.read_parquet(tmp_path / "property_tax_summary")["Year"]) == ["2023", "2024"]
+
+
+def test_hive_style_directories_are_moved_to_the_plain_layout(tmp_path):
+    with _sink(tmp_path) as sink:
+        sink.append_rows(_rows()[:1])
+    table_dir = tmp_path / "pdf_extracted"
+    os.renames(table_dir / "2024" / "March", table_dir / "Period Year=2024" / "Period Month=March")
+
+    with _sink(tmp_path) as sink:
+        sink.remove_rows(_rows()[:1])
+        sink.append_rows([["Jane Doe", "12 King St", 925.0, "March", "2024"]])
+    assert os.listdir(table_dir) == ["2024"]
+    df = pd.read_parquet(table_dir)
+    assert list(df["Rent"]) == [925.0]
+
+
+def test_failed_run_writes_nothing(tmp_path):
+    with _sink(tmp_path) as sink:
+        sink.append_rows(_rows()[:1])
+    with pytest.raises(RuntimeError), _sink(tmp_path) as sink:
+        sink.remove_rows(_rows()[:1])
+        sink.append_rows(_rows()[1:])
+        raise RuntimeError("append_rows failed")
+    df = pd.read_parquet(tmp_path / "pdf_extracted")
+    assert list(df["Rent"]) == [900.0]
@@ -0,0 +1,40 @@
+from property_registry import PropertyRegistry, canonical_address
+
+
+def test_addresses_are_canonicalized():
+    assert canonical_address("12 King Street East, Kingston ON K7L 1A1") == "12 king st e"
+    assert canonical_address("Unit 5, 123 Main Street") == canonical_address("5-123 Main St") == "123 main st unit 5"
+
+
+def test_spelling_variants_resolve_to_one_property(tmp_path):
+    registry = PropertyRegistry(str(tmp_path / "registry.sqlite"))
+    first = registry.resolve("12 Princess Street, Kingston")
+    assert registry.resolve("12 Princes St") == first
+    assert registry.resolve("14 Princess St") != first
+    assert registry.resolve("Unit 2, 12 Princess St") != first
+
+
+def test_directions_must_agree(tmp_path):
+    registry = PropertyRegistry(str(tmp_path / "registry.sqlite"))
+    plain = registry.resolve("12 King St")
+    east = registry.resolve("12 King St E")
+    west = registry.resolve("12 King Street West")
+    assert len({plain, east, west}) == 3
+    assert registry.resolve("12 King St. East") == east
+
+
+def test_conflicting_postal_codes_are_different_properties(tmp_path):
+    registry = PropertyRegistry(str(tmp_path / "registry.sqlite"))
+    first = registry.resolve("40 Brock St", "K7L 1R9")
+    assert registry.resolve("40 Brok St", "K7L 1R9") == first
+    assert registry.resolve("40 Brok Street", "K7M 2B4") != first
+
+
+def test_ids_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "registry.sqlite")
+    registry = PropertyRegistry(path)
+    first = registry.resolve("12 King St E")
+    registry.close()
+    reopened = PropertyRegistry(path)
+    assert reopened.resolve("12 King Street East") == first
+    assert reopened.resolve("99 Ontario St") == first + 1
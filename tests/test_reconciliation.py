@@ -0,0 +1,52 @@
+import pandas as pd
+
+from data_cleaner import clean_records
+from reconciliation import FAILURE_COLUMNS, check_statements, reconcile_frames
+
+
+def _statement(address, rent=900.0, hydro=80.0, **totals):
+    record = {
+        "owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": address, "rent": rent, "hydro": hydro,
+        "income_total": rent, "expenses_total": hydro, "net": rent - hydro,
+    }
+    record.update(totals)
+    return record
+
+
+def test_sums_within_the_tolerance_pass():
+    df = clean_records([_statement("12 King St", net=820.005), _statement("40 Brock St", net=820.5)])
+    failures = check_statements(df)
+    assert list(failures.columns) == FAILURE_COLUMNS
+    assert list(failures.index) == [1]
+    assert failures.iloc[0]["Check"] == "Net = Income Total - Expenses"
+    assert (failures.iloc[0]["Expected"], failures.iloc[0]["Actual"], failures.iloc[0]["Difference"]) == (
+        820.0, 820.5, 0.5
+    )
+    assert check_statements(df, tolerance=1.0).empty
+
+
+def test_unparsed_amounts_fail_even_when_the_sums_agree():
+    df = clean_records([{
+        "owner": "Jane Doe", "period": "2024-03-01 - 2024-03-31", "address": "12 King St", "rent": "12,3x",
+        "income_total": 0, "hydro": 80.0, "expenses_total": 80.0, "net": -80.0,
+    }])
+    failures = check_statements(df)
+    assert list(failures["Check"]) == ["Unparsed: Rent"]
+    assert failures.iloc[0]["Property Address"] == "12 King St"
+
+
+def test_frames_are_split_per_pdf():
+    good = clean_records([_statement("12 King St")])
+    mixed = clean_records([_statement("40 Brock St"), _statement("7 Earl St", expenses_total=100.0, net=800.0)])
+    results = reconcile_frames([good, None, pd.DataFrame(), mixed])
+
+    assert len(results) == 4
+    passed, failures = results[0]
+    assert list(passed["Property Address"]) == ["12 King St"] and failures.empty
+    assert results[1][0] is None and results[1][1].empty
+    assert results[2][0].empty and results[2][1].empty
+    passed, failures = results[3]
+    assert list(passed["Property Address"]) == ["40 Brock St"]
+    assert list(failures["Property Address"]) == ["7 Earl St"]
+    assert list(failures["Check"]) == ["Expenses = sum of expense categories"]
+    assert list(failures.index) == [0]
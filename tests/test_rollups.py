@@ -0,0 +1,81 @@
+from contextlib import ExitStack
+
+import pandas as pd
+import pytest
+
+from rollups import WIDE_MEASURES, RollupSink
+from sheet_writer import BufferedSheetWriter
+
+
+def _statement(address, month, **amounts):
+    row = {
+        "Owner": "Jane Doe", "Property Address": address,
+        "Statement Period": f"2024-{month:02d}-01 - 2024-{month:02d}-28",
+        "Period Year": "2024", "Period Month": pd.Timestamp(2024, month, 1).month_name(),
+    }
+    row.update(amounts)
+    return row
+
+
+def _run(root, rows, **kwargs):
+    with RollupSink(root, **kwargs) as sink:
+        sink.append(pd.DataFrame(rows))
+
+
+def test_categories_missing_from_a_run_are_kept(tmp_path):
+    _run(tmp_path, [_statement("12 King St", 1, **{"Hydro": 80.0, "Income Total": 900.0, "Expenses": 80.0})])
+    _run(tmp_path, [_statement("12 King St", 2, **{"Electrical": 50.0, "Income Total": 900.0, "Expenses": 50.0})])
+    owner_year = RollupSink(tmp_path).load("owner_year")
+    assert list(owner_year.columns) == ["Owner", "Period Year"] + WIDE_MEASURES + ["Count"]
+    row = owner_year.iloc[0]
+    assert (row["Hydro"], row["Electrical"], row["Expenses"], row["Count"]) == (80.0, 50.0, 130.0, 2)
+
+    categories = RollupSink(tmp_path).load("category_month").set_index(["Expense Category", "Period Month"])
+    assert categories.loc[("Hydro", "January"), "Amount"] == 80.0
+    assert categories.loc[("Electrical", "February"), "Amount"] == 50.0
+
+
+def test_removed_rows_are_subtracted(tmp_path):
+    _run(tmp_path, [
+        _statement("12 King St", 1, **{"Hydro": 80.0, "Income Total": 900.0}),
+        _statement("40 Brock St", 1, **{"Hydro": 20.0, "Income Total": 500.0}),
+    ])
+    with RollupSink(tmp_path) as sink:
+        # Old values come back from the sheet as text.
+        sink.remove(pd.DataFrame([_statement("12 King St", 1, **{"Hydro": "80", "Income Total": "900"})]))
+        sink.append(pd.DataFrame([_statement("12 King St", 1, **{"Plumbing": 15.0, "Income Total": 950.0})]))
+
+    owner_year = RollupSink(tmp_path).load("owner_year").iloc[0]
+    assert (owner_year["Hydro"], owner_year["Plumbing"], owner_year["Income Total"], owner_year["Count"]) == (
+        20.0, 15.0, 1450.0, 2
+    )
+    categories = RollupSink(tmp_path).load("category_month").set_index("Expense Category")
+    assert categories.loc["Hydro", "Amount"] == 20.0 and categories.loc["Hydro", "Count"] == 1
+    assert categories.loc["Plumbing", "Amount"] == 15.0
+
+
+def test_rebuild_replaces_the_stored_totals(tmp_path):
+    rows = [_statement("12 King St", 1, **{"Hydro": 80.0, "Income Total": 900.0})]
+    for _ in range(2):
+        _run(tmp_path, rows, rebuild=True)
+    property_month = RollupSink(tmp_path).load("property_month").iloc[0]
+    assert (property_month["Hydro"], property_month["Count"]) == (80.0, 1)
+
+
+class _FailingSheet:
+    title = "pdf_extracted"
+
+    def append_rows(self, rows, **kwargs):
+        raise RuntimeError("quota exhausted")
+
+
+def test_failed_run_leaves_the_totals_alone(tmp_path):
+    rows = [_statement("12 King St", 1, **{"Hydro": 80.0, "Income Total": 900.0})]
+    _run(tmp_path, rows)
+    # The sink is entered before the writer, as in the pipelines, so it sees the writer's failure.
+    with pytest.raises(RuntimeError), ExitStack() as stack:
+        sink = stack.enter_context(RollupSink(tmp_path))
+        writer = stack.enter_context(BufferedSheetWriter(_FailingSheet(), first_flush_seconds=3600))
+        writer.extend([["12 King St"]])
+        sink.append(pd.DataFrame(rows))
+    assert RollupSink(tmp_path).load("owner_year").iloc[0]["Count"] == 1
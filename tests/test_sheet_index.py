@@ -0,0 +1,78 @@
+import pytest
+
+from backends import MemorySpreadsheet
+from sheet_index import SheetKeyIndex
+from sheet_writer import BufferedSheetWriter
+
+HEADERS = ["Owner", "Property Address", "Rent", "Net"]
+KEYS = ["Owner", "Property Address"]
+
+
+@pytest.fixture
+def spreadsheet():
+    spreadsheet = MemorySpreadsheet(read_quota_per_minute=None, write_quota_per_minute=None)
+    # As read back from Google Sheets: numbers come back as text.
+    spreadsheet.sheet1.rows = [list(HEADERS), ["Jane Doe", "12 King St", "900", "850.5"],
+                               ["Jane Doe", "40 Brock St", "700", "0"]]
+    return spreadsheet
+
+
+def _index(spreadsheet, tmp_path, **kwargs):
+    return SheetKeyIndex(spreadsheet, spreadsheet.sheet1, HEADERS, KEYS, str(tmp_path / "index.sqlite"), **kwargs)
+
+
+def _upsert(index, rows, replace=False):
+    with BufferedSheetWriter(index.worksheet, first_flush_seconds=3600) as writer:
+        return index.upsert(writer, rows, replace=replace)
+
+
+def test_new_keys_are_appended_and_known_keys_skipped(spreadsheet, tmp_path):
+    index = _index(spreadsheet, tmp_path)
+    statuses = _upsert(index, [["Jane Doe", "12 King St", 999.0, 1.0], ["Jane Doe", "5 Union St", 500.0, 400.0]])
+    assert statuses == [None, "new"]
+    assert spreadsheet.sheet1.rows[3] == ["Jane Doe", "5 Union St", 500.0, 400.0]
+    assert index.rows[("Jane Doe", "5 Union St")] == 4
+
+
+def test_unchanged_sheet_is_not_read_again(spreadsheet, tmp_path):
+    index = _index(spreadsheet, tmp_path)
+    index.save()
+    index.close()
+    calls = spreadsheet.api_calls()
+    index = _index(spreadsheet, tmp_path)
+    assert index.from_cache and spreadsheet.api_calls() == calls
+    assert ("Jane Doe", "40 Brock St") in index.rows
+
+
+def test_edited_sheet_is_reloaded(spreadsheet, tmp_path):
+    _index(spreadsheet, tmp_path).save()
+    spreadsheet.sheet1.append_rows([["R Patel", "9 Bath Rd", "100", "100"]])
+    index = _index(spreadsheet, tmp_path)
+    assert not index.from_cache and ("R Patel", "9 Bath Rd") in index.rows
+
+
+@pytest.mark.parametrize("read_values", [True, False])
+def test_refresh_rewrites_only_changed_rows(spreadsheet, tmp_path, read_values):
+    index = _index(spreadsheet, tmp_path, read_values=read_values)
+    rows = [["Jane Doe", "12 King St", 900.0, 850.5], ["Jane Doe", "40 Brock St", 750.0, 50.0]]
+    assert index.previous_values(rows) == [["Jane Doe", "12 King St", "900", "850.5"],
+                                           ["Jane Doe", "40 Brock St", "700", "0"]]
+    assert _upsert(index, rows, replace=True) == [None, "updated"]
+    assert spreadsheet.sheet1.rows[1] == ["Jane Doe", "12 King St", "900", "850.5"]
+    assert spreadsheet.sheet1.rows[2] == ["Jane Doe", "40 Brock St", 750.0, 50.0]
+    # Replacing with the same values again writes nothing.
+    assert _upsert(index, rows, replace=True) == [None, None]
+
+
+def test_append_landing_elsewhere_stops_the_writer(spreadsheet, tmp_path):
+    index = _index(spreadsheet, tmp_path)
+    writer = BufferedSheetWriter(spreadsheet.sheet1, first_flush_seconds=3600)
+    spreadsheet.sheet1.append_rows([["Someone Else", "1 Elsewhere", "1", "1"]])
+    index.upsert(writer, [["Jane Doe", "5 Union St", 500.0, 400.0]])
+    index.upsert(writer, [["Jane Doe", "40 Brock St", 1.0, 1.0]], replace=True)
+    with pytest.raises(RuntimeError, match="landed at row 5, not 4"):
+        writer.flush()
+    # The in-place update was dropped rather than written to a row that may have moved.
+    assert spreadsheet.sheet1.rows[2] == ["Jane Doe", "40 Brock St", "700", "0"]
+    with pytest.raises(RuntimeError):
+        writer.close()
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from tax_engine import INTERIM_SHARE, compute_tax, facts_frame, rate_table
+
+RATES = rate_table()
+
+
+def _row(summary, year):
+    return summary[summary["Year"] == year].iloc[0]
+
+
+def test_facts_frame_parses_printed_strings():
+    facts = facts_frame([{
+        "Property Address": " 12 King St ", "Roll Number": 1011, "Year": "2024",
+        "Assessment Value": "$450,000", "Tax Rate": "1.5%", "Property Tax": "$6,750.00",
+    }])
+    row = facts.iloc[0]
+    assert row["Property Address"] == "12 King St"
+    assert row["Roll Number"] == "1011"
+    assert (row["Year"], row["Assessment Value"], row["Tax Rate"], row["Property Tax"]) == (2024, 450000, 1.5, 6750)
+
+
+def test_string_assessment_uses_rate_table():
+    summary = compute_tax([{"Property Address": "12 King St", "Year": "2024", "Assessment Value": "$450,000"}])
+    row = _row(summary, 2024)
+    assert row["Tax Rate Used"] == RATES[2024]
+    assert row["Property Tax"] == round(450000 * RATES[2024] / 100, 2)
+    assert row["Monthly Payment"] == round(row["Property Tax"] / 12, 2)
+
+
+def test_printed_tax_and_rate_win_over_the_rate_table():
+    summary = compute_tax([{
+        "Property Address": "12 King St", "Year": "2024", "Assessment Value": "$450,000",
+        "Tax Rate": "1.5%", "Property Tax": "$6,000.00",
+    }])
+    row = _row(summary, 2024)
+    assert (row["Tax Rate Used"], row["Property Tax"]) == (1.5, 6000.0)
+
+
+def test_halves_follow_the_billing_rules():
+    summary = compute_tax([
+        {"Property Address": "12 King St", "Year": "2023", "Property Tax": "$5,000.00"},
+        {"Property Address": "12 King St", "Year": "2024", "Property Tax": "$6,000.00"},
+        {"Property Address": "12 King St", "Year": "2025", "Property Tax": "$6,400.00"},
+    ])
+    row_2024 = _row(summary, 2024)
+    assert row_2024["First Half Payment"] == 5000 * INTERIM_SHARE
+    assert row_2024["Second Half Payment"] == 6000 - 5000 * INTERIM_SHARE
+    # The 2025 final bill isn't out yet.
+    assert _row(summary, 2025)["Second Half Payment"] == 0.0
+
+
+def test_assessment_carries_to_years_without_one():
+    summary = compute_tax([{"Property Address": "12 King St", "Year": "2022", "Assessment Value": "300,000"}])
+    assert set(summary["Assessment Value"]) == {300000.0}
+    assert _row(summary, 2023)["Property Tax"] == pytest.approx(round(300000 * RATES[2023] / 100, 2))
+
+
+def test_string_dtype_columns_are_cleaned():
+    records = pd.DataFrame({
+        "Property Address": ["12 King St"], "Year": pd.array(["2024"], dtype="string"),
+        "Assessment Value": pd.array(["$450,000"], dtype="string"),
+    })
+    facts = facts_frame(records)
+    assert facts["Assessment Value"].iloc[0] == 450000
@@ -0,0 +1,28 @@
+from benchmarks.synthetic_pdf import pdf_bytes, statement_pdf_bytes, statement_records
+from data_cleaner import clean_records
+from text_extractor import parse_statement_pdf
+
+
+def test_a_reconciling_statement_parses_with_full_confidence():
+    records = statement_records(2, seed=1)
+    parsed, confidence, note = parse_statement_pdf(statement_pdf_bytes(records))
+    assert (confidence, note) == (1.0, "")
+    df = clean_records(parsed)
+    assert list(df["Property Address"]) == [record["Address"] for record in records]
+    assert list(df["Income Total"]) == [float(record["Total Income"].replace(",", "")) for record in records]
+    assert df["Owner"].iloc[0] == records[0]["Owner Name"]
+
+
+def test_a_statement_that_does_not_add_up_loses_confidence():
+    records = statement_records(2, seed=1)
+    records[0]["Net Income"] = "1.00"
+    parsed, confidence, _ = parse_statement_pdf(statement_pdf_bytes(records))
+    assert len(parsed) == 2
+    assert 0 < confidence < 1.0
+
+
+def test_unreadable_and_scanned_pdfs_score_zero():
+    parsed, confidence, note = parse_statement_pdf(b"not a pdf")
+    assert (parsed, confidence) == ([], 0.0) and note.startswith("unreadable PDF")
+    # A page without a text layer, as a scan has.
+    assert parse_statement_pdf(pdf_bytes([[]])) == ([], 0.0, "no text layer")
@@ -0,0 +1,255 @@
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_cache import ExtractionCache, blob_uri
+from statement_schema import LABELS, compact_record, keys_in_group
+
+# Name the local extractor's answers are cached under, next to the model's own.
+# Bump the version whenever parse_statement_pdf's output can change.
+LOCAL_MODEL_NAME = "text-layer-v2"
+MIN_CONFIDENCE = 1.0
+
+# The statement's labels, in the prompt's order. Records are built on these
+# and returned in the model's short-key form (statement_schema.compact_record).
+STATEMENT_KEYS = list(LABELS.values())
+TOTAL_KEYS = {"total income": "Total Income", "total expenses": "Total Expenses", "net income": "Net Income"}
+INCOME_KEYS = [LABELS[key] for key in keys_in_group("income")]
+EXPENSE_KEYS = [LABELS[key] for key in keys_in_group("expense")]
+
+# === PRECOMPILED PATTERNS === #
+AMOUNT_RE = re.compile(r"(?<!\S)\(?-?\$?\d[\d,]*\.\d{2}\)?(?!\S)")
+CODE_RE = re.compile(r"\b\d{4}\b")
+CHUNK_SPLIT_RE = re.compile(r"\s{2,}")
+OWNER_RE = re.compile(r"\bOwner:\s*(.+?)(?:\s{2,}|$)", re.MULTILINE)
+PERIOD_RE = re.compile(r"\bStatement period:?\s*(.+?)(?:\s{2,}|$)", re.IGNORECASE | re.MULTILINE)
+DATE_RE = re.compile(r"\bStatement date:?\s*(.+?)(?:\s{2,}|$)", re.IGNORECASE | re.MULTILINE)
+POSTAL_CODE_RE = re.compile(r"\b[A-Za-z]\d[A-Za-z][ -]?\d[A-Za-z]\d\b")
+NON_BILLABLE_RE = re.compile(r"non[\s-]*billable", re.IGNORECASE)
+
+
+# Expense lines are matched on their account codes (plus billable / non
+# billable, since 6727 and 6728 appear under both), so spacing and dash
+# differences in the printed label don't matter.
+def _expense_signature(label):
+    return frozenset(CODE_RE.findall(label)), bool(NON_BILLABLE_RE.search(label))
+
+
+EXPENSE_BY_SIGNATURE = {
+    _expense_signature(key): key for key in EXPENSE_KEYS if CODE_RE.search(key)
+}
+
+
+def _label_key(label, section):
+    lowered = label.lower()
+    for total_label, key in TOTAL_KEYS.items():
+        if total_label in lowered:
+            return key
+    if section == "income":
+        if "nsf" in lowered:
+            return "NSF Fee Income"
+        if "maintenance" in lowered:
+            return "Maintenance Income"
+        if "rent" in lowered:
+            return "Rent Income"
+        return None
+    if "nsf" in lowered:
+        return "NSF Fee (Expense)"
+    if "condo" in lowered or "strata" in lowered:
+        return "Condo Fees"
+    return EXPENSE_BY_SIGNATURE.get(_expense_signature(label))
+
+
+def _amount(text):
+    negative = text.startswith("(") or "-" in text
+    value = float(text.strip("()").replace("$", "").replace(",", "").replace("-", ""))
+    return -value if negative else value
+
+
+def _text_lines(data):
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(data))
+    lines = []
+    for page in reader.pages:
+        lines += page.extract_text(extraction_mode="layout").splitlines()
+    return [line.rstrip() for line in lines if line.strip()]
+
+
+# === PARSE ONE STATEMENT FROM ITS TEXT LAYER (runs in a worker process) === #
+# Reads the layout-preserving text of every page and maps the label/column grid
+# back to the prompt's keys: one column per property, addressed by the line of
+# headings above the income block, with each amount assigned to the column whose
+# right edge (taken from the "Total Income" row) it lines up with. The owner,
+# period, date and "Prepared by" block come from the footer.
+#
+# Returns (records, confidence, note). Confidence is the share of checks that
+# pass: every column has an address and reconciles (income lines add up to
+# Total Income, expense lines to Total Expenses, and Income - Expenses = Net),
+# the footer fields were found, and every amount landed on a known line and
+# column. A PDF without a text layer (a scan) scores 0.
+def parse_statement_pdf(data):
+    try:
+        lines = _text_lines(data)
+    except Exception as e:
+        return [], 0.0, f"unreadable PDF ({e.__class__.__name__}: {e})"
+    if not lines:
+        return [], 0.0, "no text layer"
+
+    rows = []
+    for number, line in enumerate(lines):
+        amounts = list(AMOUNT_RE.finditer(line))
+        label = line[:amounts[0].start()].strip() if amounts else line.strip()
+        rows.append((number, label, amounts))
+
+    total_rows = [(number, amounts) for number, label, amounts in rows if "total income" in label.lower() and amounts]
+    if len(total_rows) != 1:
+        return [], 0.0, f"expected one Total Income row, found {len(total_rows)}"
+    total_line, total_amounts = total_rows[0]
+    edges = [match.end() for match in total_amounts]
+
+    # Addresses: the last line above the first amount with one heading per
+    # column, each starting with a civic number.
+    addresses = None
+    for number, label, amounts in rows[:total_line]:
+        if amounts:
+            break
+        chunks = CHUNK_SPLIT_RE.split(lines[number].strip())
+        if len(chunks) == len(edges) and all(chunk[:1].isdigit() for chunk in chunks):
+            addresses = chunks
+
+    values = [{} for _ in edges]
+    section = "income"
+    misplaced = []
+    for number, label, amounts in rows:
+        if not amounts:
+            continue
+        key = _label_key(label, section)
+        if key == "Total Income":
+            section = "expenses"
+        if key is None:
+            misplaced.append(label or f"line {number + 1}")
+            continue
+        for match in amounts:
+            column = min(range(len(edges)), key=lambda i: abs(edges[i] - match.end()))
+            if abs(edges[column] - match.end()) > 3 or key in values[column]:
+                misplaced.append(f"{label} @ {match.end()}")
+                continue
+            values[column][key] = match.group()
+
+    text = "\n".join(lines)
+    owner = OWNER_RE.search(text)
+    period = PERIOD_RE.search(text)
+    date = DATE_RE.search(text)
+    footer = ""
+    for number, line in enumerate(lines):
+        chunks = CHUNK_SPLIT_RE.split(line.strip())
+        postal = [chunk for chunk in chunks if POSTAL_CODE_RE.search(chunk) and not AMOUNT_RE.search(chunk)]
+        if postal:
+            previous = CHUNK_SPLIT_RE.split(lines[number - 1].strip())[0] if number else ""
+            footer = ", ".join(part for part in (previous, postal[0]) if part)
+
+    records = []
+    checks = [owner is not None, period is not None, not misplaced]
+    for i, column_values in enumerate(values):
+        record = {key: "" for key in STATEMENT_KEYS}
+        record.update({
+            "Owner Name": owner.group(1).strip() if owner else "",
+            "Left Corner Address and Postal Code": footer,
+            "Statement Period": period.group(1).strip() if period else "",
+            "Statement Date": date.group(1).strip() if date else "",
+            "Address": addresses[i] if addresses else "",
+        })
+        record.update(column_values)
+        records.append(compact_record(record))
+
+        amounts = {key: _amount(value) for key, value in column_values.items()}
+        income = sum(amounts.get(key, 0.0) for key in INCOME_KEYS)
+        expenses = sum(amounts.get(key, 0.0) for key in EXPENSE_KEYS)
+        checks += [
+            bool(record["Address"]),
+            abs(income - amounts.get("Total Income", 0.0)) < 0.005,
+            "Total Expenses" in amounts and abs(expenses - amounts["Total Expenses"]) < 0.005,
+            "Net Income" in amounts
+            and abs(amounts.get("Total Income", 0.0) - amounts["Total Expenses"] - amounts["Net Income"]) < 0.005,
+        ]
+
+    confidence = sum(checks) / len(checks)
+    note = f"unmatched: {', '.join(misplaced[:5])}" if misplaced else ""
+    return records, confidence, note
+
+
+# === PROCESS POOL FOR THE PARSING ABOVE === #
+# Extraction worker threads download the PDF bytes and hand them to a shared
+# pool of processes, so the CPU-bound text parsing isn't serialized on the GIL.
+# Answers at or above `min_confidence` are used directly (and cached as
+# LOCAL_MODEL_NAME); everything else goes to the model as before.
+class LocalExtractor:
+    model_name = LOCAL_MODEL_NAME
+
+    def __init__(self, max_workers=None, min_confidence=MIN_CONFIDENCE):
+        try:
+            import pypdf  # noqa: F401
+        except ImportError as e:
+            raise ImportError("The local text-layer extractor needs pypdf: pip install pypdf") from e
+        self.min_confidence = min_confidence
+        self.pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+
+    def parse(self, data_list):
+        return list(self.pool.map(parse_statement_pdf, data_list))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# === TRY THE TEXT LAYER FIRST (runs in worker threads) === #
+# Returns one raw_text per blob, or None where the model is still needed.
+# Confident answers are cached like a model response (keyed by the same prompt,
+# so a prompt change re-extracts them too); low-confidence ones are not, and are
+# parsed again on the next run before falling back.
+def extract_local(blobs, prompt, local_extractor, extraction_cache, refresh=False, metrics=None):
+    results = {}
+    cache_keys = {}
+    misses = []
+    for blob in blobs:
+        uri = blob_uri(blob)
+        cache_keys[uri] = ExtractionCache.make_key(blob, prompt, local_extractor.model_name)
+        raw_text = None if refresh else extraction_cache.get(cache_keys[uri])
+        if raw_text is None:
+            misses.append(blob)
+        else:
+            results[uri] = raw_text
+            if metrics is not None:
+                metrics.count("local_extracted")
+                metrics.pdf(uri, extractor=local_extractor.model_name, cached=True)
+
+    if misses:
+        start = time.perf_counter()
+        parsed = local_extractor.parse([blob.download_as_bytes() for blob in misses])
+        seconds = time.perf_counter() - start
+        if metrics is not None:
+            metrics.add_time("local_parse", seconds, count=len(misses))
+        for blob, (records, confidence, note) in zip(misses, parsed):
+            uri = blob_uri(blob)
+            confident = bool(records) and confidence >= local_extractor.min_confidence
+            if confident:
+                results[uri] = json.dumps(records, ensure_ascii=False)
+                extraction_cache.put(cache_keys[uri], uri, local_extractor.model_name, prompt, results[uri])
+            else:
+                results[uri] = None
+                print(f"Text layer of {uri} not usable (confidence {confidence:.2f}{'; ' + note if note else ''}); "
+                      f"sending it to the model.")
+            if metrics is not None:
+                metrics.count("local_extracted" if confident else "local_fallback")
+                metrics.pdf(uri, local_confidence=round(confidence, 3), local_parse_seconds=seconds / len(misses),
+                            **({"extractor": local_extractor.model_name, "cached": False} if confident else {}))
+
+    return [results[blob_uri(blob)] for blob in blobs]